@@ -0,0 +1,163 @@
+"""
+    ControlChannel.py
+
+    Command ring in shared memory through which Dashboard workers push
+    subscribe / unsubscribe deltas to the running MDEngine, which applies
+    them on its live socket session without reconnecting.
+
+    MDEngine creates the ring and is its only consumer; any number of
+    producers append under an inter-process file lock. Each slot carries
+    one command for up to COMMAND_MAX_INSTRUMENTS instruments (larger
+    commands span several slots) and is published by writing its sequence
+    number last, then advancing the head.
+"""
+import os
+import struct
+
+import numpy as np
+
+from LocalStore import FileLock
+from TickStore import ARENA_HEADER, _open_segment, _replace_segment, handle_pool
+
+CONTROL_RING_NAME = "spread_engine_control"
+CONTROL_RING_MAGIC = b'SECR'
+CONTROL_RING_VERSION = 1
+CONTROL_RING_CAPACITY = 256       # Slots; producers get BufferError when all are pending
+COMMAND_MAX_INSTRUMENTS = 60
+
+_HEAD_OFFSET = 40                 # u64: commands ever written
+_TAIL_OFFSET = 48                 # u64: commands consumed by MDEngine
+_SLOTS_OFFSET = 64
+
+OP_SUBSCRIBE = 1
+OP_UNSUBSCRIBE = 2
+OP_TOUCH = 3                      # Spreads (by spread id) were just used on a Dashboard
+
+COMMAND_DTYPE = np.dtype([
+    ('seq', '<u8'),               # Position + 1 once the slot is complete
+    ('op', '<u4'),
+    ('count', '<u4'),
+    ('message_code', '<u4'),
+    ('reserved', '<u4'),
+    ('segments', '<i4', (COMMAND_MAX_INSTRUMENTS,)),
+    ('instrument_ids', '<i8', (COMMAND_MAX_INSTRUMENTS,)),
+])
+
+
+class CommandRing:
+    """Fixed-size ring of subscription commands in one shared-memory segment."""
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.buf = shm.buf
+        magic, version, slot_size, capacity, _, generation, _ = ARENA_HEADER.unpack_from(self.buf, 0)
+        if magic != CONTROL_RING_MAGIC or version != CONTROL_RING_VERSION or slot_size != COMMAND_DTYPE.itemsize:
+            raise ValueError(f"Shared memory '{shm.name}' is not a compatible command ring")
+        self.name = shm.name
+        self.capacity = capacity
+        self.generation = generation
+        self.slots = np.ndarray((capacity,), dtype=COMMAND_DTYPE, buffer=self.buf, offset=_SLOTS_OFFSET)
+        self.lock = FileLock(os.path.join('data', f"{self.name}.lock"))
+
+    @classmethod
+    def create(cls, name=CONTROL_RING_NAME, capacity=CONTROL_RING_CAPACITY):
+        """
+        Creates the ring (consumer only). Commands left over from a previous
+        MDEngine run are dropped: the new run reads the subscriptions fresh.
+        A ring that still exists is reinitialised in place under the producer
+        lock, so no producer is halfway through a command meanwhile.
+        """
+        size = _SLOTS_OFFSET + capacity * COMMAND_DTYPE.itemsize
+        with FileLock(os.path.join('data', f"{name}.lock")):
+            try:
+                shm = _open_segment(name, create=True, size=size)
+            except FileExistsError:
+                shm = _replace_segment(name, size)
+            ARENA_HEADER.pack_into(
+                shm.buf, 0,
+                CONTROL_RING_MAGIC, CONTROL_RING_VERSION, COMMAND_DTYPE.itemsize,
+                capacity, 0, int.from_bytes(os.urandom(8), 'little'), 0
+            )
+            struct.pack_into('<QQ', shm.buf, _HEAD_OFFSET, 0, 0)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name=CONTROL_RING_NAME):
+        """Attaches as a producer. Raises FileNotFoundError if MDEngine is not running."""
+        return cls(_open_segment(name))
+
+    def _head(self):
+        return struct.unpack_from('<Q', self.buf, _HEAD_OFFSET)[0]
+
+    def _tail(self):
+        return struct.unpack_from('<Q', self.buf, _TAIL_OFFSET)[0]
+
+    def send(self, op, instruments, message_code=1502):
+        """
+        Appends a command for `instruments` ([{"exchangeSegment", "exchangeInstrumentID"}]).
+        Raises BufferError if the consumer is too far behind to take it whole.
+        """
+        chunks = [instruments[i:i + COMMAND_MAX_INSTRUMENTS]
+                  for i in range(0, len(instruments), COMMAND_MAX_INSTRUMENTS)]
+        with self.lock:
+            head = self._head()
+            if head + len(chunks) - self._tail() > self.capacity:
+                raise BufferError(f"Command ring '{self.name}' is full")
+            slots = self.slots
+            for chunk in chunks:
+                i = head % self.capacity
+                slots['op'][i] = op
+                slots['count'][i] = len(chunk)
+                slots['message_code'][i] = message_code
+                slots['segments'][i, :len(chunk)] = [inst['exchangeSegment'] for inst in chunk]
+                slots['instrument_ids'][i, :len(chunk)] = [inst['exchangeInstrumentID'] for inst in chunk]
+                slots['seq'][i] = head + 1
+                head += 1
+                struct.pack_into('<Q', self.buf, _HEAD_OFFSET, head)
+
+    def poll(self):
+        """Returns the pending commands as (op, message_code, instruments) and consumes them (consumer only)."""
+        commands = []
+        tail, head = self._tail(), self._head()
+        slots = self.slots
+        while tail < head:
+            i = tail % self.capacity
+            if slots['seq'][i] != tail + 1:
+                break   # Not completely written yet
+            count = int(slots['count'][i])
+            instruments = [
+                {"exchangeSegment": segment, "exchangeInstrumentID": exchange_id}
+                for segment, exchange_id in zip(slots['segments'][i, :count].tolist(),
+                                                slots['instrument_ids'][i, :count].tolist())
+            ]
+            commands.append((int(slots['op'][i]), int(slots['message_code'][i]), instruments))
+            tail += 1
+        struct.pack_into('<Q', self.buf, _TAIL_OFFSET, tail)
+        return commands
+
+    def close(self):
+        self.slots = None
+        self.buf = None
+        self.shm.close()
+
+
+def send_command(op, instruments, message_code=1502, name=CONTROL_RING_NAME):
+    """
+    Pushes a subscribe / unsubscribe command to the running MDEngine.
+    Returns False if it is not running (or cannot take the command); the
+    change then takes effect when it next starts.
+
+    The ring stays attached between calls (see HandlePool) and is dropped
+    once its segment is gone. Where the segment outlives MDEngine (Windows,
+    while any handle is open) commands queue up unread until the ring is
+    full and False is returned.
+    """
+    ring = handle_pool.get(name, factory=CommandRing.attach, keep_stale=False)
+    if ring is None:
+        return False
+    try:
+        ring.send(op, instruments, message_code)
+        return True
+    except BufferError as e:
+        print(f"⚠️ {e}")
+        return False
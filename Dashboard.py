@@ -1,17 +1,25 @@
 import os
 import subprocess
+import configparser
 import signal
 import json
+import hashlib
 import threading
-from datetime import datetime
-from multiprocessing import shared_memory
-from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from OrderManager import OrderManager 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
+from flask_socketio import SocketIO, emit, join_room
 
 
-from Connect import XTSConnect
-from MarketDataSocketClient import MDSocket_io
+import SharedData
+from ControlChannel import OP_SUBSCRIBE, OP_TOUCH, OP_UNSUBSCRIBE, send_command
+from InstrumentSearch import SEARCH_LIMIT, InstrumentIndex
+from LocalStore import FileLock, Leader
+from SpreadEngine import SpreadEngine, get_spread_table
+from SpreadService import DeltaChannel, Snapshot, SpreadSnapshotService, make_etag
+from SubscriptionRegistry import SUBSCRIPTIONS_FILE, SubscriptionRegistry
+from TickStore import FEED_LIVE, QuoteBatch, feed_state, read_many, read_tick, sequence_version
 
 # ------------------------------------------------------------------------------
 # SpreadEntryManager import
@@ -22,62 +30,28 @@ from EntryManager import SpreadEntryManager
 # Flask app initialization
 # ------------------------------------------------------------------------------
 app = Flask(__name__)
+socketio = SocketIO(app, async_mode='threading')
 
 # ------------------------------------------------------------------------------
-# API Credentials & XTS Initialization (Adjust to your real credentials)
-# ------------------------------------------------------------------------------
-API_KEY = '0b84a5c57dcdf2b3a32261'
-API_SECRET = 'Djya854$gm'
-SOURCE = 'WebAPI'
-
-xt = XTSConnect(API_KEY, API_SECRET, SOURCE)
-login_response = xt.marketdata_login()  # Obtain token for MarketData
-marketDataToken = login_response['result']['token']
-muserID = login_response['result']['userID']
-
-# Initialize the MarketData socket (if you actually use socket connection)
-soc = MDSocket_io(marketDataToken, muserID)
-
-# ------------------------------------------------------------------------------
-# Load JSON Files
+# Data Files (loaded once per process through SharedData)
+# The XTS market-data session is not needed to serve the dashboard; it is
+# created on first use by SharedData.market_data_session().
 # ------------------------------------------------------------------------------
-# 1) Primary futures mapping
-with open('data/futures_mapping2.json', 'r') as f:
-    instruments_mapping = json.load(f)
-
-# 2) Spread mapping (same JSON, but used differently)
-with open('data/futures_mapping2.json', 'r') as file:
-    spd = json.load(file)
-
-# 3) Instrument names
-with open(r"data/contractnames.json", "r") as f:
-    instrumentname = json.load(f)
-
-# 4) Lot sizes
-with open(r'data/lotsize.json', 'r') as f:
-    lotsizejson = json.load(f)
-
-# 5) Exchange instruments (if needed)
-with open(r"data/exchange_instruments2.json", "r") as f:
-    Instruments = json.load(f)
+# Futures mapping: the subscribable instruments and the spread definitions
+instruments_mapping = spd = SharedData.futures_mapping()
+instrumentname = SharedData.contract_names()
+lotsizejson = SharedData.lot_sizes()
+EXPIRY_DATES = SharedData.EXPIRY_DATES
 
 # ------------------------------------------------------------------------------
-# Global Data Structures
+# Shared State (on disk, so every worker process sees the same data)
 # ------------------------------------------------------------------------------
-SUBSCRIPTIONS_FILE = 'data/subscriptions.json'
-subscriptions = []
-if os.path.exists(SUBSCRIPTIONS_FILE):
-    with open(SUBSCRIPTIONS_FILE, 'r') as sub_file:
-        subscriptions = json.load(sub_file)
+# Subscribed spreads, reference-counted per instrument (see SubscriptionRegistry.py)
+subscription_registry = SubscriptionRegistry(SUBSCRIPTIONS_FILE)
 
 # PID management
 PID_FILE = "data/fetching_pid.txt"
-
-# Example expiry dates
-EXPIRY_DATES = [
-    datetime.strptime("2025-02-28", "%Y-%m-%d"),
-    datetime.strptime("2025-03-27", "%Y-%m-%d")
-]
+fetching_lock = FileLock(f"{PID_FILE}.lock")
 
 # Lock for data manipulation
 datachanging_lock = threading.Lock()
@@ -108,13 +82,11 @@ def delete_pid():
 
 def read_from_shm(exchange_id):
     """
-    Reads market data from shared memory and returns JSON.
-    Returns None if shared memory is unavailable or data cannot be parsed.
+    Reads the binary tick record from the shared tick arena and returns it as
+    a dict. Returns None if the arena is unavailable or the record is empty.
     """
     try:
-        shm = shared_memory.SharedMemory(name=f"shm_{exchange_id}")
-        raw_data = bytes(shm.buf).rstrip(b"\x00").decode("utf-8")
-        return json.loads(raw_data)
+        return read_tick(exchange_id)
     except Exception:
         return None
 
@@ -122,143 +94,205 @@ def read_from_shm(exchange_id):
 # SpreadEntryManager instance
 # ------------------------------------------------------------------------------
 entry_manager = SpreadEntryManager(csv_file='spread_positions.csv')
+# Only one Dashboard process creates positions, however many are running
+entry_leader = Leader(f"{entry_manager.csv_file}.creator.lock")
 
 # ------------------------------------------------------------------------------
-# Process Single Spread Function (Updated to handle +/- LTP)
+# Spread Engine (vectorised over every spread in `spd`)
 # ------------------------------------------------------------------------------
-def process_single_spread(spdid, instrumentname):
-    """
-    Process a single SPID's spread data from shared memory,
-    determining buy_leg vs. sell_leg based on the sign of LTP.
-    """
-    result = {}
-
-    # 1) Read primary SPID data
-    spread_data = read_from_shm(spdid)
-    if not spread_data:
-        return {"error": f"SPID {spdid} not found in shared memory."}
-
-    # 2) Extract LTP
-    ltp = spread_data.get("Touchline", {}).get("LastTradedPrice")
-    if ltp is None or not isinstance(ltp, (int, float)):
-        return {"error": f"Invalid or missing LTP for SPID {spdid}"}
+dashboard_config = configparser.ConfigParser()
+dashboard_config.read('config.ini')
 
-    result['LTP'] = ltp
-    result['instrument_name'] = instrumentname.get(str(spdid), "Unknown Instrument")
+# Spreads whose legs last ticked longer ago than this are flagged stale and never entered
+MAX_QUOTE_AGE_MS = dashboard_config.getfloat('spreads', 'max_quote_age_ms', fallback=30000)
 
-    # 3) Check that spdid is in our spd mapping
-    if str(spdid) not in spd:
-        return {"error": f"No spread mapping for SPID {spdid} in spd."}
-
-    related_spids = spd[str(spdid)]
-    if len(related_spids) != 2:
-        return {"error": f"SPID {spdid} has {len(related_spids)} related spids. Expected 2."}
-
-    # 4) Based on the sign of LTP, decide which spid is buy_leg vs. sell_leg
-    if ltp > 0:
-        buy_leg = related_spids[0]
-      
-        sell_leg = related_spids[1]
-    else:
-        buy_leg = related_spids[1]
-        sell_leg = related_spids[0]
-
-    # 5) Read each leg's shared memory
-    buy_data = read_from_shm(buy_leg)
-
-    sell_data = read_from_shm(sell_leg)
-    if not buy_data or not sell_data:
-        return {
-            "error": "Missing data for one or both legs",
-            "buy_leg_data_found": bool(buy_data),
-            "sell_leg_data_found": bool(sell_data)
-        }
-
-    # 6) Extract best Ask for the buy_leg
-    buy_asks = buy_data.get("Asks", [])
-    if buy_asks:
-        buy_ask_price = buy_asks[0].get("Price", 0)
-    else:
-        buy_ask_price = 0
+spread_engine = SpreadEngine(spd, lotsizejson, max_age_ms=MAX_QUOTE_AGE_MS)
 
-    # 7) Extract best Bid for the sell_leg
-    sell_bids = sell_data.get("Bids", [])
-    if sell_bids:
-        sell_bid_price = sell_bids[0].get("Price", 0)
-    else:
-        sell_bid_price = 0
-
-    # 8) Compute an example "actual_spread"
-    actual_spread = abs(sell_bid_price - buy_ask_price)
-    lot_size = lotsizejson.get(str(spdid), 0) or 0
-    total_profit_estimate = actual_spread * lot_size
-    buy_instrument_name = instrumentname.get(str(buy_leg), "Unknown")
-    sell_instrument_name = instrumentname.get(str(sell_leg), "Unknown")
-
-    # 9) Populate result dict
-    result.update({
-        "buy_leg": buy_leg,
-        "sell_leg": sell_leg,
-        "buy_ask_price": buy_ask_price,
-        "sell_bid_price": sell_bid_price,
-        "buyInstrumentName":buy_instrument_name,
-        "sellInstrumentName":sell_instrument_name,
-        "spread": actual_spread,
-        "profit": total_profit_estimate,
-        "expiry_dates": [d.strftime("%Y-%m-%d") for d in EXPIRY_DATES],
-        "lotsize":lot_size
-    })
-
-    # 10) Example condition to create a new position
-    #     (You can adapt the logic as you wish; this is just a sample.)
-    if (abs(ltp) < actual_spread) and (ltp != 0):
-        buy_instrument_name = instrumentname.get(str(buy_leg), "Unknown")
-        sell_instrument_name = instrumentname.get(str(sell_leg), "Unknown")
+def build_spread_rows(res):
+    """
+    Turns a SpreadResult into the per-SPID dicts served to the templates,
+    keyed in `spd` order, with an "error" entry for spreads that cannot be shown.
+    Names, lot sizes and expiries are static and served by /metadata instead.
+    """
+    ltp = res.ltp.tolist()
+    buy_leg = res.buy_leg.tolist()
+    sell_leg = res.sell_leg.tolist()
+    buy_ask = res.buy_ask.tolist()
+    sell_bid = res.sell_bid.tolist()
+    spread = res.spread.tolist()
+    profit = res.profit.tolist()
+    spread_found = res.spread_found.tolist()
+    buy_found = res.buy_found.tolist()
+    sell_found = res.sell_found.tolist()
+    stale = res.stale.tolist()
+
+    rows = {}
+    for i, spid in enumerate(spread_engine.keys):
+        if not spread_found[i]:
+            rows[spid] = {"error": f"SPID {spid} not found in shared memory."}
+        elif not (buy_found[i] and sell_found[i]):
+            rows[spid] = {
+                "error": "Missing data for one or both legs",
+                "buy_leg_data_found": buy_found[i],
+                "sell_leg_data_found": sell_found[i]
+            }
+        else:
+            rows[spid] = {
+                "LTP": ltp[i],
+                "buy_leg": buy_leg[i],
+                "sell_leg": sell_leg[i],
+                "buy_ask_price": buy_ask[i],
+                "sell_bid_price": sell_bid[i],
+                "spread": spread[i],
+                "profit": profit[i],
+                "stale": stale[i]
+            }
+
+    # Keep the original mapping order, including spreads with a bad mapping
+    return {spid: rows.get(spid) or {"error": spread_engine.errors[spid]} for spid in spd}
+
+SPREAD_COLUMNS = ("LTP", "buy_leg", "sell_leg", "buy_ask_price", "sell_bid_price", "spread", "profit", "stale")
+
+def spread_columns(rows):
+    """
+    Columnar form of the spread rows served by /get-spread-data:
+    {"spid": [...], "LTP": [...], ...}, one list per field, index i of every
+    list describing the same spread. Rows with an error are left out.
+    """
+    shown = [(spid, row) for spid, row in rows.items() if "error" not in row]
+    columns = {"spid": [spid for spid, _ in shown]}
+    for field in SPREAD_COLUMNS:
+        columns[field] = [row[field] for _, row in shown]
+    return columns
 
+def build_metadata():
+    """
+    Static per-instrument data the templates join client-side: names of every
+    spread and leg, lot sizes per spread and the expiry dates.
+    """
+    ids = set(spd)
+    for legs in spd.values():
+        if isinstance(legs, list):
+            ids.update(str(leg) for leg in legs)
+    return {
+        "names": {i: instrumentname[i] for i in sorted(ids) if i in instrumentname},
+        "lotsize": dict(zip(spread_engine.keys, spread_engine.lot_size.tolist())),
+        "expiry_dates": [d.strftime("%Y-%m-%d") for d in EXPIRY_DATES]
+    }
+
+def create_entries(res):
+    """Create a position for every spread whose entry condition is met."""
+    for i in np.flatnonzero(res.entry).tolist():
+        buy_leg = int(res.buy_leg[i])
+        sell_leg = int(res.sell_leg[i])
+        lot_size = int(spread_engine.lot_size[i])
         entry_manager.create_position(
-            spread_id=spdid,
+            spread_id=int(spread_engine.spread_ids[i]),
             buy_ticker_id=buy_leg,
-            buy_ticker_name=buy_instrument_name,
+            buy_ticker_name=instrumentname.get(str(buy_leg), "Unknown"),
             buy_quantity=lot_size,
-            buy_entry_price=buy_ask_price,
+            buy_entry_price=float(res.buy_ask[i]),
             sell_ticker_id=sell_leg,
-            sell_ticker_name=sell_instrument_name,
+            sell_ticker_name=instrumentname.get(str(sell_leg), "Unknown"),
             sell_quantity=lot_size,
-            sell_entry_price=sell_bid_price
+            sell_entry_price=float(res.sell_bid[i])
         )
 
-    return result
+def current_spreads():
+    """
+    Latest SpreadResult for every spread: the table MDEngine publishes as
+    legs tick, or a local vectorised evaluation if it is not publishing.
+    """
+    table = get_spread_table()
+    if table is not None and table.matches(spread_engine):
+        table.read(spread_engine.result)
+        # Rows are only republished when they tick: age them as of now
+        return spread_engine.check_staleness()
+    return spread_engine.evaluate()
+
+def spread_source_version():
+    """
+    Cheap token identifying the current spread data: the published table's
+    generation and publish counter, or when evaluating locally the sum of
+    the legs' tick sequence numbers, followed by the number of stale rows
+    (which changes without any tick, e.g. during a feed outage). None if
+    there is no shared memory yet.
+    """
+    table = get_spread_table()
+    if table is not None and table.matches(spread_engine):
+        token = (table.generation, table.version)
+    else:
+        token = sequence_version(spread_engine.quotes)
+    if token is None:
+        return None
+    return token + (spread_engine.stale_count(),)
+
+def feed_live():
+    """True while MDEngine reports its feed live; prices may be stale otherwise."""
+    state = feed_state()
+    return state is not None and state[0] == FEED_LIVE
 
 # ------------------------------------------------------------------------------
 # Process All Spreads Function
 # ------------------------------------------------------------------------------
 def process_spread_data():
     """
-    Process all spreads listed in `spd` and save results to JSON.
-    """
-    result = {}
-    with ThreadPoolExecutor() as executor:
-        futures_map = {
-            executor.submit(process_single_spread, int(spid), instrumentname): spid
-            for spid in spd
-            
-        }
-        for future in futures_map:
-            spid = futures_map[future]
-            try:
-                result_data = future.result()
-                if result_data:
-                    result[spid] = result_data
-                else:
-                    result[spid] = {'error': f"SPID {spid} returned no data"}
-            except Exception as e:
-                result[spid] = {'error': str(e)}
-
-    # Save processed data
-    with open('processed_spread_data.json', 'w') as file:
-        json.dump(result, file, indent=4)
+    Take the latest computed spreads for everything in `spd`,
+    create any new positions and return the per-SPID rows.
+    No positions are entered on prices left over from a feed outage, and
+    only the process leading entry creation enters any.
+    """
+    res = current_spreads()
+    if feed_live() and entry_leader.is_leader():
+        create_entries(res)
+    return build_spread_rows(res)
 
-    return {'message': 'Data processed and saved successfully'}
+# ------------------------------------------------------------------------------
+# In-memory spread snapshot (refreshed in the background)
+# ------------------------------------------------------------------------------
+SNAPSHOT_FILE = 'processed_spread_data.json'
+
+spread_service = SpreadSnapshotService(
+    build=process_spread_data,
+    version=spread_source_version,
+    interval=dashboard_config.getfloat('dashboard', 'refresh_interval_ms', fallback=50) / 1000,
+    snapshot_path=SNAPSHOT_FILE if dashboard_config.getboolean('dashboard', 'persist_snapshot', fallback=True) else None,
+    snapshot_interval=dashboard_config.getfloat('dashboard', 'snapshot_interval_s', fallback=5),
+    encode=spread_columns,
+    fresh_for=dashboard_config.getfloat('dashboard', 'refresh_freshness_ms', fallback=20) / 1000
+)
+
+def conditional_json(etag, body, gzipped=None, cache_control='no-cache'):
+    """
+    JSON response with an ETag. If the client already holds `etag`
+    (If-None-Match) answer 304 without calling `body`, so nothing is
+    recomputed or serialized. `gzipped` optionally returns the compressed
+    body (or None when not worth it) for clients accepting gzip.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        compressed = gzipped() if gzipped is not None and 'gzip' in request.accept_encodings else None
+        if compressed:
+            response = Response(compressed, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(body(), mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+metadata_snapshot = None
+
+def get_metadata_snapshot():
+    """The /metadata payload, built once per process."""
+    global metadata_snapshot
+    if metadata_snapshot is None:
+        metadata = build_metadata()
+        digest = hashlib.sha1(json.dumps(metadata, sort_keys=True).encode()).hexdigest()[:16]
+        metadata_snapshot = Snapshot(metadata, digest)
+    return metadata_snapshot
 
 # ------------------------------------------------------------------------------
 # Flask Routes
@@ -271,81 +305,110 @@ def index():
 @app.route('/mdlist', methods=['POST'])
 def mdlist():
     """Show currently subscribed instruments."""
-    current_subs = []
-    if os.path.exists(SUBSCRIPTIONS_FILE):
-        with open(SUBSCRIPTIONS_FILE) as sub_file:
-            current_subs = json.load(sub_file)
-
-    # Filter only those in instruments_mapping
     current_subs = [
-        sub for sub in current_subs
-        if str(sub['exchangeInstrumentID']) in instruments_mapping
+        {"exchangeSegment": 2, "exchangeInstrumentID": int(key)}
+        for key in sorted(subscription_registry.subscribed_spreads(), key=int)
     ]
 
-    # Sort the keys based on their display name (the value in instruments_mapping)
-    sorted_keys = sorted(instruments_mapping.keys(), key=lambda k: instruments_mapping[k])
-
+    # The instrument picker queries /instruments/search instead of embedding every key
     return render_template(
         'index.html',
-        # Pass the sorted list of keys instead of the raw dictionary keys
-        keys=sorted_keys,
         subscriptions=current_subs,
         # 'values' is your dictionary (instrumentname) used for display
         values=instrumentname
     )
 
+# ------------------------------------------------------------------------------
+# Instrument Search (typeahead for the subscription page)
+# ------------------------------------------------------------------------------
+search_lock = threading.Lock()
+search_indexes = {}
+
+def get_search_index(scope):
+    """
+    The search index for `scope`, built on first use: 'subscribable' covers
+    the keys of instruments_mapping, 'all' every contract name.
+    """
+    with search_lock:
+        if scope not in search_indexes:
+            if scope == 'all':
+                names = instrumentname
+            else:
+                names = {key: instrumentname.get(key, key) for key in instruments_mapping}
+            search_indexes[scope] = InstrumentIndex(names)
+        return search_indexes[scope]
+
+@app.route('/instruments/search', methods=['GET'])
+def search_instruments():
+    """
+    Typeahead search: ?q=<text>&offset=0&limit=20&scope=subscribable|all.
+    Names starting with q come first, then names containing it.
+    """
+    scope = request.args.get('scope', 'subscribable')
+    if scope not in ('subscribable', 'all'):
+        return jsonify({"error": "Invalid scope"}), 400
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    return jsonify(get_search_index(scope).search(request.args.get('q', ''), offset, limit))
+
+def requested_spreads(payload, instruments_mapping):
+    """Spread keys named by a subscribe / unsubscribe request: "key", "keys" or "underlying"."""
+    if payload.get("underlying"):
+        return subscription_registry.spreads_for_underlying(payload["underlying"])
+    keys = payload.get("keys") or [payload.get("key")]
+    return [str(key) for key in keys if key and str(key) in instruments_mapping]
+
 @app.route('/subscribe', methods=['POST'])
 def subscribe():
     """
-    Subscribe to a particular key in instruments_mapping.
-    Expects JSON: {"key": <some_instrument_key>}
+    Subscribe to spreads in instruments_mapping, along with their legs.
+    Expects JSON: {"key": <spread key>}, {"keys": [...]} or
+    {"underlying": "NIFTY"} for every calendar spread of an underlying.
     """
-    global subscriptions
-    selected_key = request.json.get("key")
-    if not selected_key or selected_key not in instruments_mapping:
+    keys = requested_spreads(request.json or {}, instruments_mapping)
+    if not keys:
         return jsonify({"error": "Invalid key"}), 400
 
-    # Build subscription list
-    subscription_list = [{
-        "exchangeSegment": 2,
-        "exchangeInstrumentID": int(selected_key)
-    }]
-    # Also add mapped instruments
-    for inst_id in instruments_mapping[selected_key]:
-        subscription_list.append({
-            "exchangeSegment": 2,
-            "exchangeInstrumentID": inst_id
-        })
-
-    # Update subscriptions in memory
-    subscriptions.extend(subscription_list)
+    # Only instruments no subscribed spread needed yet go to the socket
+    added = subscription_registry.subscribe(keys)
+    live = send_command(OP_SUBSCRIBE, added)
 
-    # Persist to file
-    with open(SUBSCRIPTIONS_FILE, 'w') as sub_file:
-        json.dump(subscriptions, sub_file, indent=4)
-
-    return jsonify({"message": "Subscription successful"})
+    return jsonify({"message": "Subscription successful", "spreads": len(keys),
+                    "instruments": len(added), "live": live})
 
 @app.route('/unsubscribe', methods=['POST'])
 def unsubscribe():
-    """Unsubscribe a particular instrument ID + its mapped IDs."""
-    global subscriptions
-    exchange_id = request.json.get("exchangeInstrumentID")
-    if not exchange_id or exchange_id not in instruments_mapping:
+    """
+    Unsubscribe spreads: {"exchangeInstrumentID": <spread key>}, {"keys": [...]}
+    or {"underlying": ...}. Legs still used by another spread stay subscribed.
+    """
+    payload = request.json or {}
+    if "exchangeInstrumentID" in payload:
+        payload = {"key": payload["exchangeInstrumentID"]}
+    keys = requested_spreads(payload, instruments_mapping)
+    if not keys:
         return jsonify({"error": "Invalid instrument ID"}), 400
 
-    # Get all related instrument IDs
-    instrument_list = [int(exchange_id)] + instruments_mapping.get(exchange_id, [])
-    # Filter them out
-    subscriptions = [
-        sub for sub in subscriptions
-        if sub["exchangeInstrumentID"] not in instrument_list
-    ]
+    removed = subscription_registry.unsubscribe(keys)
+    live = send_command(OP_UNSUBSCRIBE, removed)
+
+    return jsonify({"message": "Unsubscribed successfully", "spreads": len(keys),
+                    "instruments": len(removed), "live": live})
 
-    with open(SUBSCRIPTIONS_FILE, 'w') as sub_file:
-        json.dump(subscriptions, sub_file, indent=4)
+def touch_spreads(keys):
+    """Tells MDEngine the spreads were just used, so the quota evicts them last."""
+    return send_command(OP_TOUCH, [
+        {"exchangeSegment": 2, "exchangeInstrumentID": int(key)} for key in keys
+    ])
 
-    return jsonify({"message": "Unsubscribed successfully"})
+@app.route('/spreads/viewed', methods=['POST'])
+def spreads_viewed():
+    """The dashboard reports the spreads a user narrowed the table down to: {"keys": [...]}."""
+    keys = requested_spreads({"keys": (request.json or {}).get("keys")}, instruments_mapping)
+    return jsonify({"live": touch_spreads(keys) if keys else False})
 
 # ------------------------------------------------------------------------------
 # Market Data Fetching Process Management
@@ -356,39 +419,41 @@ TERMINAL_NAME = "MarketDataTerminal"
 @app.route('/start_fetching', methods=['POST'])
 def start_fetching():
     """Start market data fetching in a new terminal/process."""
-    if get_pid() is not None:
-        return jsonify({"message": "Market data fetching is already running!"})
-
-    if os.name == 'nt':  # Windows
-        # Start Command Prompt with a specific title and run the script
-        process = subprocess.Popen(
-            ['start', 'cmd', '/k', f'title {TERMINAL_NAME} && python {SCRIPT_PATH}'],
-            shell=True
-        )
-    else:
-        # macOS/Linux (example using gnome-terminal; adjust for your environment)
-        process = subprocess.Popen(
-            ['gnome-terminal', '--title=' + TERMINAL_NAME, '--', 'python3', SCRIPT_PATH],
-            preexec_fn=os.setsid
-        )
-
-    save_pid(process.pid)
-    return jsonify({"message": "Started fetching market data!", "pid": process.pid})
+    with fetching_lock:
+        if get_pid() is not None:
+            return jsonify({"message": "Market data fetching is already running!"})
+
+        if os.name == 'nt':  # Windows
+            # Start Command Prompt with a specific title and run the script
+            process = subprocess.Popen(
+                ['start', 'cmd', '/k', f'title {TERMINAL_NAME} && python {SCRIPT_PATH}'],
+                shell=True
+            )
+        else:
+            # macOS/Linux (example using gnome-terminal; adjust for your environment)
+            process = subprocess.Popen(
+                ['gnome-terminal', '--title=' + TERMINAL_NAME, '--', 'python3', SCRIPT_PATH],
+                preexec_fn=os.setsid
+            )
+
+        save_pid(process.pid)
+        return jsonify({"message": "Started fetching market data!", "pid": process.pid})
 
 @app.route('/stop_fetching', methods=['POST'])
 def stop_fetching():
     """Stop market data fetching by killing the associated terminal."""
-    pid = get_pid()
-    if pid is None:
-        return jsonify({"message": "Market data fetching is not running!"})
+    with fetching_lock:
+        pid = get_pid()
+        if pid is None:
+            return jsonify({"message": "Market data fetching is not running!"})
 
-    if os.name == 'nt':  # Windows
-        subprocess.call(['taskkill', '/F', '/FI', f'WINDOWTITLE eq {TERMINAL_NAME}*'], shell=True)
-    else:
-        subprocess.call(["pkill", "-f", f"gnome-terminal.*{TERMINAL_NAME}"])
+        if os.name == 'nt':  # Windows
+            subprocess.call(['taskkill', '/F', '/FI', f'WINDOWTITLE eq {TERMINAL_NAME}*'], shell=True)
+        else:
+            subprocess.call(["pkill", "-f", f"gnome-terminal.*{TERMINAL_NAME}"])
 
-    delete_pid()
-    return jsonify({"message": "Stopped fetching market data!"})
+        delete_pid()
+        return jsonify({"message": "Stopped fetching market data!"})
 
 # ------------------------------------------------------------------------------
 # Spread Data Processing Routes
@@ -396,88 +461,160 @@ def stop_fetching():
 @app.route('/process-spread-data', methods=['GET'])
 def process_and_store_spread_data():
     """
-    Route to process the spread data for each SPID, then store results in JSON.
+    Route to refresh the in-memory spread data now. The background worker
+    keeps it current anyway; concurrent calls, and calls within the
+    freshness window of the last refresh, share one computation.
     """
-    response = process_spread_data()
-    return jsonify(response)
+    spread_service.start()
+    spread_service.refresh()
+    return jsonify({'message': 'Data processed successfully'})
 
 @app.route('/get-spread-data', methods=['GET'])
 def get_spread_data():
     """
-    Retrieve processed spread data from file.
+    Serve the latest processed spread data from memory in columnar form
+    (see spread_columns), or 304 if the client's ETag is still current.
+    Names, lot sizes and expiries come from /metadata.
     """
-    try:
-        with open('processed_spread_data.json', 'r') as file:
-            data = json.load(file)
-        return jsonify(data)
-    except FileNotFoundError:
-        return jsonify({'error': 'Data file not found. Please process the data first.'})
+    spread_service.start()
+    snapshot = spread_service.snapshot()
+    if snapshot is None:
+        spread_service.refresh()
+        snapshot = spread_service.snapshot()
+    return conditional_json(snapshot.etag, snapshot.body, snapshot.gzipped)
+
+@app.route('/feed-status', methods=['GET'])
+def get_feed_status():
+    """Whether MDEngine's market data feed is live: {"live": bool}."""
+    return jsonify({"live": feed_live()})
+
+@app.route('/metadata', methods=['GET'])
+def get_metadata():
+    """
+    Serve instrument names, lot sizes and expiry dates. They only change on
+    restart, so browsers may cache them for the session.
+    """
+    snapshot = get_metadata_snapshot()
+    return conditional_json(snapshot.etag, snapshot.body, snapshot.gzipped,
+                            cache_control='private, max-age=3600')
 
 # ------------------------------------------------------------------------------
 # Live Positions (from CSV + shared memory) Routes
 # ------------------------------------------------------------------------------
-@app.route('/positions/live', methods=['GET'])
-def get_live_positions():
+positions_lock = threading.RLock()
+positions_state = {'key': None, 'positions': [], 'quotes': QuoteBatch([], columns=('ltp',))}
+positions_body = {'etag': None, 'body': None}
+
+def open_positions():
+    """
+    Open positions from the CSV and a QuoteBatch of their legs (buy legs,
+    then sell legs). The CSV is only re-read when its mtime or size changes;
+    positions whose ticker ids are missing or not numbers are skipped.
+    """
+    try:
+        st = os.stat(entry_manager.csv_file)
+        key = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        key = (0, 0)
+    with positions_lock:
+        if key != positions_state['key']:
+            positions, buy_ids, sell_ids = [], [], []
+            for pos in entry_manager._load_positions():
+                try:
+                    legs = int(pos['buy_ticker_id']), int(pos['sell_ticker_id'])
+                except (TypeError, ValueError):
+                    # One bad row must not take down the whole positions push
+                    print(f"⚠️ Skipping position {pos.get('spread_id')}: bad ticker ids "
+                          f"{pos.get('buy_ticker_id')!r} / {pos.get('sell_ticker_id')!r}")
+                    continue
+                positions.append(pos)
+                buy_ids.append(legs[0])
+                sell_ids.append(legs[1])
+            ids = buy_ids + sell_ids
+            positions_state.update(key=key, positions=positions, quotes=QuoteBatch(ids, columns=('ltp',)))
+        return positions_state
+
+def positions_etag():
+    """
+    ETag of the live positions: the CSV's mtime and size plus the
+    arena's generation and clear counter and the sequence sum of every leg
+    in shared memory.
+    """
+    state = open_positions()
+    token = sequence_version(state['quotes']) or (0, 0, 0)
+    return make_etag(state['key'] + token)
+
+def compute_live_positions():
     """
     Reads all open positions from the CSV (spread_positions.csv),
-    fetches live prices from shared memory, computes current P/L,
-    and returns as JSON.
+    fetches live prices from shared memory and computes current P/L.
     """
-    positions = entry_manager._load_positions()
+    with positions_lock:
+        state = open_positions()
+        positions = state['positions']
+        live_positions = []
+        if not positions:
+            return live_positions
+        # Gather every leg's quote in one pass over shared memory
+        quotes = read_many(None, out=state['quotes'])
+        return live_position_rows(positions, quotes)
+
+def live_position_rows(positions, quotes):
+    """Live P/L rows for `positions` given their legs' quotes."""
     live_positions = []
 
-    for pos in positions:
-        spread_id = pos['spread_id']
-        buy_ticker_id = pos['buy_ticker_id']
-        sell_ticker_id = pos['sell_ticker_id']
-        buy_ticker_name = pos["buy_ticker_name"]
-        sell_ticker_name = pos["sell_ticker_name"]
-
-        buy_entry_price = float(pos['buy_entry_price']) if pos['buy_entry_price'] else 0.0
-        sell_entry_price = float(pos['sell_entry_price']) if pos['sell_entry_price'] else 0.0
-        buy_qty = float(pos['buy_quantity']) if pos['buy_quantity'] else 0.0
-        sell_qty = float(pos['sell_quantity']) if pos['sell_quantity'] else 0.0
-
-        # Get the current price from shared memory
-        buy_data = read_from_shm(buy_ticker_id)
-        sell_data = read_from_shm(sell_ticker_id)
-
-        buy_ltp = None
-        sell_ltp = None
-        if buy_data and "Touchline" in buy_data:
-            buy_ltp = buy_data["Touchline"].get("LastTradedPrice")
-        if sell_data and "Touchline" in sell_data:
-            sell_ltp = sell_data["Touchline"].get("LastTradedPrice")
-
-        if buy_ltp is None or sell_ltp is None:
-            # If no LTP found, skip or treat as 0
-            continue
-
-        # Calculate live PnL:
-        #   Buy PnL = (current buy price - buy_entry_price) * buy_qty
-        #   Sell PnL = (sell_entry_price - current sell price) * sell_qty
-        buy_pnl = (buy_ltp - buy_entry_price) * buy_qty
-        sell_pnl = (sell_entry_price - sell_ltp) * sell_qty
-        total_pnl = buy_pnl + sell_pnl
+    def as_float(pos, key):
+        return float(pos[key]) if pos[key] else 0.0
 
+    n = len(positions)
+    buy_ltp, sell_ltp = quotes.ltp[:n], quotes.ltp[n:]
+    have_ltp = quotes.valid[:n] & quotes.valid[n:]
+
+    buy_entry_price = np.array([as_float(pos, 'buy_entry_price') for pos in positions])
+    sell_entry_price = np.array([as_float(pos, 'sell_entry_price') for pos in positions])
+    buy_qty = np.array([as_float(pos, 'buy_quantity') for pos in positions])
+    sell_qty = np.array([as_float(pos, 'sell_quantity') for pos in positions])
+
+    # Calculate live PnL:
+    #   Buy PnL = (current buy price - buy_entry_price) * buy_qty
+    #   Sell PnL = (sell_entry_price - current sell price) * sell_qty
+    buy_pnl = np.round((buy_ltp - buy_entry_price) * buy_qty, 2)
+    sell_pnl = np.round((sell_entry_price - sell_ltp) * sell_qty, 2)
+    total_pnl = np.round(buy_pnl + sell_pnl, 2)
+
+    # If no LTP found for either leg, skip the position
+    for i in np.flatnonzero(have_ltp).tolist():
+        pos = positions[i]
         live_positions.append({
-            "spread_id": spread_id,
-            "buy_ticker_id": buy_ticker_id,
-            "sell_ticker_id": sell_ticker_id,
-            "buy_ticker_name": buy_ticker_name,
-            "sell_ticker_name": sell_ticker_name,
-            "buy_ltp": buy_ltp,
-            "sell_ltp": sell_ltp,
-            "buy_entry_price": buy_entry_price,
-            "sell_entry_price": sell_entry_price,
-            "buy_quantity": buy_qty,
-            "sell_quantity": sell_qty,
-            "live_buy_pnl": round(buy_pnl, 2),
-            "live_sell_pnl": round(sell_pnl, 2),
-            "live_total_pnl": round(total_pnl, 2)
+            "spread_id": pos['spread_id'],
+            "buy_ticker_id": pos['buy_ticker_id'],
+            "sell_ticker_id": pos['sell_ticker_id'],
+            "buy_ticker_name": pos["buy_ticker_name"],
+            "sell_ticker_name": pos["sell_ticker_name"],
+            "buy_ltp": float(buy_ltp[i]),
+            "sell_ltp": float(sell_ltp[i]),
+            "buy_entry_price": float(buy_entry_price[i]),
+            "sell_entry_price": float(sell_entry_price[i]),
+            "buy_quantity": float(buy_qty[i]),
+            "sell_quantity": float(sell_qty[i]),
+            "live_buy_pnl": float(buy_pnl[i]),
+            "live_sell_pnl": float(sell_pnl[i]),
+            "live_total_pnl": float(total_pnl[i])
         })
 
-    return jsonify(live_positions)
+    return live_positions
+
+@app.route('/positions/live', methods=['GET'])
+def get_live_positions():
+    """
+    Returns the open positions with live P/L as JSON, or 304 if nothing
+    they depend on has changed since the client's ETag.
+    """
+    with positions_lock:
+        etag = positions_etag()
+        if positions_body['etag'] != etag and not request.if_none_match.contains(etag):
+            positions_body.update(etag=etag, body=json.dumps(compute_live_positions()).encode())
+        return conditional_json(etag, lambda: positions_body['body'])
 
 @app.route('/positions', methods=['GET'])
 def live_positions_view():
@@ -512,6 +649,8 @@ def place_order():
 
     buy_ticker_id = data.get("buy_ticker_id")
     sell_ticker_id = data.get("sell_ticker_id")
+    if str(data.get("spread_id")) in instruments_mapping:
+        touch_spreads([data["spread_id"]])
     buy_quantity = data.get("buy_quantity")
     sell_quantity = data.get("sell_quantity")
     buy_price = data.get("buy_price")
@@ -581,8 +720,85 @@ def place_order():
 
 
 
+# ------------------------------------------------------------------------------
+# Push channel (Socket.IO): spreads and live P&L as a snapshot on connect,
+# then versioned deltas carrying only the fields that changed
+# ------------------------------------------------------------------------------
+PUSH_INTERVAL = dashboard_config.getfloat('dashboard', 'push_interval_ms', fallback=50) / 1000
+
+PUSH_CHANNELS = ('spreads', 'positions')   # Socket.IO rooms a page can join
+
+push_task_lock = threading.Lock()
+push_task_started = False
+channel_clients = {channel: 0 for channel in PUSH_CHANNELS}
+
+channels = {channel: DeltaChannel() for channel in PUSH_CHANNELS}
+
+def positions_by_id(positions):
+    """Key live positions by spread_id for the positions delta channel."""
+    return {str(pos['spread_id']): pos for pos in positions}
+
+def push_updates():
+    """
+    Background task: diff spreads / positions against what clients have and
+    emit only the changed fields to each room.
+    """
+    while True:
+        try:
+            spreads = spread_service.latest()
+            if channel_clients['spreads'] and spreads is not None:
+                delta = channels['spreads'].update(spreads)
+                if delta:
+                    socketio.emit('spreads_delta', delta, to='spreads')
+
+            if channel_clients['positions']:
+                delta = channels['positions'].update(positions_by_id(compute_live_positions()))
+                if delta:
+                    socketio.emit('positions_delta', delta, to='positions')
+        except Exception as e:
+            print(f"Push task error: {e}")
+        socketio.sleep(PUSH_INTERVAL)
+
+def start_push_task():
+    """Starts the push task once, on the first client connection."""
+    global push_task_started
+    with push_task_lock:
+        if not push_task_started:
+            push_task_started = True
+            socketio.start_background_task(push_updates)
+
+@socketio.on('connect')
+def on_client_connect():
+    """Join the page's channel (?channel=spreads|positions) and send it a full snapshot."""
+    channel = request.args.get('channel')
+    if channel not in PUSH_CHANNELS:
+        return False
+    join_room(channel)
+    with push_task_lock:
+        channel_clients[channel] += 1
+
+    spread_service.start()
+    start_push_task()
+    emit(f'{channel}_snapshot', channels[channel].snapshot())
+
+@socketio.on('resync')
+def on_client_resync():
+    """A client missed a delta: send it the full snapshot again."""
+    channel = request.args.get('channel')
+    if channel in PUSH_CHANNELS:
+        emit(f'{channel}_snapshot', channels[channel].snapshot())
+
+@socketio.on('disconnect')
+def on_client_disconnect(*args):
+    channel = request.args.get('channel')
+    if channel in PUSH_CHANNELS:
+        with push_task_lock:
+            channel_clients[channel] -= 1
+
 # ------------------------------------------------------------------------------
 # Run the Flask app
 # ------------------------------------------------------------------------------
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    # Development server (single process). For production use several
+    # workers behind gunicorn: gunicorn -c gunicorn.conf.py Dashboard:app
+    socketio.run(app, debug=dashboard_config.getboolean('dashboard', 'debug', fallback=False), port=5001)
@@ -1,17 +1,20 @@
+import configparser
 import os
 import subprocess
 import signal
 import json
 import threading
 from datetime import datetime
-from multiprocessing import shared_memory
 from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, jsonify, render_template, request
+from flask import Blueprint, Flask, jsonify, render_template, request
 
-# ========== XTS / MarketData Imports (Adjust these according to your project) ==========
-from Connect import XTSConnect
-from MarketDataSocketClient import MDSocket_io
+import SharedData
+from ControlChannel import OP_SUBSCRIBE, OP_UNSUBSCRIBE, send_command
+from InstrumentSearch import SEARCH_LIMIT, InstrumentIndex
+from LocalStore import FileLock
+from SubscriptionRegistry import SUBSCRIPTIONS_FILE, SubscriptionRegistry
+from TickStore import read_tick, tick_age_ns
 
 # =========================================
 #           SpreadEntryManager
@@ -23,16 +26,12 @@ from datetime import datetime
 class SpreadEntryManager:
     def __init__(self, csv_file='spread_positions.csv'):
         self.csv_file = csv_file
+        # Every Dashboard worker writes the same CSV; changes happen under this lock
+        self.lock = FileLock(f"{csv_file}.lock")
         # Ensure CSV has a header if not present
-        if not os.path.exists(self.csv_file):
-            with open(self.csv_file, 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    'spread_id',
-                    'entry_time',
-                    'buy_ticker_id', 'buy_ticker_name', 'buy_quantity', 'buy_entry_price', 'buy_exit_price',
-                    'sell_ticker_id', 'sell_ticker_name', 'sell_quantity', 'sell_entry_price', 'sell_exit_price'
-                ])
+        with self.lock:
+            if not os.path.exists(self.csv_file):
+                self._save_positions([])
 
     def _load_positions(self):
         """Load existing positions into a list of dicts."""
@@ -45,8 +44,9 @@ class SpreadEntryManager:
         return positions
 
     def _save_positions(self, positions):
-        """Save the list of dicts back to the CSV file."""
-        with open(self.csv_file, 'w', newline='') as file:
+        """Save the list of dicts back to the CSV file (atomically, so readers never see half of it)."""
+        tmp_file = f"{self.csv_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', newline='') as file:
             fieldnames = [
                 'spread_id',
                 'entry_time',
@@ -56,6 +56,18 @@ class SpreadEntryManager:
             writer = csv.DictWriter(file, fieldnames=fieldnames)
             writer.writeheader()
             writer.writerows(positions)
+        os.replace(tmp_file, self.csv_file)
+
+    def position_instrument_ids(self):
+        """Every instrument an open position depends on: its spread id and both legs."""
+        ids = set()
+        for row in self._load_positions():
+            if row.get('buy_exit_price') and row.get('sell_exit_price'):
+                continue    # Closed
+            for key in ('spread_id', 'buy_ticker_id', 'sell_ticker_id'):
+                if row.get(key):
+                    ids.add(int(row[key]))
+        return ids
 
     def position_exists(self, spread_id):
         positions = self._load_positions()
@@ -71,26 +83,27 @@ class SpreadEntryManager:
             print(f"Position for spread_id {spread_id} already exists. Skipping.")
             return
 
-        positions = self._load_positions()
-        new_entry = {
-            'spread_id': str(spread_id),
-            'entry_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # Store entry timestamp
-            'buy_ticker_id': str(buy_ticker_id),
-            'buy_ticker_name': buy_ticker_name,
-            'buy_quantity': str(buy_quantity),
-            'buy_entry_price': str(buy_entry_price),
-            'buy_exit_price': "",
-            'sell_ticker_id': str(sell_ticker_id),
-            'sell_ticker_name': sell_ticker_name,
-            'sell_quantity': str(sell_quantity),
-            'sell_entry_price': str(sell_entry_price),
-            'sell_exit_price': ""
-        }
-        positions.append(new_entry)
-
-
-
-        self._save_positions(positions)
+        with self.lock:
+            # Re-check under the lock: another worker may have just added it
+            positions = self._load_positions()
+            if any(row['spread_id'] == str(spread_id) for row in positions):
+                return
+            new_entry = {
+                'spread_id': str(spread_id),
+                'entry_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # Store entry timestamp
+                'buy_ticker_id': str(buy_ticker_id),
+                'buy_ticker_name': buy_ticker_name,
+                'buy_quantity': str(buy_quantity),
+                'buy_entry_price': str(buy_entry_price),
+                'buy_exit_price': "",
+                'sell_ticker_id': str(sell_ticker_id),
+                'sell_ticker_name': sell_ticker_name,
+                'sell_quantity': str(sell_quantity),
+                'sell_entry_price': str(sell_entry_price),
+                'sell_exit_price': ""
+            }
+            positions.append(new_entry)
+            self._save_positions(positions)
         print(f"Created new position entry for spread_id {spread_id} at {new_entry['entry_time']}.")
 
 
@@ -103,19 +116,22 @@ class SpreadProcessor:
     Encapsulates the logic of reading from shared memory,
     computing spread data, and creating new positions.
     """
-    def __init__(self, entry_manager, instrumentname, spd, lotsizejson, expiry_dates):
+    def __init__(self, entry_manager, instrumentname, spd, lotsizejson, expiry_dates, max_age_ms=0):
         self.entry_manager = entry_manager
         self.instrumentname = instrumentname
         self.spd = spd
         self.lotsizejson = lotsizejson
         self.expiry_dates = expiry_dates
+        self.max_age_ns = int(max_age_ms * 1_000_000)    # 0: quotes never go stale
+
+    def is_stale(self, tick):
+        """True if the tick was received longer ago than the quote age limit."""
+        return self.max_age_ns > 0 and tick_age_ns(tick) > self.max_age_ns
 
     def read_from_shm(self, exchange_id):
-        """Reads market data from shared memory and returns JSON."""
+        """Reads the binary tick record from the shared tick arena as a dict."""
         try:
-            shm = shared_memory.SharedMemory(name=f"shm_{exchange_id}")
-            raw_data = bytes(shm.buf).rstrip(b"\x00").decode("utf-8")
-            return json.loads(raw_data)
+            return read_tick(exchange_id)
         except Exception as e:
             return None
 
@@ -133,6 +149,7 @@ class SpreadProcessor:
             return {"error": f"Invalid or missing LTP for SPID {spdid}"}
 
         result['LTP'] = ltp
+        result['stale'] = self.is_stale(spread_data)
         result['instrument_name'] = self.instrumentname.get(str(spdid), "Unknown Instrument")
 
         a1, b1 = 0, 0
@@ -149,6 +166,7 @@ class SpreadProcessor:
                 related_spread_data = self.read_from_shm(related_spid)
 
                 if related_spread_data:
+                    result['stale'] = result['stale'] or self.is_stale(related_spread_data)
                     bids = related_spread_data.get("Bids", [])
                     asks = related_spread_data.get("Asks", [])
 
@@ -186,7 +204,8 @@ class SpreadProcessor:
             #   Check for Entry Logic
             # ===========================
             # Example logic: if LTP > actual_spread (and LTP!=0), create position if none exists.
-            if (ltp > actual_spread) and (ltp != 0):
+            # Never enter on quotes too old to trust.
+            if (ltp > actual_spread) and (ltp != 0) and not result['stale']:
                 # We assume each spread has exactly 2 related legs for simplicity
                 if len(related_spids) == 2:
                     buy_leg = related_spids[0]
@@ -221,54 +240,21 @@ class SpreadProcessor:
 
 
 # =========================================
-#      Flask App and Route Definitions
+#      Flask Routes (standalone app)
 # =========================================
-app = Flask(__name__)
-
-# ========== API Credentials & Initialization ==========
-API_KEY = '0b84a5c57dcdf2b3a32261'
-API_SECRET = 'Djya854$gm'
-SOURCE = 'WebAPI'
-
-xt = XTSConnect(API_KEY, API_SECRET, SOURCE)
-login_response = xt.marketdata_login()  # Obtain token for MarketData
-marketDataToken = login_response['result']['token']
-muserID = login_response['result']['userID']
-
-# Initialize the MarketData socket
-soc = MDSocket_io(marketDataToken, muserID)
-
-# ========== Load Instrument Mappings and Other JSON Files ==========
-with open('data/futures_mapping2.json', 'r') as f:
-    instruments_mapping = json.load(f)
-
-with open('data/futures_mapping2.json', 'r') as file:
-    spd = json.load(file)
-
-with open(r"data/contractnames.json", "r") as f:
-    instrumentname = json.load(f)
-
-with open(r'data/lotsize.json', 'r') as f:
-    lotsizejson = json.load(f)
-
-with open(r"data/exchange_instruments2.json", "r") as f:
-    Instruments = json.load(f)
+# The routes are registered on an app only when this file is run directly
+# (see __main__), and data files are loaded on first use through SharedData,
+# so importing SpreadEntryManager / SpreadProcessor has no side effects.
+routes = Blueprint('entry_manager', __name__)
 
-# List of subscriptions maintained in a JSON file
-SUBSCRIPTIONS_FILE = 'data/subscriptions.json'
-subscriptions = []
-if os.path.exists(SUBSCRIPTIONS_FILE):
-    with open(SUBSCRIPTIONS_FILE, 'r') as sub_file:
-        subscriptions = json.load(sub_file)
+# Subscribed spreads, reference-counted per instrument (see SubscriptionRegistry.py)
+subscription_registry = SubscriptionRegistry(SUBSCRIPTIONS_FILE)
 
 # PID file path
 PID_FILE = "data/fetching_pid.txt"
 
-# Expiry dates (update as needed)
-EXPIRY_DATES = [
-    datetime.strptime("2025-02-28", "%Y-%m-%d"),
-    datetime.strptime("2025-03-27", "%Y-%m-%d")
-]
+# Expiry dates (update as needed in SharedData)
+EXPIRY_DATES = SharedData.EXPIRY_DATES
 
 # Threading lock
 datachanging_lock = threading.Lock()
@@ -295,98 +281,117 @@ def delete_pid():
     if os.path.exists(PID_FILE):
         os.remove(PID_FILE)
 
-# ========== Initialize the SpreadProcessor ==========
-
-spread_processor = SpreadProcessor(
-    entry_manager=SpreadEntryManager('spread_positions.csv'),
-    instrumentname=instrumentname,
-    spd=spd,
-    lotsizejson=lotsizejson,
-    expiry_dates=EXPIRY_DATES
-)
+# ========== SpreadProcessor (created on first use) ==========
+
+spread_processor = None
+
+entry_config = configparser.ConfigParser()
+entry_config.read('config.ini')
+MAX_QUOTE_AGE_MS = entry_config.getfloat('spreads', 'max_quote_age_ms', fallback=30000)
+
+def get_spread_processor():
+    """Returns the standalone app's SpreadProcessor, creating it on first call."""
+    global spread_processor
+    with datachanging_lock:
+        if spread_processor is None:
+            spread_processor = SpreadProcessor(
+                entry_manager=SpreadEntryManager('spread_positions.csv'),
+                instrumentname=SharedData.contract_names(),
+                spd=SharedData.futures_mapping(),
+                lotsizejson=SharedData.lot_sizes(),
+                expiry_dates=EXPIRY_DATES,
+                max_age_ms=MAX_QUOTE_AGE_MS
+            )
+        return spread_processor
 
 # ========== Flask Routes ==========
 
-@app.route('/')
+@routes.route('/')
 def index():
     """Default route to render your main template."""
     return render_template('t4.html')
 
-@app.route('/mdlist', methods=['POST'])
+@routes.route('/mdlist', methods=['POST'])
 def mdlist():
     """Show currently subscribed instruments."""
-    current_subs = []
-    if os.path.exists(SUBSCRIPTIONS_FILE):
-        with open(SUBSCRIPTIONS_FILE) as sub_file:
-            current_subs = json.load(sub_file)
-
-    # Filter only those in instruments_mapping
     current_subs = [
-        sub for sub in current_subs
-        if str(sub['exchangeInstrumentID']) in instruments_mapping
+        {"exchangeSegment": 2, "exchangeInstrumentID": int(key)}
+        for key in sorted(subscription_registry.subscribed_spreads(), key=int)
     ]
     return render_template(
         'index.html',
-        keys=instruments_mapping.keys(),
         subscriptions=current_subs,
-        values=instrumentname
+        values=SharedData.contract_names()
     )
 
-@app.route('/subscribe', methods=['POST'])
+search_index = None
+
+@routes.route('/instruments/search', methods=['GET'])
+def search_instruments():
+    """Typeahead search over the subscribable instruments (?q=&offset=&limit=)."""
+    global search_index
+    with datachanging_lock:
+        if search_index is None:
+            names = SharedData.contract_names()
+            search_index = InstrumentIndex({key: names.get(key, key) for key in SharedData.futures_mapping()})
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    return jsonify(search_index.search(request.args.get('q', ''), offset, limit))
+
+def requested_spreads(payload, instruments_mapping):
+    """Spread keys named by a subscribe / unsubscribe request: "key", "keys" or "underlying"."""
+    if payload.get("underlying"):
+        return subscription_registry.spreads_for_underlying(payload["underlying"])
+    keys = payload.get("keys") or [payload.get("key")]
+    return [str(key) for key in keys if key and str(key) in instruments_mapping]
+
+@routes.route('/subscribe', methods=['POST'])
 def subscribe():
-    """Subscribe to a particular key in instruments_mapping."""
-    global subscriptions
-    selected_key = request.json.get("key")
-    if not selected_key or selected_key not in instruments_mapping:
+    """
+    Subscribe to spreads in instruments_mapping, along with their legs.
+    Expects JSON: {"key": <spread key>}, {"keys": [...]} or
+    {"underlying": "NIFTY"} for every calendar spread of an underlying.
+    """
+    instruments_mapping = SharedData.futures_mapping()
+    keys = requested_spreads(request.json or {}, instruments_mapping)
+    if not keys:
         return jsonify({"error": "Invalid key"}), 400
 
-    # Build subscription list
-    subscription_list = [{
-        "exchangeSegment": 2,
-        "exchangeInstrumentID": int(selected_key)
-    }]
-    # Also add the mapped instruments
-    for inst_id in instruments_mapping[selected_key]:
-        subscription_list.append({
-            "exchangeSegment": 2,
-            "exchangeInstrumentID": inst_id
-        })
+    # Only instruments no subscribed spread needed yet go to the socket
+    added = subscription_registry.subscribe(keys)
+    live = send_command(OP_SUBSCRIBE, added)
 
-    # Update and persist the subscriptions
-    subscriptions.extend(subscription_list)
-    with open(SUBSCRIPTIONS_FILE, 'w') as sub_file:
-        json.dump(subscriptions, sub_file, indent=4)
+    return jsonify({"message": "Subscription successful", "spreads": len(keys),
+                    "instruments": len(added), "live": live})
 
-    return jsonify({"message": "Subscription successful"})
-
-@app.route('/unsubscribe', methods=['POST'])
+@routes.route('/unsubscribe', methods=['POST'])
 def unsubscribe():
-    """Unsubscribe a particular instrument ID along with its mapped IDs."""
-    global subscriptions
-    exchange_id = request.json.get("exchangeInstrumentID")
-    if not exchange_id or exchange_id not in instruments_mapping:
+    """
+    Unsubscribe spreads: {"exchangeInstrumentID": <spread key>}, {"keys": [...]}
+    or {"underlying": ...}. Legs still used by another spread stay subscribed.
+    """
+    instruments_mapping = SharedData.futures_mapping()
+    payload = request.json or {}
+    if "exchangeInstrumentID" in payload:
+        payload = {"key": payload["exchangeInstrumentID"]}
+    keys = requested_spreads(payload, instruments_mapping)
+    if not keys:
         return jsonify({"error": "Invalid instrument ID"}), 400
 
-    # Get all related instrument IDs
-    instrument_list = [int(exchange_id)] + instruments_mapping.get(exchange_id, [])
-
-    # Remove them from current subscriptions
-    subscriptions = [
-        sub for sub in subscriptions
-        if sub["exchangeInstrumentID"] not in instrument_list
-    ]
-
-    # Save updated subscriptions
-    with open(SUBSCRIPTIONS_FILE, 'w') as sub_file:
-        json.dump(subscriptions, sub_file, indent=4)
+    removed = subscription_registry.unsubscribe(keys)
+    live = send_command(OP_UNSUBSCRIBE, removed)
 
-    return jsonify({"message": "Unsubscribed successfully"})
+    return jsonify({"message": "Unsubscribed successfully", "spreads": len(keys),
+                    "instruments": len(removed), "live": live})
 
 # ========== Market Data Fetching Process Management ==========
 SCRIPT_PATH = os.path.join(os.getcwd(), "MDEngine.py")
 TERMINAL_NAME = "MarketDataTerminal"
 
-@app.route('/start_fetching', methods=['POST'])
+@routes.route('/start_fetching', methods=['POST'])
 def start_fetching():
     """Start market data fetching in a new terminal/process."""
     if get_pid() is not None:
@@ -408,7 +413,7 @@ def start_fetching():
     save_pid(process.pid)
     return jsonify({"message": "Started fetching market data!", "pid": process.pid})
 
-@app.route('/stop_fetching', methods=['POST'])
+@routes.route('/stop_fetching', methods=['POST'])
 def stop_fetching():
     """Stop market data fetching by killing the associated terminal."""
     pid = get_pid()
@@ -425,12 +430,14 @@ def stop_fetching():
 
 # ========== Spread Data Processing Routes ==========
 
-@app.route('/process-spread-data', methods=['GET'])
+@routes.route('/process-spread-data', methods=['GET'])
 def process_and_store_spread_data():
     """
     Process all spreads in `spd` concurrently, using SpreadProcessor,
     and save the result to JSON.
     """
+    spd = SharedData.futures_mapping()
+    spread_processor = get_spread_processor()
     result = {}
     with ThreadPoolExecutor() as executor:
         futures = {
@@ -454,7 +461,7 @@ def process_and_store_spread_data():
 
     return jsonify({'message': 'Data processed and saved successfully'})
 
-@app.route('/get-spread-data', methods=['GET'])
+@routes.route('/get-spread-data', methods=['GET'])
 def get_spread_data():
     """Retrieve processed spread data from file."""
     try:
@@ -466,12 +473,13 @@ def get_spread_data():
 
 # ========== Live Positions Route ==========
 
-@app.route('/positions/live', methods=['GET'])
+@routes.route('/positions/live', methods=['GET'])
 def get_live_positions():
     """
     Reads all open positions from the CSV, fetches live prices from shared memory,
     computes current profit/loss, and returns as JSON.
     """
+    spread_processor = get_spread_processor()
     positions = spread_processor.entry_manager._load_positions()
     live_positions = []
 
@@ -530,7 +538,7 @@ def get_live_positions():
 
     return jsonify(live_positions)
 
-@app.route('/positions', methods=['GET'])
+@routes.route('/positions', methods=['GET'])
 def live_positions_view():
     """
     Returns the front-end page (HTML) that displays live positions.
@@ -539,4 +547,6 @@ def live_positions_view():
 
 # ========== Main ==========
 if __name__ == '__main__':
+    app = Flask(__name__)
+    app.register_blueprint(routes)
     app.run(debug=True, port=5001)
@@ -0,0 +1,193 @@
+"""
+    FeedShards.py
+
+    Splits MDEngine's market data subscriptions over several worker
+    processes ("shards"), each with its own XTS session, socket and GIL, so
+    decoding a burst of 1502 depth messages is no longer bound to one core.
+
+    Every shard writes its ticks straight into the one tick arena. The main
+    process allocates every slot before a shard may write it, and each
+    instrument belongs to exactly one shard, so every arena record keeps a
+    single writer. Instruments are assigned busiest first to the least
+    loaded shard by observed tick rate; an assignment only changes when the
+    instrument is unsubscribed, so a restarted shard takes back exactly the
+    instruments it had.
+
+    The pool watches its shards, restarts any that exit (with backoff), and
+    reports the feed live only while every shard is. No shard is given more
+    instruments than one session may subscribe to (`capacity`).
+"""
+import heapq
+import multiprocessing
+import threading
+import time
+
+from ControlChannel import OP_SUBSCRIBE, OP_UNSUBSCRIBE
+from TickStore import FEED_DOWN, FEED_LIVE
+
+SHARD_CHECK_SECONDS = 0.05        # How often shards' processes and feed states are checked
+
+
+def balance(instruments, rate, shards, capacity=None):
+    """
+    Splits instruments into `shards` lists of roughly equal total tick rate:
+    busiest first, each onto the shard with the lowest total so far (the
+    fewest instruments among equals, so unknown rates still split evenly).
+    A shard holding `capacity` instruments takes no more. Returns the lists
+    and the instruments that did not fit anywhere.
+    """
+    assignment = [[] for _ in range(shards)]
+    unassigned = []
+    loads = [(0.0, 0, shard) for shard in range(shards)]
+    for inst in sorted(instruments, key=lambda inst: rate(inst['exchangeInstrumentID']), reverse=True):
+        if not loads:
+            unassigned.append(inst)
+            continue
+        load, count, shard = heapq.heappop(loads)
+        assignment[shard].append(inst)
+        if capacity is None or count + 1 < capacity:
+            heapq.heappush(loads, (load + rate(inst['exchangeInstrumentID']), count + 1, shard))
+    return assignment, unassigned
+
+
+class ShardPool:
+    """
+    `count` shard processes running `target(shard, instruments, commands, states)`:
+
+        instruments  the shard's initial [{"exchangeSegment", "exchangeInstrumentID"}]
+        commands     multiprocessing queue of (op, message_code, instruments) changes
+        states       shared array: the shard sets states[shard] to FEED_LIVE / FEED_DOWN
+
+    `rate(exchange_id)` is the observed tick rate used for balancing;
+    `on_state(state)` is called from the pool's thread whenever the feed as
+    a whole goes live or down. `delays()` yields the restart backoff.
+    `capacity` is the most instruments one shard's session may subscribe to.
+    """
+
+    def __init__(self, count, target, rate, on_state, delays, capacity=None):
+        self.context = multiprocessing.get_context('spawn')    # Never fork a threaded process
+        self.count = count
+        self.target = target
+        self.rate = rate
+        self.on_state = on_state
+        self.delays = delays
+        self.capacity = capacity
+        self.states = self.context.Array('i', count, lock=False)
+        self.assignment = [[] for _ in range(count)]   # Instruments of each shard
+        self.owner = {}                                 # Instrument id -> shard
+        self.processes = [None] * count
+        self.commands = [None] * count
+        self._backoff = [None] * count                  # Restart delays of shards that exited
+        self._restart_at = [0.0] * count
+        self._live = False
+        self.lock = threading.Lock()
+
+    def _spawn(self, shard):
+        """Starts a shard's process on its current assignment (under the lock)."""
+        self.states[shard] = FEED_DOWN
+        commands = self.context.Queue()
+        process = self.context.Process(
+            target=self.target, name=f"md-shard-{shard}", daemon=True,
+            args=(shard, list(self.assignment[shard]), commands, self.states)
+        )
+        process.start()
+        self.processes[shard] = process
+        self.commands[shard] = commands
+        print(f"✅ Feed shard {shard} started (pid {process.pid}, {len(self.assignment[shard])} instruments)")
+
+    def start(self, instruments):
+        """Balances the instruments over the shards, starts them and then watches them."""
+        with self.lock:
+            self.assignment, unassigned = balance(instruments, self.rate, self.count, self.capacity)
+            if unassigned:
+                print(f"⚠️ {len(unassigned)} instruments exceed the shards' subscription limit; not subscribed")
+            for shard, assigned in enumerate(self.assignment):
+                for inst in assigned:
+                    self.owner[inst['exchangeInstrumentID']] = shard
+            for shard in range(self.count):
+                self._spawn(shard)
+        threading.Thread(target=self.supervise, name="shard-supervisor", daemon=True).start()
+
+    # --------------------------------------------------------------------------
+    # Subscription changes
+    # --------------------------------------------------------------------------
+    def _least_loaded(self):
+        """The least loaded shard with room for another instrument, or None if all are full."""
+        loads = [(sum(self.rate(inst['exchangeInstrumentID']) for inst in assigned), len(assigned), shard)
+                 for shard, assigned in enumerate(self.assignment)
+                 if self.capacity is None or len(assigned) < self.capacity]
+        return min(loads)[2] if loads else None
+
+    def subscribe(self, instruments, message_code=1502):
+        """Assigns new instruments, each to the shard least loaded at the time, and subscribes them there."""
+        added = {}
+        full = 0
+        with self.lock:
+            for inst in instruments:
+                if inst['exchangeInstrumentID'] in self.owner:
+                    continue
+                shard = self._least_loaded()
+                if shard is None:
+                    full += 1
+                    continue
+                self.owner[inst['exchangeInstrumentID']] = shard
+                self.assignment[shard].append(inst)
+                added.setdefault(shard, []).append(inst)
+            for shard, assigned in added.items():
+                self.commands[shard].put((OP_SUBSCRIBE, message_code, assigned))
+        if full:
+            print(f"⚠️ Every feed shard is at its subscription limit; {full} instruments not subscribed")
+
+    def unsubscribe(self, instruments, message_code=1502):
+        """Unsubscribes instruments on the shards that own them."""
+        removed = {}
+        with self.lock:
+            for inst in instruments:
+                shard = self.owner.pop(inst['exchangeInstrumentID'], None)
+                if shard is not None:
+                    removed.setdefault(shard, set()).add(inst['exchangeInstrumentID'])
+            for shard, ids in removed.items():
+                assigned = self.assignment[shard]
+                self.commands[shard].put((OP_UNSUBSCRIBE, message_code,
+                                          [inst for inst in assigned if inst['exchangeInstrumentID'] in ids]))
+                self.assignment[shard] = [inst for inst in assigned if inst['exchangeInstrumentID'] not in ids]
+
+    # --------------------------------------------------------------------------
+    # Supervision
+    # --------------------------------------------------------------------------
+    def check(self, now=None):
+        """Restarts shards that exited once their backoff has passed; updates the overall feed state."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for shard, process in enumerate(self.processes):
+                if process.is_alive():
+                    if self.states[shard] == FEED_LIVE:
+                        self._backoff[shard] = None     # Healthy again: next failure retries at once
+                    continue
+                if self._restart_at[shard] == 0.0:
+                    self.states[shard] = FEED_DOWN
+                    if self._backoff[shard] is None:
+                        self._backoff[shard] = self.delays()
+                    delay = next(self._backoff[shard])
+                    self._restart_at[shard] = now + delay
+                    print(f"❌ Feed shard {shard} exited (code {process.exitcode}); restarting in {delay:.2f}s")
+                elif now >= self._restart_at[shard]:
+                    self._restart_at[shard] = 0.0
+                    process.join(0)
+                    self.commands[shard].close()
+                    self._spawn(shard)
+
+            live = all(process.is_alive() for process in self.processes) and \
+                all(state == FEED_LIVE for state in self.states)
+        if live != self._live:
+            self._live = live
+            self.on_state(FEED_LIVE if live else FEED_DOWN)
+
+    def supervise(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"❌ Shard supervisor: {e}")
+            time.sleep(SHARD_CHECK_SECONDS)
+
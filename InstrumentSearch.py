@@ -0,0 +1,104 @@
+"""
+    InstrumentSearch.py
+
+    Typeahead search over instrument names for the subscription page. The
+    index is built once: names sorted for prefix lookups by binary search,
+    plus a trigram -> name positions table for substring lookups. A query
+    touches only the matching slice or the shortest posting lists, so it
+    answers in well under a millisecond even over the full contract list.
+"""
+from bisect import bisect_left
+
+import numpy as np
+
+SEARCH_LIMIT = 20           # Default page size
+MAX_SEARCH_LIMIT = 100
+VERIFY_DIRECTLY = 256       # Candidate count below which names are checked directly
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class InstrumentIndex:
+    """
+    Prefix and trigram index over {instrument id: name}.
+
+    Results are in name order: names starting with the query first, then
+    names containing it elsewhere. Pages are requested with offset/limit
+    and report whether more results follow.
+    """
+
+    def __init__(self, names):
+        entries = sorted((str(name).upper(), str(key)) for key, name in names.items())
+        self.keys = [name for name, _ in entries]       # Upper-cased names, sorted
+        self.ids = [key for _, key in entries]
+        self.names = [names[key] for key in self.ids]   # Display names
+
+        postings = {}
+        for position, name in enumerate(self.keys):
+            for trigram in _trigrams(name):
+                postings.setdefault(trigram, []).append(position)
+        # Positions are appended in order, so every posting list is sorted
+        self.postings = {trigram: np.array(positions, dtype=np.int32) for trigram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _prefix_range(self, query):
+        lo = bisect_left(self.keys, query)
+        hi = bisect_left(self.keys, query + '\uffff', lo)
+        return lo, hi
+
+    def _substring_candidates(self, query):
+        """
+        Positions whose names contain the query's trigrams (a superset of the
+        matches, in name order). Posting lists are intersected shortest
+        first, only until the candidates are few enough to check directly.
+        """
+        lists = []
+        for trigram in _trigrams(query):
+            positions = self.postings.get(trigram)
+            if positions is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(positions)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for positions in lists[1:]:
+            if len(candidates) <= VERIFY_DIRECTLY:
+                break
+            candidates = np.intersect1d(candidates, positions, assume_unique=True)
+        return candidates
+
+    def _matches(self, query):
+        """Yields matching positions in result order."""
+        lo, hi = self._prefix_range(query)
+        yield from range(lo, hi)
+        if len(query) < 3:
+            return  # Too short for trigrams: prefix matches only
+        exact = len(query) == 3  # The single posting list is exactly the matches
+        candidates = self._substring_candidates(query)
+        # Convert in chunks: a page usually needs only the first few
+        for start in range(0, len(candidates), VERIFY_DIRECTLY):
+            for position in candidates[start:start + VERIFY_DIRECTLY].tolist():
+                if lo <= position < hi:
+                    continue
+                if exact or query in self.keys[position]:
+                    yield position
+
+    def search(self, query, offset=0, limit=SEARCH_LIMIT):
+        """Returns one page of matches: {"results": [{"id", "name"}], "offset", "limit", "more"}."""
+        query = (query or '').strip().upper()
+        offset = max(0, offset)
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+
+        page = []
+        more = False
+        for count, position in enumerate(self._matches(query)):
+            if count < offset:
+                continue
+            if len(page) == limit:
+                more = True
+                break
+            page.append({"id": self.ids[position], "name": self.names[position]})
+        return {"query": query, "results": page, "offset": offset, "limit": limit, "more": more}
@@ -0,0 +1,143 @@
+"""
+    LocalStore.py
+
+    Small on-disk state shared by every Dashboard worker process. Workers
+    do not share module globals, so anything they must agree on (the
+    subscription list, the fetching PID, open positions) lives in files
+    that are read fresh and changed under an inter-process lock, and are
+    always replaced atomically so a reader never sees a partial write.
+"""
+import copy
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive lock across processes (and threads) on a lock file, e.g.
+
+        with FileLock('data/subscriptions.json.lock'):
+            ...
+
+    Uses flock on POSIX and msvcrt.locking on Windows. The lock is released
+    by the OS if the holding process dies.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def acquire(self):
+        file = open(self.path, 'a+')
+        _lock_file(file)
+        self._local.file = file
+
+    def release(self):
+        file = self._local.file
+        self._local.file = None
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        file.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _lock_file(file, blocking=True):
+    """Locks an open lock file exclusively; returns False if `blocking` is off and it is taken."""
+    if fcntl is not None:
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            # LK_LOCK gives up after ~10 s; keep waiting
+
+
+class Leader:
+    """
+    Elects one process to do something only one may do (e.g. create
+    positions): the first to lock `path` holds it for as long as it runs.
+    The OS releases the lock if that process dies, and another one takes
+    over on its next `is_leader()`, tried at most every `retry_seconds`.
+    """
+
+    def __init__(self, path, retry_seconds=1.0):
+        self.path = path
+        self.retry_seconds = retry_seconds
+        self._file = None           # Held open (and locked) while this process leads
+        self._tried_at = None
+        self._lock = threading.Lock()
+
+    def is_leader(self):
+        if self._file is not None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self._file is None and (self._tried_at is None or now - self._tried_at >= self.retry_seconds):
+                self._tried_at = now
+                file = open(self.path, 'a+')
+                if _lock_file(file, blocking=False):
+                    self._file = file
+                    print(f"✅ Process {os.getpid()} took the lead on {self.path}")
+                else:
+                    file.close()
+            return self._file is not None
+
+
+def write_json_atomic(path, data):
+    """Writes JSON to a temp file and renames it over `path`, so readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file, indent=4)
+    os.replace(tmp_path, path)
+
+
+class JsonStore:
+    """
+    A JSON file shared between processes. `read()` always sees the last
+    complete write; `update(fn)` is a locked read-modify-write, so changes
+    made by different workers are never lost.
+    """
+
+    def __init__(self, path, default=None):
+        self.path = path
+        self.default = default
+        self.lock = FileLock(f"{path}.lock")
+
+    def read(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return copy.deepcopy(self.default)
+
+    def update(self, fn):
+        """Applies `fn` to the current data under the lock and writes back its result."""
+        with self.lock:
+            data = fn(self.read())
+            write_json_atomic(self.path, data)
+            return data
@@ -1,10 +1,27 @@
+import atexit
+import configparser
 import csv
 import json
+import multiprocessing
 import os
+import queue
+import random
+import signal
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from Connect import XTSConnect
-from multiprocessing import shared_memory
 from MarketDataSocketClient import MDSocket_io
+import SharedData
+from ControlChannel import OP_SUBSCRIBE, OP_TOUCH, OP_UNSUBSCRIBE, CommandRing
+from EntryManager import SpreadEntryManager
+from FeedShards import ShardPool
+from SpreadEngine import SpreadEngine, SpreadTable
+from SubscriptionQuota import QuotaManager
+from SubscriptionRegistry import SubscriptionRegistry
+from TickQueue import TickQueue
+from TickStore import FEED_DOWN, FEED_LIVE, HEARTBEAT_SECONDS, SNAPSHOT_RECEIVED_NS, TickArena
 
 ########################################################################
 # MarketData API Credentials
@@ -18,97 +35,245 @@ SOURCE = 'WebAPI'
 ########################################################################
 xt = None                 # Will hold the XTSConnect instance
 current_soc = None        # Will hold the current MDSocket_io instance
-shm_dict = {}             # Tracks shared memory for each ExchangeInstrumentID
-SHM_SIZE = 10000           # Adjust based on expected data size
-Instruments = []          # Will hold the list of instruments from JSON
+arena = None              # TickArena holding a record slot per ExchangeInstrumentID
+spread_engine = None      # SpreadEngine recomputing spreads as their legs tick
+spread_table = None       # SpreadTable the recomputed spreads are published to
+control_ring = None       # CommandRing the Dashboard pushes subscription changes through
+subscription_registry = None  # SubscriptionRegistry the subscribed instruments come from
+quota_manager = None      # QuotaManager keeping the subscriptions within the XTS limit
+tick_queue = None         # TickQueue between the socket thread and the shared-memory writer
+shard_pool = None         # ShardPool of feed processes, when the feed is sharded
+shard_index = None        # In a feed shard process: this shard's number
+shard_states = None       # In a feed shard process: shared array its feed state is reported in
+Instruments = []          # Will hold the list of subscribed instruments
 set_marketDataToken = ''  # Current MarketData token
 set_muserID = ''          # Current user ID
+warmed_up_at = None       # time.monotonic() a complete warm-up finished, until the first connection
+
+write_lock = threading.Lock()               # One writer at a time: tick writer, supervisor and control threads
+reconnect_requested = threading.Event()     # Set on disconnect; wakes the feed supervisor
+socket_connected = threading.Event()        # Set by on_connect once a new socket has resubscribed
+
+CONTROL_POLL_SECONDS = 0.05   # How often the command ring is checked
+RECONNECT_BASE_SECONDS = 0.25 # First retry delay; doubles per failed attempt (full jitter)
+RECONNECT_MAX_SECONDS = 30
+CONNECT_TIMEOUT_SECONDS = 10
+WARM_UP_REUSE_SECONDS = 15    # A first connection this soon after the warm-up skips its own gap-fill
+REQUEST_CHUNK_SIZE = 50       # Instruments per XTS subscription / quote request
+
+mdengine_config = configparser.ConfigParser()
+mdengine_config.read('config.ini')
+# Instruments one market data session may subscribe to (each feed shard has its own session);
+# idle spreads are evicted beyond it
+MAX_SUBSCRIPTIONS = mdengine_config.getint('mdengine', 'max_subscriptions', fallback=1000)
+# Concurrent get_quote requests when warming up / refilling shared memory
+QUOTE_WORKERS = mdengine_config.getint('mdengine', 'quote_workers', fallback=8)
+# Spreads whose legs last ticked longer ago than this never signal an entry
+MAX_QUOTE_AGE_MS = mdengine_config.getfloat('spreads', 'max_quote_age_ms', fallback=30000)
+# Raw ticks buffered between the socket and the shared-memory writer
+TICK_QUEUE_SIZE = mdengine_config.getint('mdengine', 'tick_queue_size', fallback=100000)
+# Feed processes, each with its own session and socket (1: the feed runs in this process)
+FEED_SHARDS = mdengine_config.getint('mdengine', 'feed_shards', fallback=1)
+SPREAD_POLL_SECONDS = 0.01    # Sharded feed: how often spreads are recomputed from the arena
+TICK_RATES_SAVE_SECONDS = 60  # How often observed tick rates are saved for the next run
 
 ########################################################################
 # Step 1: Helper functions for shared memory
 ########################################################################
-def create_shared_memory(exchange_id):
-    """Creates a shared memory segment for a given ExchangeInstrumentID."""
-    try:
-        if exchange_id not in shm_dict:
-            shm = shared_memory.SharedMemory(
-                name=f"shm_{exchange_id}", 
-                create=True, 
-                size=SHM_SIZE
-            )
-            shm_dict[exchange_id] = shm
-            print(f"✅ Created shared memory for {exchange_id}")
-        else:
-            print(f"⚠️ Shared memory already exists for {exchange_id}")
-    except FileExistsError:
-        print(f"⚠️ Shared memory already exists for {exchange_id}")
-        shm = shared_memory.SharedMemory(name=f"shm_{exchange_id}")
-        shm_dict[exchange_id] = shm
+def create_shared_memory(instruments):
+    """
+    Creates (or reopens) the tick arena and allocates a slot for every
+    instrument up front, so readers can resolve them all on first attach.
+    """
+    global arena
+    if arena is None:
+        arena = TickArena.create()
+        # A reopened arena may still say live from the previous run
+        arena.set_feed_state(FEED_DOWN)
+        print(f"✅ Tick arena '{arena.name}' ready ({arena.capacity} slots)")
+    for inst in instruments:
+        arena.add(inst['exchangeInstrumentID'])
+    print(f"✅ Allocated shared memory slots for {len(instruments)} instruments")
+
+def write_to_shm(exchange_id, data, received_ns=None):
+    """Writes market data into the instrument's arena slot, received at `received_ns` (default now)."""
+    if arena is None:
+        create_shared_memory([])
+
+    # Pack the fixed-size record in place; no encoding or zero-fill needed
+    arena.write(exchange_id, data, received_ns)
+
+def store_ticks(ticks, counts):
+    """
+    Writes a conflated batch {instrument id: latest tick} from the tick
+    queue to shared memory, then recomputes and publishes the spreads the
+    batch moves in one go. `counts` are the ticks received per instrument.
+    """
+    with write_lock:
+        for exchange_id, data in list(ticks.items()):
+            # A gap-fill snapshot may have stored a newer quote meanwhile
+            if int(data.get("ExchangeTimeStamp") or 0) < arena.exchange_timestamp(exchange_id):
+                del ticks[exchange_id]
+                continue
+            if arena.slot(exchange_id) is None:
+                del ticks[exchange_id]
+                continue    # Unsubscribed meanwhile: only apply_command allocates slots
+            write_to_shm(exchange_id, data)
+        if spread_engine is not None:
+            rows = spread_engine.apply_ticks(ticks)
+            if rows is not None:
+                spread_table.publish(spread_engine.result, rows)
+    if quota_manager is not None:
+        now = time.monotonic()
+        for exchange_id, count in counts.items():
+            quota_manager.on_tick(exchange_id, now, count)
 
-def write_to_shm(exchange_id, data):
-    """Writes market data to the shared memory segment."""
-    if exchange_id not in shm_dict:
-        create_shared_memory(exchange_id)
+def start_tick_writer():
+    """Starts the thread writing queued ticks to shared memory."""
+    global tick_queue
+    tick_queue = TickQueue(store_ticks, maxlen=TICK_QUEUE_SIZE).start()
+    print(f"✅ Tick writer ready (queue of {TICK_QUEUE_SIZE} ticks)")
+
+def create_spread_engine():
+    """
+    Builds the spread engine from the spread mapping, seeds it from whatever
+    is already in shared memory and publishes the full spread table once.
+    """
+    global spread_engine, spread_table
+    # Memory-mapped universe bundle if built, else the JSON files
+    spread_engine = SpreadEngine(SharedData.futures_mapping(), SharedData.lot_sizes(), max_age_ms=MAX_QUOTE_AGE_MS)
+    spread_table = SpreadTable.create(spread_engine.spread_ids)
+    spread_table.publish(spread_engine.evaluate(arena))
+    print(f"✅ Spread table '{spread_table.name}' ready ({len(spread_engine)} spreads)")
+
+def publish_spreads(exchange_id, data, received_ns=None):
+    """Recomputes and publishes only the spreads that depend on this instrument."""
+    if spread_engine is None:
+        return
+    rows = spread_engine.apply_tick(exchange_id, data, received_ns)
+    if rows is not None:
+        spread_table.publish(spread_engine.result, rows)
+
+########################################################################
+# Live subscription changes
+########################################################################
+def apply_command(op, message_code, instruments):
+    """
+    Applies a subscribe / unsubscribe command from the Dashboard on the
+    current socket session, without reconnecting. Subscribing first evicts
+    idle spreads if the quota requires it; touches just record usage.
+    """
+    global Instruments
+    if op == OP_SUBSCRIBE:
+        # Make room first: new spreads count as just used, so idle ones go
+        evicted = quota_manager.enforce()
+        if evicted:
+            apply_command(OP_UNSUBSCRIBE, message_code, evicted)
+        evicted_ids = {inst['exchangeInstrumentID'] for inst in evicted}
+        subscribed = {inst['exchangeInstrumentID'] for inst in Instruments}
+        added = [inst for inst in instruments
+                 if inst['exchangeInstrumentID'] not in subscribed and inst['exchangeInstrumentID'] not in evicted_ids]
+        if not added:
+            return
+        with write_lock:
+            for inst in added:
+                arena.add(inst['exchangeInstrumentID'])
+        Instruments = Instruments + added
+        if shard_pool is not None:
+            shard_pool.subscribe(added, message_code)
+        else:
+            subscribe_in_chunks(added, message_code)
+        print(f"➕ Subscribed {len(added)} instruments live")
+    elif op == OP_UNSUBSCRIBE:
+        subscribed = {inst['exchangeInstrumentID'] for inst in Instruments}
+        removed = [inst for inst in instruments if inst['exchangeInstrumentID'] in subscribed]
+        if not removed:
+            return
+        removed_ids = {inst['exchangeInstrumentID'] for inst in removed}
+        Instruments = [inst for inst in Instruments if inst['exchangeInstrumentID'] not in removed_ids]
+        if shard_pool is not None:
+            shard_pool.unsubscribe(removed, message_code)
+            print(f"➖ Unsubscribed {len(removed)} instruments live")
+        else:
+            response = xt.send_unsubscription(removed, message_code)
+            print(f"➖ Unsubscribed {len(removed)} instruments live:", response)
+        # Free their slots, so subscription churn cannot fill the arena
+        with write_lock:
+            for exchange_id in removed_ids:
+                arena.remove(exchange_id)
+    elif op == OP_TOUCH:
+        quota_manager.touch(inst['exchangeInstrumentID'] for inst in instruments)
+    else:
+        print(f"⚠️ Ignoring unknown control command {op}")
 
-    shm = shm_dict[exchange_id]
-    encoded_data = json.dumps(data).encode("utf-8")
+def control_loop():
+    """Drains the command ring for as long as MDEngine runs (and now and then saves the tick rates)."""
+    saved = time.monotonic()
+    while True:
+        for op, message_code, instruments in control_ring.poll():
+            try:
+                apply_command(op, message_code, instruments)
+            except Exception as e:
+                print(f"❌ Control command {op} failed: {e}")
+        if time.monotonic() - saved >= TICK_RATES_SAVE_SECONDS:
+            saved = time.monotonic()
+            try:
+                quota_manager.save_tick_rates()
+            except OSError as e:
+                print(f"⚠️ Could not save tick rates: {e}")
+        time.sleep(CONTROL_POLL_SECONDS)
 
-    if len(encoded_data) > SHM_SIZE:
-        print(f"⚠️ Warning: Data for {exchange_id} exceeds shared memory size and will be truncated.")
+def create_control_channel():
+    """
+    Creates the command ring. Done before the subscriptions are read, so a
+    change the Dashboard makes meanwhile is either in what is read or
+    queued in the ring (or both: applying a command twice is harmless).
+    """
+    global control_ring
+    control_ring = CommandRing.create()
 
-    # Write data to shared memory
-    shm.buf[:len(encoded_data)] = encoded_data
-    # Clear out any leftover data
-    shm.buf[len(encoded_data):] = b'\x00' * (SHM_SIZE - len(encoded_data))
+def start_control_channel():
+    """Starts draining the command ring in the background."""
+    threading.Thread(target=control_loop, name="control-channel", daemon=True).start()
+    print(f"✅ Control channel '{control_ring.name}' ready")
 
 ########################################################################
 # Step 2: Socket event handlers
 ########################################################################
+def chunks(instruments, size=REQUEST_CHUNK_SIZE):
+    return [instruments[i:i + size] for i in range(0, len(instruments), size)]
+
+def subscribe_in_chunks(instruments, message_code=1502):
+    """Subscribes in API-sized requests, so one rejected chunk does not fail the rest."""
+    for chunk in chunks(instruments):
+        response = xt.send_subscription(chunk, message_code)
+        print(f"Subscription response ({len(chunk)} instruments):", response)
+
 def on_connect():
-    """Called when the socket is connected."""
+    """Called when the socket is connected: resubscribe everything, then let the supervisor continue."""
     print("Market Data Socket connected successfully!")
-    print("Sending subscription request for instruments:\n", Instruments)
-
-    # Send subscription
-    response = xt.send_subscription(Instruments, 1502)
-    print("Subscription response:", response)
+    subscribe_in_chunks(Instruments)
+    socket_connected.set()
 
 def on_message1502(data):
-    """Callback function for handling full market data (event 1502-json-full)."""
-    print(data)
-    try:
-        data_dict = json.loads(data)
-        exchange_id = str(data_dict.get("ExchangeInstrumentID"))
-        if exchange_id:
-            write_to_shm(exchange_id, data_dict)
-            print(f"✅ Updated shared memory for {exchange_id}")
-        else:
-            print("⚠️ ExchangeInstrumentID missing in received data")
-    except json.JSONDecodeError:
-        print("❌ Error: Received invalid JSON data")
-
-def on_disconnect():
     """
-    Called when the socket is disconnected.
-    We create a brand new MDSocket_io client and reconnect.
+    Callback function for handling full market data (event 1502-json-full).
+    Only queues the raw payload: the tick writer decodes and stores it, so
+    the socket's thread is never held up by a write.
     """
-    global current_soc
+    tick_queue.push(data)
 
-    print("Market Data Socket disconnected! Attempting to reconnect in 5 seconds...")
-    time.sleep(5)
-    try:
-        # If token might have expired, re-login:
-        response = xt.marketdata_login()
-        new_token = response['result']['token']
-        new_userID = response['result']['userID']
-        print("Login Response (re-login):", response)
-
-        # Create a brand new socket instance
-        current_soc = create_new_socket(new_token, new_userID)
-        current_soc.connect()
-        print("Reconnect attempt done with a new socket instance.")
-    except Exception as e:
-        print(f"Reconnection failed: {e}")
+def on_disconnect(soc=None):
+    """
+    Called when the socket is disconnected. Marks the feed down in shared
+    memory and wakes the reconnect supervisor; returns at once, so the
+    socket's thread is never blocked.
+    """
+    if soc is not None and soc is not current_soc:
+        return  # An old socket being replaced
+    set_feed_state(FEED_DOWN)
+    print("Market Data Socket disconnected! Reconnecting...")
+    reconnect_requested.set()
 
 def on_error(data):
     """Called when there's an error event from the server."""
@@ -123,6 +288,8 @@ def create_new_socket(token, user_id):
     and returns the object.
     """
     soc = MDSocket_io(token, user_id)
+    # The feed supervisor reconnects (with a fresh socket); the client must not retry on its own
+    soc.sid.reconnection = False
 
     # Assign the "shortcut" handlers
     soc.on_connect = on_connect
@@ -132,39 +299,302 @@ def create_new_socket(token, user_id):
     el = soc.get_emitter()
     el.on('connect', on_connect)
     el.on('1502-json-full', on_message1502)
-    el.on('disconnect', on_disconnect)
+    el.on('disconnect', lambda *args: on_disconnect(soc))
     el.on('error', on_error)
 
     return soc
 
+########################################################################
+# Feed supervisor: reconnects with backoff and refills the gap
+########################################################################
+def login():
+    """Logs in for a new MarketData token."""
+    global set_marketDataToken, set_muserID
+    response = xt.marketdata_login()
+    print("Login Response:", response)
+    set_marketDataToken = response['result']['token']
+    set_muserID = response['result']['userID']
+
+def session_valid():
+    """True if the current token is still accepted, so reconnecting can skip the login."""
+    response = xt.get_config()
+    return isinstance(response, dict) and response.get('type') == 'success'
+
+def connect_socket():
+    """
+    Replaces the socket with a new one on the current token and waits until
+    it has connected and resubscribed. MDSocket_io.connect blocks for as
+    long as the socket stays up, so it runs on its own thread.
+    """
+    global current_soc
+    old_soc = current_soc
+    socket_connected.clear()
+    current_soc = soc = create_new_socket(set_marketDataToken, set_muserID)
+    if old_soc is not None:
+        try:
+            old_soc.sid.disconnect()
+        except Exception:
+            pass
+
+    errors = []
+    def run():
+        try:
+            soc.connect()
+        except Exception as e:
+            errors.append(e)
+    threading.Thread(target=run, name="md-socket", daemon=True).start()
+
+    deadline = time.monotonic() + CONNECT_TIMEOUT_SECONDS
+    while not socket_connected.wait(0.05):
+        if errors:
+            raise errors[0]
+        if time.monotonic() > deadline:
+            raise TimeoutError("Market data socket did not connect")
+
+def fetch_quotes(chunk):
+    """One get_quote request: the chunk's 1502 snapshots as dicts."""
+    response = xt.get_quote(chunk, 1502, 'JSON')
+    if not isinstance(response, dict) or response.get('type') != 'success':
+        raise ConnectionError(f"get_quote failed: {response}")
+    return [json.loads(quote) if isinstance(quote, str) else quote
+            for quote in response['result'].get('listQuotes') or []]
+
+def store_quotes(quotes):
+    """
+    Writes get_quote snapshots to shared memory, skipping any older than a
+    tick already streamed for the instrument. Returns how many were written.
+    Snapshots carry no receive time, so they stay stale until a tick streams.
+    """
+    written = 0
+    for data in quotes:
+        exchange_id = data.get("ExchangeInstrumentID")
+        if exchange_id is None:
+            continue
+        exchange_id = int(exchange_id)
+        with write_lock:
+            if arena.slot(exchange_id) is None:
+                continue    # Unsubscribed meanwhile: only apply_command allocates slots
+            current = arena.exchange_timestamp(exchange_id)
+            if current and int(data.get("ExchangeTimeStamp") or 0) <= current:
+                continue
+            write_to_shm(exchange_id, data, SNAPSHOT_RECEIVED_NS)
+            publish_spreads(exchange_id, data, SNAPSHOT_RECEIVED_NS)
+        written += 1
+    return written
+
+def refresh_quotes(instruments):
+    """
+    Refreshes shared memory from get_quote snapshots of `instruments`:
+    API-sized chunks requested QUOTE_WORKERS at a time, each stored as soon
+    as it arrives. Returns the number of instruments refreshed.
+    """
+    def refresh_chunk(chunk):
+        return store_quotes(fetch_quotes(chunk))
+    with ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix="quotes") as executor:
+        return sum(executor.map(refresh_chunk, chunks(instruments)))
+
+def warm_up():
+    """
+    Seeds shared memory with a quote snapshot of every subscribed instrument
+    before the socket connects, so the spread table is complete at once
+    instead of filling in tick by tick. Best effort: the feed fills any gaps.
+    """
+    global warmed_up_at
+    started = time.monotonic()
+    try:
+        refreshed = refresh_quotes(Instruments)
+    except Exception as e:
+        print(f"⚠️ Quote warm-up failed: {e}")
+        return
+    warmed_up_at = time.monotonic()
+    print(f"✅ Warmed up {refreshed} of {len(Instruments)} instruments in {time.monotonic() - started:.2f}s")
+
+def restore_feed():
+    """
+    Brings the feed up: reuses the token while it is valid, connects a new
+    socket (which resubscribes), fills the gap from a quote snapshot and
+    only then flags the feed live in shared memory. The first connection
+    right after a complete warm-up reuses its snapshot instead of taking
+    another, halving the get_quote calls at startup.
+    """
+    global warmed_up_at
+    started = time.monotonic()
+    if not session_valid():
+        login()
+    connect_socket()
+    if warmed_up_at is not None and time.monotonic() - warmed_up_at <= WARM_UP_REUSE_SECONDS:
+        refreshed = 0
+    else:
+        refreshed = refresh_quotes(Instruments)
+    warmed_up_at = None     # Every later connection fills its own gap
+    if reconnect_requested.is_set():
+        raise ConnectionError("Socket dropped again while refreshing quotes")
+    set_feed_state(FEED_LIVE)
+    print(f"✅ Feed live in {time.monotonic() - started:.2f}s ({refreshed} quotes refreshed)")
+
+def start_heartbeat():
+    """
+    Beats in the arena while MDEngine runs, so readers treat the feed as
+    down once it is gone, and marks the feed down on the way out.
+    """
+    def beat():
+        while True:
+            arena.heartbeat()
+            time.sleep(HEARTBEAT_SECONDS)
+    threading.Thread(target=beat, name="heartbeat", daemon=True).start()
+    atexit.register(arena.set_feed_state, FEED_DOWN)
+    # Terminating (e.g. from a service manager) exits through atexit too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+def set_feed_state(state):
+    """Flags the feed live / down in shared memory; a feed shard reports it to the main process instead."""
+    if shard_states is not None:
+        shard_states[shard_index] = state
+    else:
+        arena.set_feed_state(state)
+
+def backoff_delays():
+    """Full-jitter exponential backoff: uniform(0, min(max, base * 2 ** attempt))."""
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(RECONNECT_MAX_SECONDS, RECONNECT_BASE_SECONDS * 2 ** attempt))
+        attempt += 1
+
+def supervise_feed():
+    """Restores the feed whenever it goes down, retrying with backoff until it succeeds."""
+    while True:
+        reconnect_requested.wait()
+        reconnect_requested.clear()
+        for delay in backoff_delays():
+            try:
+                restore_feed()
+                break
+            except Exception as e:
+                reconnect_requested.clear()
+                print(f"❌ Reconnection failed: {e}; retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+def start_feed_supervisor():
+    """Starts the supervisor and has it make the first connection."""
+    threading.Thread(target=supervise_feed, name="feed-supervisor", daemon=True).start()
+    reconnect_requested.set()
+
+########################################################################
+# Sharded feed: worker processes, each with its own session and socket
+########################################################################
+def apply_shard_command(op, message_code, instruments):
+    """Applies a subscription change the main process assigned to this shard."""
+    global Instruments
+    ids = {inst['exchangeInstrumentID'] for inst in instruments}
+    subscribed = {inst['exchangeInstrumentID'] for inst in Instruments}
+    if op == OP_SUBSCRIBE:
+        added = [inst for inst in instruments if inst['exchangeInstrumentID'] not in subscribed]
+        if added:
+            Instruments = Instruments + added
+            subscribe_in_chunks(added, message_code)
+    elif op == OP_UNSUBSCRIBE:
+        Instruments = [inst for inst in Instruments if inst['exchangeInstrumentID'] not in ids]
+        response = xt.send_unsubscription(instruments, message_code)
+        print(f"➖ Shard {shard_index} unsubscribed {len(instruments)} instruments:", response)
+
+def run_shard(index, instruments, commands, states):
+    """
+    Entry point of a feed shard process: logs in with its own session,
+    streams `instruments` on its own socket (reconnecting like the single
+    process feed) and writes their ticks into their arena slots, which the
+    main process has already allocated. Exits with the main process.
+    """
+    global xt, arena, Instruments, shard_index, shard_states
+    shard_index, shard_states = index, states
+    arena = TickArena.attach(writable=True)
+    Instruments = instruments
+    xt = XTSConnect(API_KEY, API_SECRET, SOURCE)
+    login()
+    start_tick_writer()
+    start_feed_supervisor()
+
+    parent = multiprocessing.parent_process()
+    while parent.is_alive():
+        try:
+            op, message_code, changed = commands.get(timeout=1)
+        except queue.Empty:
+            continue
+        try:
+            apply_shard_command(op, message_code, changed)
+        except Exception as e:
+            print(f"❌ Shard {index} control command {op} failed: {e}")
+
+def refresh_spreads():
+    """
+    Sharded feed: the shards write ticks straight into the arena, so the
+    main process picks up which instruments changed, recomputes and
+    publishes the spreads they move, and counts the changes as ticks.
+    """
+    while True:
+        with write_lock:
+            rows, changed = spread_engine.refresh(arena)
+            if rows is not None:
+                spread_table.publish(spread_engine.result, rows)
+        now = time.monotonic()
+        for exchange_id in changed.tolist():
+            quota_manager.on_tick(exchange_id, now)
+        time.sleep(SPREAD_POLL_SECONDS)
+
+def start_shards():
+    """Starts the feed shards, balanced by the tick rates seen so far, and the spread refresh."""
+    global shard_pool
+    shard_pool = ShardPool(
+        FEED_SHARDS, run_shard, rate=quota_manager.tick_rate,
+        on_state=arena.set_feed_state, delays=backoff_delays, capacity=MAX_SUBSCRIPTIONS
+    )
+    shard_pool.start(Instruments)
+    threading.Thread(target=refresh_spreads, name="spread-refresh", daemon=True).start()
+
 ########################################################################
 # Step 4: Main routine
 ########################################################################
 def main():
-    global xt, current_soc, set_marketDataToken, set_muserID, Instruments
+    global xt, Instruments, subscription_registry, quota_manager
 
     # 1. Initialize XTSConnect
     xt = XTSConnect(API_KEY, API_SECRET, SOURCE)
 
-    # 2. Login for the MarketData token
-    response = xt.marketdata_login()
-    print("Login Response:", response)
+    # 2-3. Login for the MarketData token / userID (sharded, each shard logs in itself)
+    if FEED_SHARDS <= 1:
+        login()
 
-    # 3. Extract token / userID
-    set_marketDataToken = response['result']['token']
-    set_muserID = response['result']['userID']
+    # 4. Read the subscribed instruments (each once, however many spreads share it),
+    #    evicting idle spreads if there are more than the session may subscribe to.
+    #    Changes from here on are queued in the command ring.
+    create_control_channel()
+    subscription_registry = SubscriptionRegistry()
+    # Every feed shard's session may subscribe up to the limit; the pool keeps each within it
+    quota_manager = QuotaManager(subscription_registry, MAX_SUBSCRIPTIONS * max(FEED_SHARDS, 1), SpreadEntryManager())
+    quota_manager.load_tick_rates()
+    quota_manager.enforce()
+    Instruments = subscription_registry.instruments()
 
-    # 4. Read instrument list from JSON
-    with open(r'data\subscriptions.json') as f:
-        Instruments = json.load(f)
+    # Allocate the shared-memory slots before any tick arrives
+    create_shared_memory(Instruments)
+    start_heartbeat()
+    create_spread_engine()
+    # Accept subscription changes from the Dashboard from here on
+    start_control_channel()
 
-    # 5. Create and connect the socket
-    current_soc = create_new_socket(set_marketDataToken, set_muserID)
-    current_soc.connect()
+    if FEED_SHARDS > 1:
+        # 5. Shard the feed over worker processes. Each connects, refreshes its
+        #    instruments from a quote snapshot and reconnects on its own; the
+        #    pool restarts any shard whose process dies.
+        start_shards()
+    else:
+        # Seed every instrument from a quote snapshot before the first tick
+        warm_up()
+        # Ticks are written from a queue, off the socket's thread
+        start_tick_writer()
 
-    # At this point, the socket is connected and listening.
-    # If the connection drops, `on_disconnect` will be triggered,
-    # which will create a new socket instance and reconnect automatically.
+        # 5. Connect the socket. The supervisor does this now and again whenever
+        #    the connection drops: on_disconnect only wakes it up.
+        start_feed_supervisor()
 
     # 6. Optionally keep the main thread alive, do other tasks, etc.
     while True:
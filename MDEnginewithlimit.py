@@ -3,8 +3,8 @@ import json
 import os
 import time
 from Connect import XTSConnect
-from multiprocessing import shared_memory
 from MarketDataSocketClient import MDSocket_io
+from TickStore import FEED_DOWN, TickArena
 
 ########################################################################
 # MarketData API Credentials
@@ -18,8 +18,7 @@ SOURCE = 'WebAPI'
 ########################################################################
 xt = None                 # Will hold the XTSConnect instance
 current_soc = None        # Will hold the current MDSocket_io instance
-shm_dict = {}             # Tracks shared memory for each ExchangeInstrumentID
-SHM_SIZE = 4096           # Adjust based on expected data size
+arena = None              # TickArena holding a record slot per ExchangeInstrumentID
 Instruments = []          # Will hold the list of instruments from JSON
 set_marketDataToken = ''  # Current MarketData token
 set_muserID = ''          # Current user ID
@@ -27,39 +26,27 @@ set_muserID = ''          # Current user ID
 ########################################################################
 # Step 1: Helper functions for shared memory
 ########################################################################
-def create_shared_memory(exchange_id):
-    """Creates a shared memory segment for a given ExchangeInstrumentID."""
-    try:
-        if exchange_id not in shm_dict:
-            shm = shared_memory.SharedMemory(
-                name=f"shm_{exchange_id}", 
-                create=True, 
-                size=SHM_SIZE
-            )
-            shm_dict[exchange_id] = shm
-            print(f"✅ Created shared memory for {exchange_id}")
-        else:
-            print(f"⚠️ Shared memory already exists for {exchange_id}")
-    except FileExistsError:
-        print(f"⚠️ Shared memory already exists for {exchange_id}")
-        shm = shared_memory.SharedMemory(name=f"shm_{exchange_id}")
-        shm_dict[exchange_id] = shm
+def create_shared_memory(instruments):
+    """
+    Creates (or reopens) the tick arena and allocates a slot for every
+    instrument up front, so readers can resolve them all on first attach.
+    """
+    global arena
+    if arena is None:
+        arena = TickArena.create()
+        arena.set_feed_state(FEED_DOWN)
+        print(f"✅ Tick arena '{arena.name}' ready ({arena.capacity} slots)")
+    for inst in instruments:
+        arena.add(inst['exchangeInstrumentID'])
+    print(f"✅ Allocated shared memory slots for {len(instruments)} instruments")
 
 def write_to_shm(exchange_id, data):
-    """Writes market data to the shared memory segment."""
-    if exchange_id not in shm_dict:
-        create_shared_memory(exchange_id)
+    """Writes market data into the instrument's arena slot."""
+    if arena is None:
+        create_shared_memory([])
 
-    shm = shm_dict[exchange_id]
-    encoded_data = json.dumps(data).encode("utf-8")
-
-    if len(encoded_data) > SHM_SIZE:
-        print(f"⚠️ Warning: Data for {exchange_id} exceeds shared memory size and will be truncated.")
-
-    # Write data to shared memory
-    shm.buf[:len(encoded_data)] = encoded_data
-    # Clear out any leftover data
-    shm.buf[len(encoded_data):] = b'\x00' * (SHM_SIZE - len(encoded_data))
+    # Pack the fixed-size record in place; no encoding or zero-fill needed
+    arena.write(exchange_id, data)
 
 ########################################################################
 # Step 2: Socket event handlers
@@ -72,20 +59,26 @@ def on_connect():
     # Send subscription
     response = xt.send_subscription(Instruments, 1502)
     print("Subscription response:", response)
+    # The feed stays FEED_DOWN: this variant neither refills the gap from a
+    # quote snapshot nor heartbeats, so its prices are never vouched for and
+    # the Dashboard does not enter on them. Run MDEngine.py to trade.
 
 def on_message1502(data):
     """Callback function for handling full market data (event 1502-json-full)."""
     print(data)
     try:
         data_dict = json.loads(data)
-        exchange_id = str(data_dict.get("ExchangeInstrumentID"))
-        if exchange_id:
-            write_to_shm(exchange_id, data_dict)
-            print(f"✅ Updated shared memory for {exchange_id}")
-        else:
+        exchange_id = data_dict.get("ExchangeInstrumentID")
+        if exchange_id is None:
             print("⚠️ ExchangeInstrumentID missing in received data")
+            return
+        write_to_shm(int(exchange_id), data_dict)
+        print(f"✅ Updated shared memory for {exchange_id}")
     except json.JSONDecodeError:
         print("❌ Error: Received invalid JSON data")
+    except (ValueError, TypeError, MemoryError) as e:
+        # Never let a bad tick escape onto the socket thread
+        print(f"❌ Error: Could not store market data: {e}")
 
 def on_disconnect():
     """
@@ -94,6 +87,7 @@ def on_disconnect():
     """
     global current_soc
 
+    arena.set_feed_state(FEED_DOWN)
     print("Market Data Socket disconnected! Attempting to reconnect in 5 seconds...")
     time.sleep(5)
     try:
@@ -158,6 +152,9 @@ def main():
     with open(r'data\exchange_instruments2.json') as f:
         Instruments = json.load(f)
 
+    # Allocate the shared-memory slots before any tick arrives
+    create_shared_memory(Instruments)
+
     # 5. Create and connect the socket
     current_soc = create_new_socket(set_marketDataToken, set_muserID)
     current_soc.connect()
@@ -0,0 +1,109 @@
+"""
+    SharedData.py
+
+    Data files and the XTS market-data session used by the Dashboard,
+    EntryManager and MDEngine. Everything is loaded on first use and only
+    once per process, so importing a module that uses them does no network
+    or file I/O, and two modules asking for the same file share one copy.
+
+    The static instrument data comes from the memory-mapped universe bundle
+    (see Universe.py) when it has been built, and from the JSON files
+    otherwise.
+"""
+import json
+import threading
+from datetime import datetime
+
+from Connect import XTSConnect
+from MarketDataSocketClient import MDSocket_io
+import Universe
+
+# API Credentials (Adjust to your real credentials)
+API_KEY = '0b84a5c57dcdf2b3a32261'
+API_SECRET = 'Djya854$gm'
+SOURCE = 'WebAPI'
+
+FUTURES_MAPPING_FILE = Universe.FUTURES_MAPPING_FILE        # SPID -> [buy leg, sell leg]
+CONTRACT_NAMES_FILE = Universe.CONTRACT_NAMES_FILE
+LOT_SIZE_FILE = Universe.LOT_SIZE_FILE
+EXCHANGE_INSTRUMENTS_FILE = Universe.EXCHANGE_INSTRUMENTS_FILE
+
+# Example expiry dates
+EXPIRY_DATES = [
+    datetime.strptime("2025-02-28", "%Y-%m-%d"),
+    datetime.strptime("2025-03-27", "%Y-%m-%d")
+]
+
+_cache = {}
+_lock = threading.RLock()
+
+
+def _once(key, load):
+    """Returns _cache[key], calling `load` to fill it on first use (once, even across threads)."""
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in _cache:
+            _cache[key] = load()
+        return _cache[key]
+
+
+def load_json(path):
+    """Parses a JSON data file on first use; later calls return the same object."""
+    def load():
+        with open(path, 'r') as f:
+            return json.load(f)
+    return _once(path, load)
+
+
+def universe():
+    """The memory-mapped universe bundle, or None if it is missing or stale."""
+    return _once('universe', Universe.open_bundle)
+
+
+def futures_mapping():
+    """Spread id -> its two legs. Doubles as the subscribable instruments mapping."""
+    bundle = universe()
+    return bundle.futures_mapping if bundle is not None else load_json(FUTURES_MAPPING_FILE)
+
+
+def contract_names():
+    """Instrument id -> display name."""
+    bundle = universe()
+    return bundle.names if bundle is not None else load_json(CONTRACT_NAMES_FILE)
+
+
+def lot_sizes():
+    """Instrument id -> lot size."""
+    bundle = universe()
+    return bundle.lot_sizes if bundle is not None else load_json(LOT_SIZE_FILE)
+
+
+def exchange_instruments():
+    """Instruments to subscribe to on the market data socket."""
+    bundle = universe()
+    if bundle is not None:
+        return _once('exchange_instruments', bundle.exchange_instruments)
+    return load_json(EXCHANGE_INSTRUMENTS_FILE)
+
+
+def market_data_session():
+    """
+    Logs in to XTS market data on first call and returns
+    (xt, token, user_id); later calls reuse the same session.
+    """
+    def login():
+        xt = XTSConnect(API_KEY, API_SECRET, SOURCE)
+        login_response = xt.marketdata_login()  # Obtain token for MarketData
+        return xt, login_response['result']['token'], login_response['result']['userID']
+    return _once('market_data_session', login)
+
+
+def market_data_socket():
+    """The MarketData socket for the shared session, created on first call."""
+    def connect():
+        _, token, user_id = market_data_session()
+        return MDSocket_io(token, user_id)
+    return _once('market_data_socket', connect)
@@ -0,0 +1,410 @@
+"""
+    SpreadEngine.py
+
+    Vectorised spread evaluation. The leg layout of every spread in
+    futures_mapping2.json is compiled into NumPy index arrays once; each
+    cycle gathers all leg quotes with a single TickStore.read_many and
+    computes leg selection, actual spread, profit and the entry condition
+    as whole-array operations.
+
+    MDEngine also keeps an engine in-process: each 1502 tick updates the
+    engine's cached quote and recomputes only the spreads that depend on
+    that instrument, then publishes those rows to the SpreadTable segment
+    that the Dashboard reads.
+"""
+import os
+import struct
+import time
+
+import numpy as np
+
+from TickStore import (ARENA_HEADER, HEADER_COUNTER_OFFSET, READ_RETRIES, QuoteBatch,
+                       _open_segment, _replace_segment, handle_pool, read_many)
+
+
+class SpreadResult:
+    """Arrays produced by one SpreadEngine.evaluate() call, one row per spread."""
+
+    def __init__(self, n):
+        self.ltp = np.zeros(n)
+        self.buy_leg = np.zeros(n, dtype=np.int64)
+        self.sell_leg = np.zeros(n, dtype=np.int64)
+        self.buy_ask = np.zeros(n)
+        self.sell_bid = np.zeros(n)
+        self.spread = np.zeros(n)
+        self.profit = np.zeros(n)
+        self.spread_found = np.zeros(n, dtype=bool)   # Spread contract has a tick
+        self.buy_found = np.zeros(n, dtype=bool)      # Buy leg has a tick
+        self.sell_found = np.zeros(n, dtype=bool)     # Sell leg has a tick
+        self.stale = np.zeros(n, dtype=bool)          # The spread's or a leg's tick is too old
+        self.entry = np.zeros(n, dtype=bool)          # Entry condition met (never on stale quotes)
+
+
+class SpreadEngine:
+    """
+    Evaluates every calendar spread in a {spread_id: [leg_1, leg_2]} mapping.
+
+    For each spread the buy leg is leg_1 when the spread LTP is positive and
+    leg_2 otherwise; actual_spread = |sell leg best bid - buy leg best ask|,
+    profit = actual_spread * lot size, and an entry is signalled when
+    0 < |LTP| < actual_spread.
+
+    A spread is stale when the tick of the spread contract or of either leg
+    was received more than `max_age_ms` ago (0 disables the check); stale
+    spreads are flagged and never signal an entry.
+    """
+
+    def __init__(self, spd, lotsizejson, max_age_ms=0):
+        self.errors = {}   # spread_id (str) -> error for mappings that cannot be evaluated
+        spread_ids, leg0, leg1 = [], [], []
+        for spid, legs in spd.items():
+            if len(legs) != 2:
+                self.errors[spid] = f"SPID {spid} has {len(legs)} related spids. Expected 2."
+                continue
+            spread_ids.append(int(spid))
+            leg0.append(int(legs[0]))
+            leg1.append(int(legs[1]))
+
+        self.keys = [str(spid) for spid in spread_ids]
+        self.spread_ids = np.array(spread_ids, dtype=np.int64)
+        self.leg0 = np.array(leg0, dtype=np.int64)
+        self.leg1 = np.array(leg1, dtype=np.int64)
+        self.lot_size = np.array([lotsizejson.get(key, 0) or 0 for key in self.keys], dtype=np.int64)
+
+        # Every instrument touched by any spread, read together each cycle
+        self.instrument_ids = np.unique(np.concatenate([self.spread_ids, self.leg0, self.leg1]))
+        self.spread_idx = np.searchsorted(self.instrument_ids, self.spread_ids)
+        self.leg0_idx = np.searchsorted(self.instrument_ids, self.leg0)
+        self.leg1_idx = np.searchsorted(self.instrument_ids, self.leg1)
+
+        self.max_age_ns = int(max_age_ms * 1_000_000)
+        self.quotes = QuoteBatch(self.instrument_ids, columns=('bid', 'ask', 'ltp', 'receive_ns'))
+        self.ages = QuoteBatch(self.instrument_ids, columns=('receive_ns',))
+        self.result = SpreadResult(len(self.spread_ids))
+
+        # Reverse index: instrument id -> rows of the spreads it is part of
+        self._position = {exchange_id: i for i, exchange_id in enumerate(self.instrument_ids.tolist())}
+        dependents = {}
+        for row, ids in enumerate(zip(self.spread_ids.tolist(), self.leg0.tolist(), self.leg1.tolist())):
+            for exchange_id in set(ids):
+                dependents.setdefault(exchange_id, []).append(row)
+        self.dependents = {key: np.array(rows, dtype=np.int64) for key, rows in dependents.items()}
+
+    def __len__(self):
+        return len(self.spread_ids)
+
+    def evaluate(self, arena=None):
+        """
+        Reads all leg quotes (from `arena`, or this process's reader handle)
+        and recomputes every spread. Returns the engine's SpreadResult, whose
+        arrays are overwritten on the next call.
+        """
+        if arena is None:
+            read_many(None, out=self.quotes)
+        else:
+            arena.read_many(None, out=self.quotes)
+        self._compute(slice(None))
+        return self.result
+
+    def _update_quote(self, exchange_id, data, received_ns=None):
+        """
+        Caches one instrument's quote, received at `received_ns` (default
+        now); returns the rows of the spreads using it, or None.
+        """
+        rows = self.dependents.get(exchange_id)
+        if rows is None:
+            return None
+
+        i = self._position[exchange_id]
+        bids = data.get("Bids") or ({},)
+        asks = data.get("Asks") or ({},)
+        quotes = self.quotes
+        quotes.ltp[i] = (data.get("Touchline") or {}).get("LastTradedPrice") or 0
+        quotes.bid[i] = bids[0].get("Price") or 0
+        quotes.ask[i] = asks[0].get("Price") or 0
+        quotes.receive_ns[i] = time.monotonic_ns() if received_ns is None else received_ns
+        quotes.valid[i] = True
+        return rows
+
+    def apply_tick(self, exchange_id, data, received_ns=None):
+        """
+        Updates the cached quote of one instrument from a decoded 1502
+        message and recomputes only the spreads depending on it. Returns the
+        recomputed rows, or None if no tracked spread uses the instrument.
+        Snapshot quotes pass SNAPSHOT_RECEIVED_NS so they count as stale.
+        """
+        rows = self._update_quote(exchange_id, data, received_ns)
+        if rows is not None:
+            self._compute(rows)
+        return rows
+
+    def apply_ticks(self, ticks):
+        """
+        apply_tick for a batch {instrument id: decoded 1502 message}: every
+        quote is updated first and each affected spread recomputed once,
+        however many of its instruments ticked.
+        """
+        changed = [rows for rows in (self._update_quote(exchange_id, data)
+                                     for exchange_id, data in ticks.items()) if rows is not None]
+        if not changed:
+            return None
+        rows = np.unique(np.concatenate(changed))
+        self._compute(rows)
+        return rows
+
+    def refresh(self, arena):
+        """
+        Re-reads every quote from `arena` and recomputes only the spreads
+        whose instruments were written since the last call, by whichever
+        process. Returns (recomputed rows or None, ids of the instruments
+        that changed).
+        """
+        before = self.quotes.seq.copy()
+        arena.read_many(None, out=self.quotes)
+        changed = self.quotes.seq != before
+        if not changed.any():
+            return None, self.instrument_ids[changed]
+        rows = np.flatnonzero(changed[self.spread_idx] | changed[self.leg0_idx] | changed[self.leg1_idx])
+        self._compute(rows)
+        return rows, self.instrument_ids[changed]
+
+    def _stale(self, quotes, rows, now):
+        """Rows whose spread contract or either leg has a tick older than max_age_ns."""
+        if self.max_age_ns and isinstance(rows, slice):
+            # Every row: judge each instrument once, then look the legs up
+            old = quotes.valid & (now - quotes.receive_ns > self.max_age_ns)
+            return old[self.spread_idx[rows]] | old[self.leg0_idx[rows]] | old[self.leg1_idx[rows]]
+        stale = np.zeros(len(self.spread_idx[rows]), dtype=bool)
+        if self.max_age_ns:
+            for idx in (self.spread_idx[rows], self.leg0_idx[rows], self.leg1_idx[rows]):
+                stale |= quotes.valid[idx] & (now - quotes.receive_ns[idx] > self.max_age_ns)
+        return stale
+
+    def stale_rows(self, arena=None):
+        """
+        Which rows are stale as of now, from the legs' current receive times
+        (read from `arena`, or this process's reader handle). Only that
+        column is read.
+        """
+        if not self.max_age_ns:
+            return np.zeros(len(self.spread_ids), dtype=bool)
+        if arena is None:
+            read_many(None, out=self.ages)
+        else:
+            arena.read_many(None, out=self.ages)
+        return self._stale(self.ages, slice(None), time.monotonic_ns())
+
+    def stale_count(self, arena=None):
+        """
+        Number of stale rows as of now. Without a tick rows only ever go
+        stale, so next to a tick-driven version this identifies the stale
+        column: it changes while the feed is silent, e.g. during an outage.
+        """
+        return int(np.count_nonzero(self.stale_rows(arena))) if self.max_age_ns else 0
+
+    def check_staleness(self, result=None, arena=None):
+        """
+        Re-evaluates `stale` (and withdraws entries) for every row of a
+        result that was computed earlier, e.g. read from the SpreadTable.
+        """
+        result = self.result if result is None else result
+        if not self.max_age_ns:
+            return result
+        result.stale[:] = self.stale_rows(arena)
+        result.entry &= ~result.stale
+        return result
+
+    def _compute(self, rows):
+        """Recomputes the spreads at `rows` (an index array or slice) from the cached quotes."""
+        quotes = self.quotes
+        res = self.result
+        spread_idx = self.spread_idx[rows]
+        leg0_idx = self.leg0_idx[rows]
+        leg1_idx = self.leg1_idx[rows]
+        leg0 = self.leg0[rows]
+        leg1 = self.leg1[rows]
+
+        ltp = quotes.ltp[spread_idx]
+        spread_found = quotes.valid[spread_idx]
+
+        # Positive LTP buys the first leg and sells the second; otherwise reversed
+        buy_first = ltp > 0
+        buy_idx = np.where(buy_first, leg0_idx, leg1_idx)
+        sell_idx = np.where(buy_first, leg1_idx, leg0_idx)
+
+        buy_found = quotes.valid[buy_idx]
+        sell_found = quotes.valid[sell_idx]
+        buy_ask = np.where(buy_found, quotes.ask[buy_idx], 0.0)
+        sell_bid = np.where(sell_found, quotes.bid[sell_idx], 0.0)
+        spread = np.abs(sell_bid - buy_ask)
+
+        res.ltp[rows] = ltp
+        res.spread_found[rows] = spread_found
+        res.buy_leg[rows] = np.where(buy_first, leg0, leg1)
+        res.sell_leg[rows] = np.where(buy_first, leg1, leg0)
+        res.buy_found[rows] = buy_found
+        res.sell_found[rows] = sell_found
+        res.buy_ask[rows] = buy_ask
+        res.sell_bid[rows] = sell_bid
+        res.spread[rows] = spread
+        res.profit[rows] = spread * self.lot_size[rows]
+        stale = self._stale(quotes, rows, time.monotonic_ns())
+        res.stale[rows] = stale
+        res.entry[rows] = (
+            spread_found & buy_found & sell_found & ~stale
+            & (np.abs(ltp) < spread) & (ltp != 0)
+        )
+
+
+########################################################################
+# Published spread table
+########################################################################
+SPREAD_TABLE_NAME = "spread_engine_spreads"
+SPREAD_TABLE_MAGIC = b'SESP'
+SPREAD_TABLE_VERSION = 1
+SPREAD_ROWS_OFFSET = 64
+
+# One row per spread, in SpreadEngine.keys order, each under its own seqlock
+SPREAD_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('spread_id', '<i8'),
+    ('buy_leg', '<i8'),
+    ('sell_leg', '<i8'),
+    ('ltp', '<f8'),
+    ('buy_ask', '<f8'),
+    ('sell_bid', '<f8'),
+    ('spread', '<f8'),
+    ('profit', '<f8'),
+    ('updated_ns', '<i8'),
+    ('flags', '<u4'),
+    ('reserved', '<u4'),
+])
+
+FLAG_SPREAD_FOUND = 0x1
+FLAG_BUY_FOUND = 0x2
+FLAG_SELL_FOUND = 0x4
+FLAG_ENTRY = 0x8
+FLAG_STALE = 0x10
+_FLAG_FIELDS = (
+    ('spread_found', FLAG_SPREAD_FOUND),
+    ('buy_found', FLAG_BUY_FOUND),
+    ('sell_found', FLAG_SELL_FOUND),
+    ('entry', FLAG_ENTRY),
+    ('stale', FLAG_STALE),
+)
+_VALUE_FIELDS = ('buy_leg', 'sell_leg', 'ltp', 'buy_ask', 'sell_bid', 'spread', 'profit')
+
+
+class SpreadTable:
+    """
+    Shared-memory table of computed spreads. MDEngine is the only writer and
+    publishes rows as ticks arrive; each publish bumps the header counter, so
+    readers can tell cheaply whether anything changed.
+    """
+
+    def __init__(self, shm, writable=False):
+        self.shm = shm
+        self.buf = shm.buf
+        self.writable = writable
+        magic, version, row_size, count, _, generation, _ = ARENA_HEADER.unpack_from(self.buf, 0)
+        if magic != SPREAD_TABLE_MAGIC or version != SPREAD_TABLE_VERSION or row_size != SPREAD_DTYPE.itemsize:
+            raise ValueError(f"Shared memory '{shm.name}' is not a compatible spread table")
+        self.name = shm.name
+        self.generation = generation
+        self.rows = np.ndarray((count,), dtype=SPREAD_DTYPE, buffer=self.buf, offset=SPREAD_ROWS_OFFSET)
+        self.spread_ids = self.rows['spread_id'].copy()
+
+    @classmethod
+    def create(cls, spread_ids, name=SPREAD_TABLE_NAME):
+        """Creates the table for `spread_ids`, replacing one built for other spreads."""
+        spread_ids = np.asarray(spread_ids, dtype=np.int64)
+        size = SPREAD_ROWS_OFFSET + len(spread_ids) * SPREAD_DTYPE.itemsize
+        try:
+            shm = _open_segment(name, create=True, size=max(size, 1))
+        except FileExistsError:
+            try:
+                table = cls(_open_segment(name), writable=True)
+                if np.array_equal(table.spread_ids, spread_ids):
+                    return table
+                table.close()
+            except ValueError:
+                pass
+            shm = _replace_segment(name, max(size, 1))
+
+        ARENA_HEADER.pack_into(
+            shm.buf, 0,
+            SPREAD_TABLE_MAGIC, SPREAD_TABLE_VERSION, SPREAD_DTYPE.itemsize,
+            len(spread_ids), len(spread_ids), int.from_bytes(os.urandom(8), 'little'), 0
+        )
+        table = cls(shm, writable=True)
+        table.rows['spread_id'] = spread_ids
+        table.spread_ids = spread_ids.copy()
+        return table
+
+    @classmethod
+    def attach(cls, name=SPREAD_TABLE_NAME):
+        """Attaches to an existing table for reading."""
+        return cls(_open_segment(name))
+
+    @property
+    def version(self):
+        """Publish counter; changes whenever any row was republished."""
+        return struct.unpack_from('<Q', self.buf, HEADER_COUNTER_OFFSET)[0]
+
+    def matches(self, engine):
+        """True if the table rows line up with `engine`'s spreads."""
+        return np.array_equal(self.spread_ids, engine.spread_ids)
+
+    def publish(self, result, rows=slice(None)):
+        """Writes `rows` of a SpreadResult under their seqlocks (writer only)."""
+        table = self.rows
+        seq = (table['seq'][rows] + 1) | 1
+        table['seq'][rows] = seq
+        for name in _VALUE_FIELDS:
+            table[name][rows] = getattr(result, name)[rows]
+        flags = np.zeros(len(table['flags'][rows]), dtype=np.uint32)
+        for name, bit in _FLAG_FIELDS:
+            flags[getattr(result, name)[rows]] |= bit
+        table['flags'][rows] = flags
+        table['updated_ns'][rows] = time.monotonic_ns()
+        table['seq'][rows] = seq + 1
+        struct.pack_into('<Q', self.buf, HEADER_COUNTER_OFFSET, self.version + 1)
+
+    def read(self, result):
+        """
+        Copies every row into `result` (a SpreadResult of matching length),
+        retrying rows caught mid-publish. Returns the publish counter read
+        before the copy.
+        """
+        version = self.version
+        seq_before = self.rows['seq'].copy()
+        snapshot = self.rows.copy()
+        torn = np.flatnonzero((seq_before & 1).astype(bool) | (self.rows['seq'] != seq_before))
+        for i in torn.tolist():
+            for attempt in range(READ_RETRIES):
+                before = self.rows['seq'][i]
+                if not before & 1:
+                    row = self.rows[i].copy()
+                    if self.rows['seq'][i] == before:
+                        snapshot[i] = row
+                        break
+                if attempt & 0xFF == 0xFF:
+                    time.sleep(0)
+            else:
+                snapshot['flags'][i] = 0  # Still locked: report as not found
+
+        for name in _VALUE_FIELDS:
+            getattr(result, name)[:] = snapshot[name]
+        for name, bit in _FLAG_FIELDS:
+            getattr(result, name)[:] = (snapshot['flags'] & bit).astype(bool)
+        return version
+
+    def close(self):
+        self.rows = None
+        self.buf = None
+        self.shm.close()
+
+
+def get_spread_table(name=SPREAD_TABLE_NAME):
+    """Returns this process's handle on the published spread table, or None."""
+    return handle_pool.get(name, factory=SpreadTable.attach)
@@ -0,0 +1,266 @@
+"""
+    SpreadService.py
+
+    Keeps the Dashboard's latest spread table in memory. A background worker
+    rebuilds it whenever its source changes and the Flask routes serve it
+    straight from memory; writing it to disk is an optional periodic snapshot.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+
+from LocalStore import write_json_atomic
+
+
+class SpreadSnapshotService:
+    """
+    Background worker maintaining the latest computed spread rows.
+
+    :param build: callable returning the spread rows dict (may create positions)
+    :param version: optional callable returning a cheap token that changes
+                    whenever the rows would change; None rebuilds every cycle
+    :param interval: seconds between worker cycles
+    :param snapshot_path: file to persist the rows to, or None to disable
+    :param snapshot_interval: seconds between disk snapshots
+    :param encode: optional callable turning the rows into the object served
+                   over HTTP (e.g. a columnar form); defaults to the rows
+    :param fresh_for: seconds a finished refresh is shared with later callers
+    """
+
+    def __init__(self, build, version=None, interval=0.05,
+                 snapshot_path=None, snapshot_interval=5.0, encode=None, fresh_for=0.0):
+        self.build = build
+        self.version = version
+        self.encode = encode
+        self.interval = interval
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+
+        self._rows = None            # Latest rows, replaced as a whole
+        self._token = None           # Source token the rows were built from
+        self._snapshot = None        # Snapshot of _rows: ETag + serialized body
+        self._builds = 0
+        self._built_at = 0.0
+        self._persisted_rows = None
+        self._persisted_at = 0.0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight(fresh_for)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Starts the worker thread once; safe to call on every request."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="SpreadSnapshotService", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def latest(self):
+        """Returns the latest rows, or None if nothing has been built yet."""
+        return self._rows
+
+    def snapshot(self):
+        """Returns the latest rows as a Snapshot (rows, etag, body()), or None."""
+        return self._snapshot
+
+    def refresh(self, force=False):
+        """
+        Rebuilds the rows now if the source changed (or `force`) and returns
+        them. Called by the worker and by /process-spread-data; concurrent or
+        back-to-back callers share one rebuild (see SingleFlight).
+        """
+        return self._flight.do(lambda: self._rebuild(force), force=force)
+
+    def _rebuild(self, force):
+        token = self.version() if self.version is not None else None
+        if force or token is None or token != self._token or self._rows is None:
+            self._rows = self.build()
+            self._token = token
+            self._builds += 1
+            self._snapshot = Snapshot(self._rows, make_etag(token, self._builds), self.encode)
+            self._built_at = time.monotonic()
+        return self._rows
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # The worker's own cycle is never answered from the freshness
+                # window (it would skip every other cycle); it still joins a
+                # rebuild already in flight.
+                self._flight.do(lambda: self._rebuild(False), force=True)
+                self._maybe_persist()
+            except Exception as e:
+                print(f"Spread snapshot worker error: {e}")
+            self._stop.wait(self.interval)
+
+    def _maybe_persist(self):
+        """Writes the rows to disk every `snapshot_interval` seconds if they changed."""
+        if not self.snapshot_path:
+            return
+        rows = self._rows
+        now = time.monotonic()
+        if rows is None or rows is self._persisted_rows or now - self._persisted_at < self.snapshot_interval:
+            return
+        write_json_atomic(self.snapshot_path, rows)
+        self._persisted_rows = rows
+        self._persisted_at = now
+
+
+class SingleFlight:
+    """
+    Request coalescing: at most one call runs at a time. Callers arriving
+    while it runs wait for it and get its result; callers arriving within
+    `fresh_for` seconds after it finished get that result without a new call.
+    `force` skips the freshness window but still joins a call in flight.
+    """
+
+    def __init__(self, fresh_for=0.0):
+        self.fresh_for = fresh_for
+        self._lock = threading.Lock()
+        self._call = None            # Call in flight
+        self._last = None            # Last finished call
+        self._finished_at = 0.0
+
+    def do(self, fn, force=False):
+        with self._lock:
+            if self._call is not None:
+                call, leader = self._call, False
+            else:
+                last = self._last
+                if (not force and last is not None and last.error is None
+                        and time.monotonic() - self._finished_at < self.fresh_for):
+                    return last.result
+                call = self._call = _Call()
+                leader = True
+        if not leader:
+            return call.wait()
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+        with self._lock:
+            self._call = None
+            self._last = call
+            self._finished_at = time.monotonic()
+        call.done.set()
+        return call.wait()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+GZIP_MIN_BYTES = 1024     # Smaller bodies are sent uncompressed
+
+
+class Snapshot:
+    """
+    One version of the spread rows with its ETag. The JSON body (and its
+    gzip form) is serialized on first use and then shared by every response
+    for this version.
+    """
+
+    def __init__(self, rows, etag, encode=None):
+        self.rows = rows
+        self.etag = etag
+        self.encode = encode
+        self._body = None
+        self._gzipped = None
+
+    def body(self):
+        if self._body is None:
+            data = self.encode(self.rows) if self.encode is not None else self.rows
+            self._body = json.dumps(data, separators=(',', ':')).encode()
+        return self._body
+
+    def gzipped(self):
+        """The gzip-compressed body, or None when it is too small to be worth it."""
+        if self._gzipped is None:
+            self._gzipped = gzip_body(self.body())
+        return self._gzipped or None
+
+
+def gzip_body(body):
+    """Compresses a response body; returns b'' if compression would not help."""
+    if len(body) < GZIP_MIN_BYTES:
+        return b''
+    compressed = gzip.compress(body, compresslevel=5)
+    return compressed if len(compressed) < len(body) else b''
+
+
+def make_etag(token, builds=0):
+    """
+    ETag for a source token (a tuple of ints such as shared-memory
+    generation and sequence counters). Without a token, the process id and
+    build count stand in so every rebuild still gets a new tag.
+    """
+    if token is None:
+        return f"{os.getpid():x}-b{builds}"
+    return '-'.join(f"{int(part):x}" for part in token)
+
+
+class DeltaChannel:
+    """
+    Versioned delta encoder for a dict of rows keyed by id (spreads by SPID,
+    positions by spread_id). Clients load `snapshot()` once, then apply each
+    delta whose `base` equals their version; on a mismatch they ask for a
+    fresh snapshot.
+
+    Delta format: {"base": v, "version": v + 1,
+                   "changed": {id: {field: value}},   # only changed fields
+                   "replaced": [id, ...],             # rows in "changed" sent whole
+                   "removed": [id, ...]}
+    """
+
+    def __init__(self):
+        self._state = (0, {})
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        version, rows = self._state
+        return {"version": version, "rows": rows}
+
+    def update(self, rows):
+        """Diffs `rows` against the previous state; returns the delta or None if unchanged."""
+        with self._lock:
+            version, previous = self._state
+            changed = {}
+            replaced = []
+            for key, row in rows.items():
+                old = previous.get(key)
+                if old == row:
+                    continue
+                if old is None or old.keys() != row.keys():
+                    changed[key] = row
+                    replaced.append(key)
+                else:
+                    changed[key] = {field: value for field, value in row.items() if old[field] != value}
+            removed = [key for key in previous if key not in rows]
+            if not changed and not removed:
+                return None
+
+            self._state = (version + 1, rows)
+            return {
+                "base": version,
+                "version": version + 1,
+                "changed": changed,
+                "replaced": replaced,
+                "removed": removed
+            }
@@ -0,0 +1,139 @@
+"""
+    SubscriptionQuota.py
+
+    Keeps MDEngine inside the XTS limit on instruments per market data
+    session. MDEngine records how each subscribed spread is used: when it
+    was subscribed or last viewed / traded on a Dashboard, and how often its
+    instruments tick. When the subscribed instruments exceed the quota, the
+    least recently used spreads are unsubscribed (quietest first among
+    equals), except where that would drop an instrument an open position in
+    SpreadEntryManager depends on.
+"""
+import json
+import math
+import os
+import time
+
+from LocalStore import write_json_atomic
+
+TICK_RATE_HALF_LIFE_S = 60.0     # Tick rates are averaged over roughly the last minute
+TICK_RATES_FILE = 'data/tick_rates.json'   # Last known rates, to balance feed shards at startup
+
+
+class QuotaManager:
+    """
+    Evicts idle spreads from a SubscriptionRegistry once it holds more than
+    `quota` instruments. Not thread-safe: MDEngine calls it from one thread,
+    apart from on_tick (from the tick writer), which only updates one entry
+    of a dict.
+    """
+
+    def __init__(self, registry, quota, entry_manager):
+        self.registry = registry
+        self.quota = quota
+        self.entry_manager = entry_manager
+        self.last_used = {}     # Spread key -> time.monotonic() of its last subscribe / view / order
+        self.tick_rates = {}    # Instrument id -> (ticks per second, time of the last tick)
+        self._known = None      # Spreads seen subscribed by the last enforce()
+        self._positions = (None, set())
+
+    # --------------------------------------------------------------------------
+    # Usage
+    # --------------------------------------------------------------------------
+    def on_tick(self, exchange_id, now=None, count=1):
+        """Counts `count` ticks in the instrument's exponentially decaying tick rate."""
+        now = time.monotonic() if now is None else now
+        rate, last = self.tick_rates.get(exchange_id, (0.0, now))
+        decay = 0.5 ** ((now - last) / TICK_RATE_HALF_LIFE_S)
+        self.tick_rates[exchange_id] = (rate * decay + count * math.log(2) / TICK_RATE_HALF_LIFE_S, now)
+
+    def tick_rate(self, exchange_id, now=None):
+        now = time.monotonic() if now is None else now
+        rate, last = self.tick_rates.get(exchange_id, (0.0, now))
+        return rate * 0.5 ** ((now - last) / TICK_RATE_HALF_LIFE_S)
+
+    def save_tick_rates(self, path=TICK_RATES_FILE):
+        now = time.monotonic()
+        write_json_atomic(path, {str(i): self.tick_rate(i, now) for i in list(self.tick_rates)})
+
+    def load_tick_rates(self, path=TICK_RATES_FILE):
+        """Starts from the rates saved by the previous run, if any."""
+        try:
+            with open(path) as f:
+                rates = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        now = time.monotonic()
+        for exchange_id, rate in rates.items():
+            self.tick_rates.setdefault(int(exchange_id), (float(rate), now))
+
+    def touch(self, keys, now=None):
+        """Marks spreads as just used (viewed or traded on a Dashboard)."""
+        now = time.monotonic() if now is None else now
+        for key in keys:
+            self.last_used[str(key)] = now
+
+    def protected_instruments(self):
+        """Instruments open positions depend on. The CSV is only re-read when it changes."""
+        try:
+            st = os.stat(self.entry_manager.csv_file)
+            key = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return set()
+        if key != self._positions[0]:
+            self._positions = (key, self.entry_manager.position_instrument_ids())
+        return self._positions[1]
+
+    # --------------------------------------------------------------------------
+    # Eviction
+    # --------------------------------------------------------------------------
+    def enforce(self):
+        """
+        Unsubscribes least recently used spreads until the registry is back
+        within the quota. Returns the instruments to unsubscribe from the
+        socket, as [{"exchangeSegment", "exchangeInstrumentID"}].
+        """
+        spreads, refcounts = self.registry.counts()
+        now = time.monotonic()
+        # Spreads subscribed since the last check count as just used (those
+        # found at startup have no known use yet)
+        if self._known is not None:
+            for key in spreads - self._known:
+                self.last_used.setdefault(key, now)
+        self._known = spreads
+
+        excess = len(refcounts) - self.quota
+        if excess <= 0:
+            return []
+
+        protected = self.protected_instruments()
+
+        def idleness(key):
+            ids = self.registry.instrument_ids(key)
+            return self.last_used.get(key, 0.0), sum(self.tick_rate(i, now) for i in ids)
+
+        victims = []
+        for key in sorted(spreads, key=idleness):
+            if excess <= 0:
+                break
+            ids = self.registry.instrument_ids(key)
+            freed = [i for i in ids if refcounts.get(i) == 1]
+            if not freed or protected.intersection(freed):
+                continue    # Frees nothing, or would starve an open position
+            for i in ids:
+                refcounts[i] -= 1
+            excess -= len(freed)
+            victims.append(key)
+
+        if excess > 0:
+            print(f"⚠️ Subscription quota {self.quota} exceeded by {excess}: "
+                  f"the remaining spreads back open positions")
+        if not victims:
+            return []
+        removed = self.registry.unsubscribe(victims)
+        for key in victims:
+            self.last_used.pop(key, None)
+        self._known -= set(victims)
+        print(f"🧹 Evicted {len(victims)} idle spreads ({len(removed)} instruments) to stay within "
+              f"the subscription quota of {self.quota}")
+        return removed
@@ -0,0 +1,278 @@
+"""
+    SubscriptionRegistry.py
+
+    The subscribed spreads, shared by every Dashboard worker and MDEngine.
+
+    A spread subscribes its own instrument and its legs. Legs are shared
+    between spreads (a month's future is a leg of two calendar spreads), so
+    the registry reference-counts instruments: an instrument is subscribed
+    while at least one subscribed spread needs it, and appears once in the
+    instrument list however many spreads share it.
+
+    State is persisted as
+
+        data/subscriptions.json          snapshot: compaction generation + instrument list
+        data/subscriptions.json.journal  one JSON line per change since it
+
+    A change appends one line to the journal under the file lock instead of
+    rewriting the list; every JOURNAL_COMPACT_LINES changes the snapshot is
+    rewritten atomically under the next compaction generation and the
+    journal started afresh with that generation as its first line. Each
+    process keeps the registry in memory and catches up by reading only the
+    journal lines appended since it last looked, while the generation is
+    unchanged.
+"""
+import json
+import os
+import re
+import threading
+
+import SharedData
+from LocalStore import FileLock, write_json_atomic
+
+SUBSCRIPTIONS_FILE = 'data/subscriptions.json'
+FUTURES_SEGMENT = 2
+JOURNAL_COMPACT_LINES = 256
+
+# Calendar spread names are <underlying><month 1><month 2>FUT, e.g. NIFTY25FEB25MARFUT
+_SPREAD_NAME = re.compile(r'^(.+?)(\d{2}[A-Z]{3}){2}FUT$')
+
+
+def underlying_of(name):
+    """The underlying of a calendar spread name, or None if it is not one."""
+    match = _SPREAD_NAME.match(name or '')
+    return match.group(1) if match else None
+
+
+class SubscriptionRegistry:
+    """
+    Set of subscribed spread keys plus instrument reference counts.
+
+    `subscribe` / `unsubscribe` take several spread keys at once and return
+    only the instruments whose subscription actually changed, which is what
+    has to be sent to the market data socket.
+    """
+
+    def __init__(self, path=SUBSCRIPTIONS_FILE):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.lock = FileLock(f"{path}.lock")
+        self.spreads = set()        # Subscribed spread keys (str)
+        self.refcounts = {}         # Instrument id -> number of spreads needing it
+        self.segments = {}          # Instrument id -> exchange segment
+        self._journal = None        # (generation, bytes applied or None, lines applied) of the journal
+        self._underlyings = None
+        self._mutex = threading.RLock()     # Serializes this process's threads
+
+    # --------------------------------------------------------------------------
+    # Loading
+    # --------------------------------------------------------------------------
+    def _load(self):
+        """Rebuilds the in-memory state from the snapshot and the whole journal (under the lock)."""
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = []
+        if isinstance(snapshot, list):
+            snapshot = {"generation": 0, "instruments": snapshot}     # Written before generations
+        mapping = SharedData.futures_mapping()
+
+        self.spreads = set()
+        self.refcounts = {}
+        self.segments = {}
+        spreads = [str(inst['exchangeInstrumentID']) for inst in snapshot['instruments']
+                   if str(inst['exchangeInstrumentID']) in mapping]
+        self._add(spreads)
+        # Counts are rebuilt from the spreads alone: instruments no spread needs are dropped
+        orphans = [inst['exchangeInstrumentID'] for inst in snapshot['instruments']
+                   if inst['exchangeInstrumentID'] not in self.refcounts]
+        if orphans:
+            print(f"⚠️ Dropping {len(orphans)} subscribed instruments no spread needs: {orphans}")
+
+        generation = snapshot['generation']
+        self._journal = (generation, None, 0)
+        if not self._read_journal():
+            # Journal left from before the snapshot was compacted (crash in between): already applied
+            self._start_journal(generation)
+
+    def _read_journal(self):
+        """
+        Applies the journal lines appended since the last call. Returns False,
+        applying nothing, if the journal was replaced (compacted) meanwhile.
+
+        Each journal starts with a header line holding the compaction
+        generation it continues, so a replaced journal is told apart even
+        when the filesystem reuses the old file's inode.
+        """
+        generation, offset, lines = self._journal
+        try:
+            with open(self.journal_path, 'rb') as f:
+                header = f.readline()
+                if header.endswith(b'\n') and b'generation' in header:
+                    current = json.loads(header)['generation']
+                else:
+                    current, header = 0, b''     # Journal written before generations
+                if current != generation:
+                    return False
+                if offset is None:
+                    offset = len(header)
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            # Nothing appended since the snapshot, unless this process saw lines already
+            return offset is None or lines == 0
+        # Only whole lines: a writer may be part-way through the last one
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            if entry['op'] == '+':
+                self._add(entry['spreads'])
+            else:
+                self._remove(entry['spreads'])
+            lines += 1
+        self._journal = (generation, offset + end, lines)
+        return True
+
+    def refresh(self, locked=False):
+        """Catches up with changes made by other processes (`locked`: the caller holds the file lock)."""
+        with self._mutex:
+            if self._journal is not None and self._read_journal():
+                return
+            # First use, or the journal was compacted: reload consistently
+            if locked:
+                self._load()
+            else:
+                with self.lock:
+                    self._load()
+
+    # --------------------------------------------------------------------------
+    # Reference counting
+    # --------------------------------------------------------------------------
+    def instrument_ids(self, key):
+        """A spread's own instrument id followed by its legs'."""
+        return [int(key)] + [int(leg) for leg in SharedData.futures_mapping()[key]]
+
+    def _add(self, keys):
+        mapping = SharedData.futures_mapping()
+        added = []
+        for key in keys:
+            if key in self.spreads or key not in mapping:
+                continue    # Already subscribed, or dropped from the mapping since it was journaled
+            self.spreads.add(key)
+            for exchange_id in self.instrument_ids(key):
+                count = self.refcounts.get(exchange_id, 0)
+                if count == 0:
+                    self.segments[exchange_id] = FUTURES_SEGMENT
+                    added.append(exchange_id)
+                self.refcounts[exchange_id] = count + 1
+        return added
+
+    def _remove(self, keys):
+        removed = []
+        for key in keys:
+            if key not in self.spreads:
+                continue
+            self.spreads.discard(key)
+            for exchange_id in self.instrument_ids(key):
+                count = self.refcounts.get(exchange_id, 0) - 1
+                if count > 0:
+                    self.refcounts[exchange_id] = count
+                elif exchange_id in self.refcounts:
+                    del self.refcounts[exchange_id]
+                    removed.append(exchange_id)
+        return removed
+
+    def _instruments(self, ids):
+        return [{"exchangeSegment": self.segments.get(exchange_id, FUTURES_SEGMENT),
+                 "exchangeInstrumentID": exchange_id} for exchange_id in ids]
+
+    # --------------------------------------------------------------------------
+    # Changes
+    # --------------------------------------------------------------------------
+    def _change(self, op, keys):
+        mapping = SharedData.futures_mapping()
+        keys = list(dict.fromkeys(str(key) for key in keys if str(key) in mapping))
+        with self._mutex, self.lock:
+            self.refresh(locked=True)
+            if op == '+':
+                keys = [key for key in keys if key not in self.spreads]
+                changed = self._add(keys)
+            else:
+                keys = [key for key in keys if key in self.spreads]
+                changed = self._remove(keys)
+            if keys:
+                self._append(op, keys)
+            return self._instruments(changed)
+
+    def _append(self, op, keys):
+        """Appends one journal line (under the lock), compacting the journal when it grows long."""
+        generation, offset, lines = self._journal
+        if lines + 1 >= JOURNAL_COMPACT_LINES:
+            self._compact()
+            return
+        if offset is None:
+            generation, offset, lines = self._start_journal(generation)
+        with open(self.journal_path, 'ab') as f:
+            line = json.dumps({"op": op, "spreads": keys}, separators=(',', ':')).encode() + b'\n'
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal = (generation, offset + len(line), lines + 1)
+
+    def _start_journal(self, generation):
+        """Atomically replaces the journal with an empty one of `generation` (under the lock)."""
+        header = json.dumps({"generation": generation}).encode() + b'\n'
+        empty = f"{self.journal_path}.{os.getpid()}.tmp"
+        with open(empty, 'wb') as f:
+            f.write(header)
+        os.replace(empty, self.journal_path)
+        self._journal = (generation, len(header), 0)
+        return self._journal
+
+    def _compact(self):
+        """Writes the current state as the next generation's snapshot and starts its journal (under the lock)."""
+        generation = self._journal[0] + 1
+        write_json_atomic(self.path, {"generation": generation, "instruments": self.instrument_list()})
+        self._start_journal(generation)
+
+    def subscribe(self, keys):
+        """Subscribes the spreads; returns the instruments that were not subscribed before."""
+        return self._change('+', keys)
+
+    def unsubscribe(self, keys):
+        """Unsubscribes the spreads; returns the instruments no remaining spread needs."""
+        return self._change('-', keys)
+
+    # --------------------------------------------------------------------------
+    # Queries
+    # --------------------------------------------------------------------------
+    def instrument_list(self):
+        """Every subscribed instrument once, as [{"exchangeSegment", "exchangeInstrumentID"}]."""
+        return self._instruments(self.refcounts)
+
+    def instruments(self):
+        with self._mutex:
+            self.refresh()
+            return self.instrument_list()
+
+    def subscribed_spreads(self):
+        with self._mutex:
+            self.refresh()
+            return set(self.spreads)
+
+    def counts(self):
+        """(subscribed spread keys, {instrument id: reference count}), read consistently."""
+        with self._mutex:
+            self.refresh()
+            return set(self.spreads), dict(self.refcounts)
+
+    def spreads_for_underlying(self, underlying):
+        """Every calendar spread key of an underlying, e.g. 'NIFTY'."""
+        if self._underlyings is None:
+            names = SharedData.contract_names()
+            underlyings = {}
+            for key in SharedData.futures_mapping():
+                underlyings.setdefault(underlying_of(names.get(key)), []).append(key)
+            self._underlyings = underlyings
+        return list(self._underlyings.get((underlying or '').strip().upper(), []))
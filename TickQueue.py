@@ -0,0 +1,118 @@
+"""
+    TickQueue.py
+
+    Hand-off between MDEngine's socket thread and its shared-memory writer.
+
+    The socket thread only appends the raw 1502 payload to a bounded deque
+    and returns, so a slow write never backs up the websocket. A writer
+    thread drains everything queued, decodes it, keeps the latest update of
+    each instrument and hands that batch over in one call: a burst of ticks
+    on a hot instrument costs one write, not one per tick.
+
+    The deque is bounded so a stalled writer cannot exhaust memory; when it
+    is full the oldest payloads are dropped (and counted), since newer ticks
+    supersede them.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+TICK_QUEUE_SIZE = 100_000         # Raw payloads held at most while the writer is busy
+DROP_REPORT_SECONDS = 5.0         # Dropped payloads are reported at most this often
+
+
+def conflate(payloads):
+    """
+    Decodes raw 1502 payloads into {instrument id: latest decoded message},
+    in arrival order. Returns (latest, ticks per instrument, invalid payloads).
+    """
+    latest = {}
+    counts = {}
+    invalid = 0
+    for payload in payloads:
+        try:
+            data = json.loads(payload) if isinstance(payload, (str, bytes)) else payload
+            exchange_id = int(data["ExchangeInstrumentID"])
+        except (ValueError, TypeError, KeyError):
+            invalid += 1
+            continue
+        latest[exchange_id] = data
+        counts[exchange_id] = counts.get(exchange_id, 0) + 1
+    return latest, counts, invalid
+
+
+class TickQueue:
+    """
+    Bounded queue of raw payloads with one conflating consumer thread.
+
+    `write_batch(latest, counts)` is called on the writer thread with the
+    conflated batch: {instrument id: decoded message} and {instrument id:
+    ticks received since the last batch}.
+    """
+
+    def __init__(self, write_batch, maxlen=TICK_QUEUE_SIZE, name="tick-writer"):
+        self.write_batch = write_batch
+        self.maxlen = maxlen
+        self.name = name
+        self.pending = deque(maxlen=maxlen)
+        self.ready = threading.Event()
+        self.received = 0           # Payloads pushed
+        self.dropped = 0            # Payloads pushed out of a full queue unwritten
+        self.written = 0            # Instrument updates written
+        self._reported = 0
+        self._thread = None
+
+    def push(self, payload):
+        """Queues a raw payload (socket thread). Never blocks."""
+        if len(self.pending) == self.maxlen:
+            self.dropped += 1
+        self.pending.append(payload)
+        self.received += 1
+        self.ready.set()
+
+    def drain(self):
+        """Removes and returns everything queued so far."""
+        payloads = []
+        pending = self.pending
+        try:
+            while True:
+                payloads.append(pending.popleft())
+        except IndexError:
+            return payloads
+
+    def flush(self):
+        """Conflates and writes whatever is queued. Returns the number of instruments written."""
+        payloads = self.drain()
+        if not payloads:
+            return 0
+        latest, counts, invalid = conflate(payloads)
+        if invalid:
+            print(f"❌ Skipped {invalid} invalid market data payloads")
+        if latest:
+            self.write_batch(latest, counts)
+            self.written += len(latest)
+        return len(latest)
+
+    def run(self):
+        """Writer loop: waits for payloads, then writes them in conflated batches."""
+        last_report = time.monotonic()
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Writing market data failed: {e}")
+            now = time.monotonic()
+            if self.dropped != self._reported and now - last_report >= DROP_REPORT_SECONDS:
+                print(f"⚠️ Tick queue full: dropped {self.dropped - self._reported} payloads")
+                self._reported = self.dropped
+                last_report = now
+
+    def start(self):
+        """Starts the writer thread (once)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
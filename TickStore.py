@@ -0,0 +1,802 @@
+"""
+    TickStore.py
+
+    Fixed-layout binary tick records for the shared-memory market data store.
+    MDEngine packs each 1502 depth message into one record; Dashboard and
+    SpreadProcessor unpack it without going through JSON.
+
+    Every record starts with a sequence counter used as a seqlock: the writer
+    makes it odd before touching the body and even again afterwards, and
+    readers retry until they see the same even value on both sides of the copy.
+
+    All records live in a single arena segment (see TickArena) with an index
+    table mapping ExchangeInstrumentID to a slot, so consumers attach once.
+"""
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from multiprocessing import parent_process, resource_tracker, shared_memory
+
+import numpy as np
+
+########################################################################
+# Record layout
+########################################################################
+RECORD_VERSION = 2        # Bump whenever the layout below changes
+DEPTH_LEVELS = 5          # Bid/ask levels stored per instrument
+
+# Little-endian, naturally aligned, 8-byte sequence + 256-byte body:
+#   sequence u64 (seqlock, odd while a write is in progress)
+#   version u32 | flags u32 | exchangeSegment i32 | reserved i32
+#   exchangeInstrumentID i64 | LTP f64 | LTQ i64
+#   exchange timestamp i64 | receive time (monotonic ns) i64
+#   bid price f64[5] | ask price f64[5] | bid qty i64[5] | ask qty i64[5]
+#   bid orders i32[5] | ask orders i32[5]
+SEQ_STRUCT = struct.Struct('<Q')
+BODY_STRUCT = struct.Struct(
+    '<IIiiqdqqq'
+    f'{DEPTH_LEVELS}d{DEPTH_LEVELS}d'
+    f'{DEPTH_LEVELS}q{DEPTH_LEVELS}q'
+    f'{DEPTH_LEVELS}i{DEPTH_LEVELS}i'
+)
+BODY_OFFSET = SEQ_STRUCT.size
+RECORD_SIZE = BODY_OFFSET + BODY_STRUCT.size
+
+# The same layout as a NumPy structured dtype, for vectorised reads
+_n = DEPTH_LEVELS
+RECORD_DTYPE = np.dtype({
+    'names': ['seq', 'version', 'flags', 'segment', 'reserved', 'exchange_instrument_id',
+              'ltp', 'ltq', 'exchange_ts', 'receive_ns',
+              'bid_price', 'ask_price', 'bid_qty', 'ask_qty', 'bid_orders', 'ask_orders'],
+    'formats': ['<u8', '<u4', '<u4', '<i4', '<i4', '<i8',
+                '<f8', '<i8', '<i8', '<i8',
+                ('<f8', (_n,)), ('<f8', (_n,)), ('<i8', (_n,)), ('<i8', (_n,)),
+                ('<i4', (_n,)), ('<i4', (_n,))],
+    'offsets': [0, 8, 12, 16, 20, 24, 32, 40, 48, 56,
+                64, 64 + 8 * _n, 64 + 16 * _n, 64 + 24 * _n, 64 + 32 * _n, 64 + 36 * _n],
+    'itemsize': RECORD_SIZE,
+})
+assert 64 + 40 * _n == RECORD_SIZE
+
+FLAG_VALID = 0x1          # Set once a record has been written
+SNAPSHOT_RECEIVED_NS = 0  # receive_ns of a get_quote snapshot: as old as can be, never fresh
+READ_RETRIES = 10000      # Seqlock retries before a reader gives up
+
+_EMPTY_LEVEL = {}
+
+
+def _levels(book, key, cast):
+    """Returns DEPTH_LEVELS values of `key` from a Bids/Asks list, zero padded."""
+    book = book or ()
+    values = [cast(level.get(key) or 0) for level in book[:DEPTH_LEVELS]]
+    values.extend([cast(0)] * (DEPTH_LEVELS - len(values)))
+    return values
+
+
+def pack_tick(buf, data, offset=0, columns=None, slot=0, received_ns=None):
+    """
+    Packs a decoded 1502 message into `buf` at `offset` under the seqlock.
+    Only one process may write a given record. With `columns` (a TickArena's
+    contiguous top-of-book columns) the same tick is mirrored into row
+    `slot` of them, under the same sequence number. `received_ns` defaults
+    to now; SNAPSHOT_RECEIVED_NS marks a quote that was never streamed.
+    """
+    touchline = data.get("Touchline") or _EMPTY_LEVEL
+    bids = data.get("Bids")
+    asks = data.get("Asks")
+
+    # Odd sequence: write in progress (also recovers from a writer that died mid-write)
+    seq = (SEQ_STRUCT.unpack_from(buf, offset)[0] + 1) | 1
+    SEQ_STRUCT.pack_into(buf, offset, seq)
+    if columns is not None:
+        columns['seq'][slot] = seq
+    body = (
+        RECORD_VERSION,
+        FLAG_VALID,
+        int(data.get("ExchangeSegment") or 0),
+        0,
+        int(data.get("ExchangeInstrumentID") or 0),
+        float(touchline.get("LastTradedPrice") or 0),
+        int(touchline.get("LastTradedQunatity") or 0),
+        int(data.get("ExchangeTimeStamp") or 0),
+        time.monotonic_ns() if received_ns is None else received_ns,
+        *_levels(bids, "Price", float),
+        *_levels(asks, "Price", float),
+        *_levels(bids, "Size", int),
+        *_levels(asks, "Size", int),
+        *_levels(bids, "TotalOrders", int),
+        *_levels(asks, "TotalOrders", int),
+    )
+    BODY_STRUCT.pack_into(buf, offset + BODY_OFFSET, *body)
+    if columns is not None:
+        n = DEPTH_LEVELS
+        columns['ltp'][slot] = body[5]
+        columns['ltq'][slot] = body[6]
+        columns['exchange_ts'][slot] = body[7]
+        columns['receive_ns'][slot] = body[8]
+        columns['bid'][slot] = body[9]
+        columns['ask'][slot] = body[9 + n]
+        columns['bid_qty'][slot] = body[9 + 2 * n]
+        columns['ask_qty'][slot] = body[9 + 3 * n]
+        columns['seq'][slot] = seq + 1
+    # Even sequence: record is consistent again
+    SEQ_STRUCT.pack_into(buf, offset, seq + 1)
+
+
+def unpack_tick(buf, offset=0):
+    """
+    Unpacks the record at `offset` into a dict shaped like the 1502 message
+    (Touchline / Bids / Asks). Retries while the writer is mid-update, so the
+    result is never torn. Returns None if the record is empty, was written
+    with a different layout version, or stays locked for READ_RETRIES tries.
+    """
+    for attempt in range(READ_RETRIES):
+        seq = SEQ_STRUCT.unpack_from(buf, offset)[0]
+        if not seq & 1:
+            fields = BODY_STRUCT.unpack_from(buf, offset + BODY_OFFSET)
+            if SEQ_STRUCT.unpack_from(buf, offset)[0] == seq:
+                break
+        if attempt & 0xFF == 0xFF:
+            time.sleep(0)  # Let the writer run if it was preempted mid-write
+    else:
+        return None
+
+    if fields[0] != RECORD_VERSION or not fields[1] & FLAG_VALID:
+        return None
+
+    n = DEPTH_LEVELS
+    bid_price = fields[9:9 + n]
+    ask_price = fields[9 + n:9 + 2 * n]
+    bid_qty = fields[9 + 2 * n:9 + 3 * n]
+    ask_qty = fields[9 + 3 * n:9 + 4 * n]
+    bid_orders = fields[9 + 4 * n:9 + 5 * n]
+    ask_orders = fields[9 + 5 * n:9 + 6 * n]
+
+    return {
+        "Sequence": seq,
+        "ExchangeSegment": fields[2],
+        "ExchangeInstrumentID": fields[4],
+        "ExchangeTimeStamp": fields[7],
+        "ReceiveTimeNs": fields[8],
+        "Touchline": {
+            "LastTradedPrice": fields[5],
+            "LastTradedQunatity": fields[6],
+        },
+        "Bids": [
+            {"Price": bid_price[i], "Size": bid_qty[i], "TotalOrders": bid_orders[i]}
+            for i in range(n)
+        ],
+        "Asks": [
+            {"Price": ask_price[i], "Size": ask_qty[i], "TotalOrders": ask_orders[i]}
+            for i in range(n)
+        ],
+    }
+
+
+########################################################################
+# Instrument arena
+########################################################################
+ARENA_NAME = "spread_engine_ticks"   # One segment for the whole universe
+ARENA_CAPACITY = 8192                # Instrument slots preallocated at startup; at most this
+                                     # many instruments can be subscribed at once
+ARENA_MAGIC = b'SETK'
+ARENA_VERSION = 5                    # Bump whenever the arena header or layout changes
+
+# Header: magic | arena version u32 | record version u32 | capacity u32 |
+#         slot count u32 | generation u64 | clear counter u64
+#         (then at FEED_STATE_OFFSET: feed state u32 | changed at, monotonic ns u64,
+#          at INDEX_EPOCH_OFFSET: index epoch u32 and at HEARTBEAT_OFFSET: the
+#          writer's last heartbeat, monotonic ns u64)
+# followed by the index table (ExchangeInstrumentID i64 per slot, in slot
+# order, FREE_SLOT where the instrument was removed), `capacity` tick
+# records and then the top-of-book columns: one contiguous array per
+# COLUMN_LAYOUT entry, index = slot. The columns repeat the record's
+# sequence number and top of book, written under the same seqlock, so
+# read_many gathers from a few dense arrays instead of striding over the
+# records.
+ARENA_HEADER = struct.Struct('<4sIIIIQQ')
+INDEX_OFFSET = 64
+_COUNT_OFFSET = 16
+HEADER_COUNTER_OFFSET = 28          # Header u64 only the creator bumps: the arena's clear counter, a table's publish counter
+FEED_STATE_OFFSET = 40
+FEED_STATE_STRUCT = struct.Struct('<IQ')
+FEED_DOWN = 0                       # Not streaming: prices may be stale (the initial state)
+FEED_LIVE = 1                       # Streaming, and every instrument refreshed since (re)connecting
+INDEX_EPOCH_OFFSET = 52             # u32 bumped whenever a slot is freed or reused
+HEARTBEAT_OFFSET = 56               # u64 monotonic ns the writer last proved it is running
+HEARTBEAT_SECONDS = 1.0             # How often the writer beats
+HEARTBEAT_TIMEOUT_SECONDS = 5.0     # A live feed without a beat for this long reads as down
+FREE_SLOT = -1                      # Index entry of a slot whose instrument was removed
+SLOT_REUSE_SECONDS = 5.0            # A freed slot is only reused after this long, unless the arena is full
+
+
+def _records_offset(capacity):
+    """Offset of slot 0, kept 64-byte aligned after the index table."""
+    return (INDEX_OFFSET + capacity * 8 + 63) & ~63
+
+
+COLUMN_LAYOUT = (
+    ('seq', '<u8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+    ('ltp', '<f8'),
+    ('bid_qty', '<i8'),
+    ('ask_qty', '<i8'),
+    ('ltq', '<i8'),
+    ('exchange_ts', '<i8'),
+    ('receive_ns', '<i8'),
+)
+
+
+def _columns_offset(capacity):
+    """Offset of the first top-of-book column, 64-byte aligned after the records."""
+    return (_records_offset(capacity) + capacity * RECORD_SIZE + 63) & ~63
+
+
+def arena_size(capacity):
+    return _columns_offset(capacity) + len(COLUMN_LAYOUT) * capacity * 8
+
+
+_created = set()          # Segments this process created; its resource tracker unlinks them on exit
+
+
+def _open_segment(name, create=False, size=0):
+    """
+    Opens a SharedMemory segment. Attached (non-created) segments are
+    unregistered from the POSIX resource tracker, otherwise a reader exiting
+    would unlink the writer's segment.
+
+    The tracker keeps one entry per name, so an unregister also drops the
+    creator's own registration when both share a tracker, and the segment
+    then leaks in /dev/shm. That is the case for a segment this process
+    created, and in a spawned child (a feed shard), which shares its
+    parent's tracker and only attaches segments the parent created; those
+    are left registered.
+    """
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    if create:
+        _created.add(name)
+    elif os.name != 'nt' and name not in _created and parent_process() is None:
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    return shm
+
+
+def _replace_segment(name, size):
+    """
+    Returns an existing segment zeroed for its writer to initialise afresh.
+    It is reused in place when large enough, because on Windows a segment
+    cannot be removed while any process still has it open; otherwise it is
+    unlinked and created again.
+    """
+    shm = _open_segment(name)
+    if shm.size < size:
+        shm.close()
+        shm.unlink()
+        return _open_segment(name, create=True, size=size)
+    shm.buf[:size] = bytes(size)
+    return shm
+
+
+class TickArena:
+    """
+    One preallocated shared-memory segment holding a tick record slot for
+    every subscribed instrument, plus an index table mapping
+    ExchangeInstrumentID -> slot. The writer (MDEngine) appends slots and
+    frees those of unsubscribed instruments for reuse; readers attach once
+    and resolve slots through a local dict, rebuilt whenever the index
+    epoch shows a slot was freed or reused.
+    """
+
+    def __init__(self, shm, writable=False):
+        self.shm = shm
+        self.buf = shm.buf
+        self.writable = writable
+        magic, version, record_version, capacity, _, generation, _ = ARENA_HEADER.unpack_from(self.buf, 0)
+        if magic != ARENA_MAGIC or version != ARENA_VERSION or record_version != RECORD_VERSION:
+            raise ValueError(f"Shared memory '{shm.name}' is not a compatible tick arena")
+        self.name = shm.name
+        self.capacity = capacity
+        self.generation = generation
+        self.records_offset = _records_offset(capacity)
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=self.buf, offset=self.records_offset)
+        # Contiguous top-of-book columns (and their seqlock) gathered by read_many
+        columns_offset = _columns_offset(capacity)
+        self._columns = {
+            name: np.ndarray((capacity,), dtype=dtype, buffer=self.buf,
+                             offset=columns_offset + i * capacity * 8)
+            for i, (name, dtype) in enumerate(COLUMN_LAYOUT)
+        }
+        self._slots = {}
+        self._indexed = 0
+        self._epoch = None
+        self._free = deque()    # Writer only: (freed at, slot), oldest first
+        self._refresh_index()
+        if writable:
+            ids = struct.unpack_from(f'<{self._indexed}q', self.buf, INDEX_OFFSET)
+            self._free.extend((0.0, slot) for slot, exchange_id in enumerate(ids) if exchange_id == FREE_SLOT)
+
+    @classmethod
+    def create(cls, name=ARENA_NAME, capacity=ARENA_CAPACITY):
+        """
+        Creates the arena, or reopens it for writing if it already exists
+        (an arena of an older layout is replaced).
+        """
+        try:
+            shm = _open_segment(name, create=True, size=arena_size(capacity))
+        except FileExistsError:
+            shm = _open_segment(name)
+            try:
+                arena = cls(shm, writable=True)
+                if arena._clears() & 1:
+                    arena._bump_clears()    # The last writer died mid-clear
+                return arena
+            except ValueError:
+                shm.close()
+                shm = _replace_segment(name, arena_size(capacity))
+
+        ARENA_HEADER.pack_into(
+            shm.buf, 0,
+            ARENA_MAGIC, ARENA_VERSION, RECORD_VERSION, capacity, 0,
+            int.from_bytes(os.urandom(8), 'little'), 0
+        )
+        return cls(shm, writable=True)
+
+    def _clears(self):
+        return struct.unpack_from('<Q', self.buf, HEADER_COUNTER_OFFSET)[0]
+
+    def _bump_clears(self):
+        struct.pack_into('<Q', self.buf, HEADER_COUNTER_OFFSET, self._clears() + 1)
+
+    @classmethod
+    def attach(cls, name=ARENA_NAME, writable=False):
+        """
+        Attaches to an existing arena for reading, or (`writable`) for a feed
+        shard to write the slots it owns. Only the creator allocates slots.
+        """
+        return cls(_open_segment(name), writable=writable)
+
+    def _count(self):
+        return struct.unpack_from('<I', self.buf, _COUNT_OFFSET)[0]
+
+    def _index_epoch(self):
+        return struct.unpack_from('<I', self.buf, INDEX_EPOCH_OFFSET)[0]
+
+    def _refresh_index(self):
+        """
+        Picks up slots appended by the writer since the last refresh, or
+        rebuilds the whole index if a slot was freed or reused meanwhile.
+        """
+        while True:
+            epoch = self._index_epoch()
+            if epoch != self._epoch:
+                self._slots = {}
+                self._indexed = 0
+            count = self._count()
+            if count > self._indexed:
+                ids = struct.unpack_from(f'<{count - self._indexed}q', self.buf, INDEX_OFFSET + self._indexed * 8)
+                for slot, exchange_id in enumerate(ids, start=self._indexed):
+                    if exchange_id != FREE_SLOT:
+                        self._slots[exchange_id] = slot
+                self._indexed = count
+            self._epoch = epoch
+            if self._index_epoch() == epoch:
+                return  # Otherwise a slot changed hands while reading: read again
+
+    def slot(self, exchange_id):
+        """Returns the slot for an instrument, or None if it has none yet."""
+        exchange_id = int(exchange_id)
+        if self._index_epoch() != self._epoch:
+            self._refresh_index()
+        slot = self._slots.get(exchange_id)
+        if slot is None:
+            self._refresh_index()
+            slot = self._slots.get(exchange_id)
+        return slot
+
+    def _clear_record(self, slot):
+        """
+        Empties a record and its columns under the seqlock (writer only).
+        The clear counter is odd meanwhile and ends 2 higher, so a
+        sequence_version taken across the clear never repeats an older one.
+        """
+        self._bump_clears()
+        offset = self.records_offset + slot * RECORD_SIZE
+        seq = (SEQ_STRUCT.unpack_from(self.buf, offset)[0] + 1) | 1
+        SEQ_STRUCT.pack_into(self.buf, offset, seq)
+        self._columns['seq'][slot] = seq
+        self.buf[offset + BODY_OFFSET:offset + RECORD_SIZE] = bytes(BODY_STRUCT.size)
+        for name, _ in COLUMN_LAYOUT[1:]:
+            self._columns[name][slot] = 0
+        self._columns['seq'][slot] = 0
+        SEQ_STRUCT.pack_into(self.buf, offset, 0)
+        self._bump_clears()
+
+    def _bump_epoch(self):
+        struct.pack_into('<I', self.buf, INDEX_EPOCH_OFFSET, (self._index_epoch() + 1) & 0xFFFFFFFF)
+
+    def add(self, exchange_id):
+        """
+        Allocates a slot for an instrument (writer only) and returns it,
+        reusing a freed slot once it has been free for SLOT_REUSE_SECONDS
+        (or at once if the arena is otherwise full). Raises MemoryError when
+        more than `capacity` instruments are subscribed at the same time.
+        """
+        exchange_id = int(exchange_id)
+        slot = self.slot(exchange_id)
+        if slot is not None:
+            return slot
+        count = self._count()
+        free = self._free
+        if free and (count >= self.capacity or time.monotonic() - free[0][0] >= SLOT_REUSE_SECONDS):
+            _, slot = free.popleft()
+            # A late write for the slot's previous instrument may have landed
+            self._clear_record(slot)
+            struct.pack_into('<q', self.buf, INDEX_OFFSET + slot * 8, exchange_id)
+            self._bump_epoch()
+            self._refresh_index()
+            return slot
+        if count >= self.capacity:
+            raise MemoryError(f"Tick arena '{self.name}' is full: {self.capacity} instruments are "
+                              f"subscribed (ARENA_CAPACITY); unsubscribe some before adding more")
+        # Publish the index entry before the count so readers never see a blank id
+        struct.pack_into('<q', self.buf, INDEX_OFFSET + count * 8, exchange_id)
+        struct.pack_into('<I', self.buf, _COUNT_OFFSET, count + 1)
+        self._refresh_index()
+        return count
+
+    def remove(self, exchange_id):
+        """
+        Frees an instrument's slot for reuse (writer only). The record is
+        cleared and the index entry marked FREE_SLOT; readers drop the
+        instrument when they see the epoch change.
+        """
+        slot = self.slot(exchange_id)
+        if slot is None:
+            return
+        self._clear_record(slot)
+        struct.pack_into('<q', self.buf, INDEX_OFFSET + slot * 8, FREE_SLOT)
+        self._bump_epoch()
+        self._free.append((time.monotonic(), slot))
+        self._refresh_index()
+
+    def ids(self):
+        """All instruments that currently have a slot, in slot order."""
+        self._refresh_index()
+        return list(self._slots)
+
+    def write(self, exchange_id, data, received_ns=None):
+        """Writes a decoded 1502 message into the instrument's slot (see pack_tick)."""
+        slot = self.slot(exchange_id)
+        if slot is None:
+            slot = self.add(exchange_id)
+        pack_tick(self.buf, data, self.records_offset + slot * RECORD_SIZE, self._columns, slot, received_ns)
+
+    def exchange_timestamp(self, exchange_id):
+        """ExchangeTimeStamp of the instrument's latest tick (0 if it has none). For the writer."""
+        slot = self.slot(exchange_id)
+        return 0 if slot is None else int(self._columns['exchange_ts'][slot])
+
+    def set_feed_state(self, state):
+        """Tells readers whether the market data feed is live (writer only)."""
+        self.heartbeat()
+        FEED_STATE_STRUCT.pack_into(self.buf, FEED_STATE_OFFSET, state, time.monotonic_ns())
+
+    def heartbeat(self):
+        """Tells readers the writer is still running (writer only, every HEARTBEAT_SECONDS)."""
+        struct.pack_into('<Q', self.buf, HEARTBEAT_OFFSET, time.monotonic_ns())
+
+    def feed_state(self, now=None):
+        """
+        (FEED_LIVE or FEED_DOWN, time.monotonic_ns() it was set). A live feed
+        whose writer stopped beating (exited or was killed without marking it
+        down) reads as down since its last heartbeat.
+        """
+        state, changed_at = FEED_STATE_STRUCT.unpack_from(self.buf, FEED_STATE_OFFSET)
+        if state == FEED_LIVE:
+            beat = struct.unpack_from('<Q', self.buf, HEARTBEAT_OFFSET)[0]
+            now = time.monotonic_ns() if now is None else now
+            if now - beat > HEARTBEAT_TIMEOUT_SECONDS * 1e9:
+                return FEED_DOWN, beat
+        return state, changed_at
+
+    def read(self, exchange_id):
+        """Reads an instrument's tick as a dict, or None if it has no data."""
+        slot = self.slot(exchange_id)
+        if slot is None:
+            return None
+        tick = unpack_tick(self.buf, self.records_offset + slot * RECORD_SIZE)
+        if tick is not None and tick["ExchangeInstrumentID"] not in (0, int(exchange_id)):
+            return None     # The slot was handed to another instrument while reading
+        return tick
+
+    def _resolve(self, batch):
+        """Maps a batch's instrument ids to slots, cached until the index grows or a slot changes hands."""
+        if self._index_epoch() != self._epoch:
+            self._refresh_index()
+        key = (self.generation, self._epoch, self._indexed)
+        if batch._arena_key != key or (batch._missing and self._count() > self._indexed):
+            self._refresh_index()
+            batch._slots[:] = [self._slots.get(i, -1) for i in batch.ids.tolist()]
+            batch._arena_key = (self.generation, self._epoch, self._indexed)
+            batch._missing = bool((batch._slots < 0).any())
+        return batch._slots
+
+    def _gather(self, slots, columns):
+        """Gathers the named top-of-book columns of `slots` straight from the arena."""
+        return {name: self._columns[name].take(slots) for name in columns}
+
+    def _gather_row(self, slot, columns):
+        """Re-reads one slot under the seqlock; returns (seq, fields) or None."""
+        seq = self._columns['seq']
+        for attempt in range(READ_RETRIES):
+            before = seq[slot[0]]
+            if not before & 1:
+                row = self._gather(slot, columns)
+                if seq[slot[0]] == before:
+                    return before, row
+            if attempt & 0xFF == 0xFF:
+                time.sleep(0)
+        return None
+
+    def read_many(self, ids, out=None):
+        """
+        Reads many instruments in one pass over the arena into a QuoteBatch.
+        Pass the batch from a previous call as `out` to reuse its arrays.
+        Only the batch's top-of-book columns are gathered; rows caught
+        mid-write are re-read individually under the seqlock.
+        """
+        batch = out if out is not None else QuoteBatch(ids)
+        slots = self._resolve(batch)
+        if batch._missing:
+            present = np.flatnonzero(slots >= 0)
+            slots = slots[present]
+        else:
+            present = slice(None)
+
+        seq = self._columns['seq']
+        seq_before = seq.take(slots)
+        fields = self._gather(slots, batch.columns)
+        seq_after = seq.take(slots)
+
+        torn = np.flatnonzero((seq_before & 1).astype(bool) | (seq_before != seq_after))
+        for i in torn.tolist():
+            retry = self._gather_row(slots[i:i + 1], batch.columns)
+            if retry is None:
+                seq_after[i] = 0  # Still locked: report as not valid
+                continue
+            seq_after[i], row = retry
+            for name, values in row.items():
+                fields[name][i] = values[0]
+
+        batch.fill(present, fields, seq_after)
+        return batch
+
+    def sequence_version(self, batch):
+        """
+        (clear counter, sum of the sequence numbers of a batch's instruments).
+        Every write adds 2 to one of the sequence numbers, so the sum grows
+        whenever any of them ticks and is unchanged otherwise, without
+        reading any prices. Clearing a slot resets its sequence number to 0
+        but bumps the counter, so the pair only ever increases.
+        """
+        slots = self._resolve(batch)
+        if batch._missing:
+            slots = slots[slots >= 0]
+        for _ in range(READ_RETRIES):
+            clears = self._clears()
+            total = int(self._columns['seq'].take(slots).sum())
+            if not clears & 1 and self._clears() == clears:
+                break   # Otherwise a slot was cleared while summing: sum again
+        return clears, total
+
+    def close(self):
+        self.records = None
+        self._columns = None
+        self.buf = None
+        self.shm.close()
+
+
+QUOTE_COLUMNS = ('bid', 'ask', 'ltp', 'bid_qty', 'ask_qty', 'ltq', 'exchange_ts', 'receive_ns')
+
+
+class QuoteBatch:
+    """
+    Preallocated NumPy arrays of top-of-book quotes for a fixed list of
+    instruments, filled in place by TickArena.read_many. Index i of every
+    array refers to ids[i]; `valid` is False where no tick is available.
+    Only `columns` are read from shared memory; the other arrays stay zero.
+    """
+
+    def __init__(self, ids, columns=QUOTE_COLUMNS):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.columns = tuple(columns)
+        n = len(self.ids)
+        self.bid = np.zeros(n)
+        self.ask = np.zeros(n)
+        self.ltp = np.zeros(n)
+        self.bid_qty = np.zeros(n, dtype=np.int64)
+        self.ask_qty = np.zeros(n, dtype=np.int64)
+        self.ltq = np.zeros(n, dtype=np.int64)
+        self.exchange_ts = np.zeros(n, dtype=np.int64)
+        self.receive_ns = np.zeros(n, dtype=np.int64)
+        self.seq = np.zeros(n, dtype=np.uint64)
+        self.valid = np.zeros(n, dtype=bool)
+        self._slots = np.full(n, -1, dtype=np.int64)
+        self._arena_key = None
+        self._missing = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def age_ns(self, now=None):
+        """
+        Nanoseconds since each instrument's tick was received (read with the
+        'receive_ns' column); -1 where there is no tick.
+        """
+        now = time.monotonic_ns() if now is None else now
+        return np.where(self.valid, now - self.receive_ns, -1)
+
+    def fill(self, present, fields, seq):
+        """Copies gathered arena columns into the arrays at positions `present`."""
+        if not isinstance(present, slice):
+            self.valid[:] = False
+        # The arena checked the record version on attach; a slot that has
+        # been written at least once has a non-zero (even) sequence
+        self.valid[present] = seq != 0
+        self.seq[present] = seq
+        for name, values in fields.items():
+            getattr(self, name)[present] = values
+
+    def clear(self):
+        self.valid[:] = False
+
+
+########################################################################
+# Reader handle pool
+########################################################################
+POOL_SIZE = 8               # Attached arenas kept open per process
+REVALIDATE_SECONDS = 1.0    # How often a cached handle checks for recreation
+
+
+def peek_generation(name):
+    """
+    Reads a segment's generation without attaching to its index. Every
+    segment opened through the HandlePool starts with ARENA_HEADER.
+    """
+    shm = _open_segment(name)
+    try:
+        return ARENA_HEADER.unpack_from(shm.buf, 0)[5]
+    finally:
+        shm.close()
+
+
+class HandlePool:
+    """
+    Process-wide LRU cache of attached arenas keyed by segment name; `factory`
+    attaches a segment (TickArena.attach by default). Each handle is
+    revalidated at most once per `revalidate_seconds`; if MDEngine
+    recreated the segment (new generation) the handle is reattached, so fd
+    usage and read latency stay flat however long the process runs.
+    """
+
+    def __init__(self, max_size=POOL_SIZE, revalidate_seconds=REVALIDATE_SECONDS):
+        self.max_size = max_size
+        self.revalidate_seconds = revalidate_seconds
+        self._handles = OrderedDict()   # name -> [handle, last check time, factory]
+        self._lock = threading.Lock()
+
+    def get(self, name=ARENA_NAME, factory=None, keep_stale=True):
+        """
+        Returns an attached arena, or None if it does not exist yet. With
+        `keep_stale` False a handle whose segment is gone is dropped (None)
+        instead of serving the last known data.
+        """
+        factory = factory or TickArena.attach
+        now = time.monotonic()
+        with self._lock:
+            entry = self._handles.get(name)
+            if entry is not None:
+                self._handles.move_to_end(name)
+                if now - entry[1] < self.revalidate_seconds:
+                    return entry[0]
+                entry[1] = now
+                arena = self._revalidate(name, entry)
+                if arena is not None:
+                    return arena
+                if keep_stale:
+                    return entry[0]     # Writer is gone; keep serving the last known data
+                del self._handles[name]
+                entry[0].close()
+                return None
+
+            try:
+                arena = factory(name)
+            except (FileNotFoundError, ValueError):
+                return None
+            self._handles[name] = [arena, now, factory]
+            while len(self._handles) > self.max_size:
+                _, (evicted, _, _) = self._handles.popitem(last=False)
+                evicted.close()
+            return arena
+
+    def _revalidate(self, name, entry):
+        """The current handle, a reattached one if the segment was recreated, or None if it is gone."""
+        arena = entry[0]
+        try:
+            if peek_generation(name) == arena.generation:
+                return arena
+            fresh = entry[2](name)
+        except (FileNotFoundError, ValueError):
+            return None
+        print(f"♻️ Shared memory '{name}' was recreated, reattaching")
+        entry[0] = fresh
+        arena.close()
+        return fresh
+
+    def close(self):
+        with self._lock:
+            for arena, _, _ in self._handles.values():
+                arena.close()
+            self._handles.clear()
+
+
+handle_pool = HandlePool()
+
+
+def get_arena(name=ARENA_NAME):
+    """
+    Returns this process's reader handle on the arena from the handle pool.
+    Returns None while the arena does not exist yet (MDEngine not started).
+    """
+    return handle_pool.get(name)
+
+
+def read_many(ids, out=None):
+    """
+    Reads many instruments' best bid/ask, LTP, quantities and timestamps into
+    a QuoteBatch. With no arena yet, the batch comes back with valid all False.
+    """
+    batch = out if out is not None else QuoteBatch(ids)
+    arena = get_arena()
+    if arena is None:
+        batch.clear()
+        return batch
+    return arena.read_many(ids, out=batch)
+
+
+def sequence_version(batch):
+    """
+    Version token for a batch's instruments: (arena generation, clear
+    counter, sum of their sequence numbers), or None while there is no arena.
+    """
+    arena = get_arena()
+    if arena is None:
+        return None
+    return (arena.generation, *arena.sequence_version(batch))
+
+
+def feed_state():
+    """The arena's (feed state, changed at) as set by MDEngine, or None while there is no arena."""
+    arena = get_arena()
+    if arena is None:
+        return None
+    return arena.feed_state()
+
+
+def tick_age_ns(tick, now=None):
+    """Nanoseconds since a tick returned by read_tick was received."""
+    now = time.monotonic_ns() if now is None else now
+    return now - tick["ReceiveTimeNs"]
+
+
+def read_tick(exchange_id):
+    """Reads an instrument's latest tick from the arena, or None."""
+    arena = get_arena()
+    if arena is None:
+        return None
+    return arena.read(exchange_id)
@@ -0,0 +1,273 @@
+"""
+    Universe.py
+
+    Compiles the static instrument data (contract names, lot sizes, the
+    futures/spread mapping and the exchange instrument list) into one binary
+    bundle, data/universe.bin, which every process memory-maps instead of
+    parsing the JSON files into dicts of its own. Opening the bundle takes
+    milliseconds and its pages are shared by all processes through the OS
+    page cache.
+
+    Rebuild it whenever the JSON files are regenerated:
+
+        python Universe.py
+
+    Layout: magic, version and directory length, a small JSON directory
+    {section: [offset, dtype, count]} (plus the source files' mtimes and
+    sizes), then the sections, each 64-byte aligned:
+
+        ids             int64[n]   every known instrument id, sorted
+        flags           uint8[n]   HAS_NAME | HAS_LOT_SIZE
+        name_offsets    uint32[n+1] slice of `name_data` holding ids[i]'s name
+        name_data       uint8[..]  UTF-8 names, concatenated
+        lot_size        int64[n]
+        spread_ids      int64[m]   futures mapping keys, in file order
+        leg_offsets     uint32[m+1] slice of `legs` holding spread i's legs
+        legs            int64[..]
+        segments        int32[k]   exchange instruments, in file order
+        instrument_ids  int64[k]
+
+    The *Map classes expose the bundle through the same dict interface the
+    JSON files had (string keys), so callers do not change.
+"""
+import json
+import os
+import struct
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+
+BUNDLE_FILE = 'data/universe.bin'
+BUNDLE_MAGIC = b'SEUV'
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct('<4sII')      # magic, version, directory length
+ALIGN = 64
+
+CONTRACT_NAMES_FILE = 'data/contractnames.json'
+LOT_SIZE_FILE = 'data/lotsize.json'
+FUTURES_MAPPING_FILE = 'data/futures_mapping2.json'
+EXCHANGE_INSTRUMENTS_FILE = 'data/exchange_instruments2.json'
+SOURCE_FILES = (CONTRACT_NAMES_FILE, LOT_SIZE_FILE, FUTURES_MAPPING_FILE, EXCHANGE_INSTRUMENTS_FILE)
+
+HAS_NAME = 1
+HAS_LOT_SIZE = 2
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+########################################################################
+# Build
+########################################################################
+def build(path=BUNDLE_FILE):
+    """Compiles the JSON data files into the bundle at `path` (atomically)."""
+    with open(CONTRACT_NAMES_FILE) as f:
+        names = json.load(f)
+    with open(LOT_SIZE_FILE) as f:
+        lot_sizes = json.load(f)
+    with open(FUTURES_MAPPING_FILE) as f:
+        mapping = json.load(f)
+    with open(EXCHANGE_INSTRUMENTS_FILE) as f:
+        instruments = json.load(f)
+
+    ids = set(int(key) for key in names) | set(int(key) for key in lot_sizes)
+    for spid, legs in mapping.items():
+        ids.add(int(spid))
+        ids.update(int(leg) for leg in legs)
+    ids = np.array(sorted(ids), dtype=np.int64)
+
+    flags = np.zeros(len(ids), dtype=np.uint8)
+    lot_size = np.zeros(len(ids), dtype=np.int64)
+    encoded = [b''] * len(ids)
+    for key, name in names.items():
+        i = np.searchsorted(ids, int(key))
+        flags[i] |= HAS_NAME
+        encoded[i] = name.encode()
+    for key, size in lot_sizes.items():
+        i = np.searchsorted(ids, int(key))
+        flags[i] |= HAS_LOT_SIZE
+        lot_size[i] = size or 0
+    name_offsets = np.zeros(len(ids) + 1, dtype=np.uint32)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+
+    leg_lists = [[int(leg) for leg in legs] for legs in mapping.values()]
+    leg_offsets = np.zeros(len(leg_lists) + 1, dtype=np.uint32)
+    np.cumsum([len(legs) for legs in leg_lists], out=leg_offsets[1:])
+
+    sections = {
+        'ids': ids,
+        'flags': flags,
+        'name_offsets': name_offsets,
+        'name_data': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'lot_size': lot_size,
+        'spread_ids': np.array([int(spid) for spid in mapping], dtype=np.int64),
+        'leg_offsets': leg_offsets,
+        'legs': np.array([leg for legs in leg_lists for leg in legs], dtype=np.int64),
+        'segments': np.array([inst['exchangeSegment'] for inst in instruments], dtype=np.int32),
+        'instrument_ids': np.array([inst['exchangeInstrumentID'] for inst in instruments], dtype=np.int64),
+    }
+
+    # The directory's offsets depend on its own length; reserve a fixed pad
+    directory = {'sources': {src: _source_stamp(src) for src in SOURCE_FILES}, 'sections': {}}
+    reserve = _align(BUNDLE_HEADER.size + len(json.dumps(directory)) + 128 * len(sections))
+    offset = reserve
+    for name, array in sections.items():
+        directory['sections'][name] = [offset, array.dtype.str, len(array)]
+        offset = _align(offset + array.nbytes)
+    encoded_directory = json.dumps(directory).encode()
+    assert BUNDLE_HEADER.size + len(encoded_directory) <= reserve
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(encoded_directory)))
+        f.write(encoded_directory)
+        for name, array in sections.items():
+            f.seek(directory['sections'][name][0])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+    return path
+
+
+########################################################################
+# Load
+########################################################################
+class Universe:
+    """Read-only view of a memory-mapped bundle; the arrays are zero-copy."""
+
+    def __init__(self, path=BUNDLE_FILE):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, length = BUNDLE_HEADER.unpack_from(self._mm, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError(f"{path} is not a version {BUNDLE_VERSION} universe bundle")
+        start = BUNDLE_HEADER.size
+        directory = json.loads(bytes(self._mm[start:start + length]))
+        self.sources = directory['sources']
+        for name, (offset, dtype, count) in directory['sections'].items():
+            setattr(self, name, np.frombuffer(self._mm, dtype=dtype, count=count, offset=offset))
+
+        self.names = NameMap(self)
+        self.lot_sizes = LotSizeMap(self)
+        self.futures_mapping = SpreadMap(self)
+
+    def is_stale(self):
+        """True if any source JSON file changed after the bundle was built."""
+        try:
+            return any(_source_stamp(src) != stamp for src, stamp in self.sources.items())
+        except FileNotFoundError:
+            return False    # Deployed without the JSON files: the bundle is the source
+
+    def index(self, key):
+        """Position of an instrument id (int or str) in `ids`, or -1."""
+        try:
+            exchange_id = int(key)
+        except (TypeError, ValueError):
+            return -1
+        i = int(np.searchsorted(self.ids, exchange_id))
+        return i if i < len(self.ids) and self.ids[i] == exchange_id else -1
+
+    def name(self, i):
+        return bytes(self.name_data[self.name_offsets[i]:self.name_offsets[i + 1]]).decode()
+
+    def exchange_instruments(self):
+        """The exchange instrument list as dicts, like exchange_instruments2.json."""
+        return [
+            {"exchangeSegment": segment, "exchangeInstrumentID": exchange_id}
+            for segment, exchange_id in zip(self.segments.tolist(), self.instrument_ids.tolist())
+        ]
+
+
+class NameMap(Mapping):
+    """contractnames.json as a read-only mapping: str(id) -> name."""
+
+    def __init__(self, universe):
+        self._u = universe
+
+    def __getitem__(self, key):
+        i = self._u.index(key)
+        if i < 0 or not self._u.flags[i] & HAS_NAME:
+            raise KeyError(key)
+        return self._u.name(i)
+
+    def __iter__(self):
+        u = self._u
+        return (str(exchange_id) for exchange_id in u.ids[(u.flags & HAS_NAME).astype(bool)].tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self._u.flags & HAS_NAME))
+
+
+class LotSizeMap(Mapping):
+    """lotsize.json as a read-only mapping: str(id) -> lot size."""
+
+    def __init__(self, universe):
+        self._u = universe
+
+    def __getitem__(self, key):
+        i = self._u.index(key)
+        if i < 0 or not self._u.flags[i] & HAS_LOT_SIZE:
+            raise KeyError(key)
+        return int(self._u.lot_size[i])
+
+    def __iter__(self):
+        u = self._u
+        return (str(exchange_id) for exchange_id in u.ids[(u.flags & HAS_LOT_SIZE).astype(bool)].tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self._u.flags & HAS_LOT_SIZE))
+
+
+class SpreadMap(Mapping):
+    """futures_mapping2.json as a read-only mapping: str(spread id) -> [leg ids], in file order."""
+
+    def __init__(self, universe):
+        self._u = universe
+        self._rows = None
+
+    def _row(self, key):
+        if self._rows is None:
+            self._rows = {str(spid): i for i, spid in enumerate(self._u.spread_ids.tolist())}
+        return self._rows[str(key)]
+
+    def __getitem__(self, key):
+        i = self._row(key)
+        offsets = self._u.leg_offsets
+        return self._u.legs[offsets[i]:offsets[i + 1]].tolist()
+
+    def __iter__(self):
+        return (str(spid) for spid in self._u.spread_ids.tolist())
+
+    def __len__(self):
+        return len(self._u.spread_ids)
+
+
+def open_bundle(path=BUNDLE_FILE):
+    """
+    Memory-maps the bundle. Returns None if it is missing, unreadable or
+    older than its JSON sources, so callers fall back to the JSON files.
+    """
+    try:
+        universe = Universe(path)
+    except (FileNotFoundError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring universe bundle: {e}")
+        return None
+    if universe.is_stale():
+        print(f"{path} is older than its JSON sources; run `python Universe.py` to rebuild it")
+        return None
+    return universe
+
+
+if __name__ == '__main__':
+    out = build(sys.argv[1] if len(sys.argv) > 1 else BUNDLE_FILE)
+    universe = Universe(out)
+    print(f"Wrote {out}: {len(universe.ids)} instruments, {len(universe.spread_ids)} spreads, "
+          f"{len(universe.instrument_ids)} exchange instruments, {os.path.getsize(out)} bytes")
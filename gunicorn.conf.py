@@ -0,0 +1,29 @@
+"""
+    gunicorn.conf.py
+
+    Production serving for the Dashboard (Linux):
+
+        gunicorn Dashboard:app
+
+    One worker process with a thread pool. Flask-SocketIO only supports a
+    single gunicorn worker unless a message queue and sticky sessions are
+    set up, so concurrency comes from threads: spreads and ticks are read
+    from MDEngine's shared-memory segments, and subscriptions, positions
+    and the fetching PID live in files changed under a lock (LocalStore.py),
+    so a development server running alongside sees the same state. Positions
+    are only created by the process leading entry creation (see Leader).
+"""
+import configparser
+
+dashboard_config = configparser.ConfigParser()
+dashboard_config.read('config.ini')
+
+bind = dashboard_config.get('dashboard', 'bind', fallback='0.0.0.0:5001')
+workers = 1
+worker_class = 'gthread'
+threads = dashboard_config.getint('dashboard', 'threads', fallback=32)
+# Each worker attaches its own shared-memory handles after the fork
+preload_app = False
+# Socket.IO websocket connections stay open; don't recycle busy workers
+timeout = 0
+graceful_timeout = 10
@@ -0,0 +1,54 @@
+"""
+    Shared fixtures. The modules under test live at the repository root and
+    read their data files relative to it, so tests run from there.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+@pytest.fixture
+def shm_name():
+    """
+    A shared-memory segment name no running MDEngine uses; the segment and
+    its data/<name>.lock file (if any) are removed afterwards.
+    """
+    from multiprocessing import shared_memory
+
+    names = []
+
+    def make(prefix="test"):
+        name = f"{prefix}_{uuid.uuid4().hex[:12]}"
+        names.append(name)
+        return name
+
+    yield make
+    for name in names:
+        lock_path = os.path.join(ROOT, 'data', f"{name}.lock")
+        if os.path.exists(lock_path):
+            os.remove(lock_path)
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+# Calendar spreads sharing legs: 100 = 1/2, 101 = 2/3, 102 = 3/4, 103 = 4/5
+SPREAD_MAPPING = {"100": [1, 2], "101": [2, 3], "102": [3, 4], "103": [4, 5]}
+
+
+@pytest.fixture
+def registry_path(tmp_path, monkeypatch):
+    """A subscriptions file in a temporary directory, over SPREAD_MAPPING."""
+    import SharedData
+
+    monkeypatch.setattr(SharedData, "futures_mapping", lambda: SPREAD_MAPPING)
+    return str(tmp_path / "subscriptions.json")
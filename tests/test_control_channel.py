@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+import ControlChannel
+import TickStore
+from ControlChannel import COMMAND_MAX_INSTRUMENTS, OP_SUBSCRIBE, OP_UNSUBSCRIBE, CommandRing, send_command
+from SpreadEngine import SpreadTable
+
+
+def instruments(*ids):
+    return [{"exchangeSegment": 2, "exchangeInstrumentID": exchange_id} for exchange_id in ids]
+
+
+@pytest.fixture
+def ring(shm_name):
+    ring = CommandRing.create(name=shm_name("ring"), capacity=4)
+    yield ring
+    ring.close()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = TickStore.HandlePool(revalidate_seconds=0.0)
+    monkeypatch.setattr(ControlChannel, "handle_pool", pool)
+    yield pool
+    pool.close()
+
+
+def test_send_and_poll(ring):
+    producer = CommandRing.attach(ring.name)
+    try:
+        producer.send(OP_SUBSCRIBE, instruments(1, 2))
+        # Larger commands span several slots
+        producer.send(OP_UNSUBSCRIBE, instruments(*range(COMMAND_MAX_INSTRUMENTS + 1)), message_code=1501)
+    finally:
+        producer.close()
+    commands = ring.poll()
+    assert commands[0] == (OP_SUBSCRIBE, 1502, instruments(1, 2))
+    assert [command[:2] for command in commands[1:]] == [(OP_UNSUBSCRIBE, 1501)] * 2
+    assert len(commands[1][2]) == COMMAND_MAX_INSTRUMENTS and commands[2][2] == instruments(COMMAND_MAX_INSTRUMENTS)
+    assert ring.poll() == []
+
+
+def test_full_ring_refuses_whole_command(ring):
+    for exchange_id in range(4):
+        ring.send(OP_SUBSCRIBE, instruments(exchange_id))
+    with pytest.raises(BufferError):
+        ring.send(OP_SUBSCRIBE, instruments(9))
+    assert len(ring.poll()) == 4
+    ring.send(OP_SUBSCRIBE, instruments(9))
+    assert ring.poll() == [(OP_SUBSCRIBE, 1502, instruments(9))]
+
+
+def test_create_reinitialises_existing_segment(ring):
+    ring.send(OP_SUBSCRIBE, instruments(1))
+    old_shm = ring.shm
+    restarted = CommandRing.create(name=ring.name, capacity=4)
+    try:
+        # Reused in place (still open here), with the old run's commands dropped
+        assert restarted.generation != ring.generation
+        assert restarted.poll() == []
+        assert np.all(restarted.slots['seq'] == 0)
+        old_shm.buf[0]      # The old handle stays valid
+    finally:
+        restarted.close()
+
+
+def test_send_command_reuses_attached_ring(ring, pool, monkeypatch):
+    attached = []
+    attach = CommandRing.attach
+    monkeypatch.setattr(CommandRing, "attach", classmethod(lambda cls, name: attached.append(name) or attach(name)))
+
+    assert send_command(OP_SUBSCRIBE, instruments(1), name=ring.name)
+    assert send_command(OP_SUBSCRIBE, instruments(2), name=ring.name)
+    assert attached == [ring.name]
+    assert [command[2] for command in ring.poll()] == [instruments(1), instruments(2)]
+
+
+def test_send_command_without_engine(shm_name, pool):
+    name = shm_name("ring")
+    assert send_command(OP_SUBSCRIBE, instruments(1), name=name) is False
+
+    ring = CommandRing.create(name=name, capacity=4)
+    assert send_command(OP_SUBSCRIBE, instruments(1), name=name)
+    ring.close()
+    ring.shm.unlink()
+    # The cached handle is dropped once its segment is gone
+    assert send_command(OP_SUBSCRIBE, instruments(1), name=name) is False
+    assert name not in pool._handles
+
+
+def test_spread_table_create_reuses_existing_segment(shm_name):
+    name = shm_name("spreads")
+    table = SpreadTable.create([1, 2, 3], name=name)
+    try:
+        same = SpreadTable.create([1, 2, 3], name=name)
+        assert same.generation == table.generation
+        same.close()
+
+        other = SpreadTable.create([4, 5], name=name)
+        assert other.generation != table.generation
+        assert other.spread_ids.tolist() == [4, 5]
+        other.close()
+    finally:
+        table.close()
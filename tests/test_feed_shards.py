@@ -0,0 +1,77 @@
+import subprocess
+import sys
+import time
+from multiprocessing import shared_memory
+
+import pytest
+
+from conftest import ROOT
+from ControlChannel import OP_SUBSCRIBE
+from FeedShards import ShardPool, balance
+
+
+def instruments(*ids):
+    return [{"exchangeSegment": 2, "exchangeInstrumentID": exchange_id} for exchange_id in ids]
+
+
+def ids(assigned):
+    return sorted(inst['exchangeInstrumentID'] for inst in assigned)
+
+
+class Commands(list):
+    put = list.append
+
+
+def test_balance_by_tick_rate():
+    rates = {1: 10.0, 2: 6.0, 3: 5.0, 4: 0.5, 5: 0.5}
+    assignment, unassigned = balance(instruments(*rates), rates.get, 2)
+    assert [ids(assigned) for assigned in assignment] == [[1, 4, 5], [2, 3]]
+    assert unassigned == []
+
+
+def test_balance_unknown_rates_split_evenly():
+    assignment, _ = balance(instruments(*range(7)), lambda exchange_id: 0.0, 3)
+    assert sorted(len(assigned) for assigned in assignment) == [2, 2, 3]
+
+
+def test_balance_respects_capacity():
+    rates = {1: 100.0, 2: 1.0, 3: 1.0, 4: 1.0, 5: 1.0}
+    assignment, unassigned = balance(instruments(*rates), rates.get, 2, capacity=2)
+    # The busy instrument's shard would otherwise take the rest
+    assert [len(assigned) for assigned in assignment] == [2, 2]
+    assert len(unassigned) == 1
+
+
+def test_subscribe_fills_shards_up_to_capacity():
+    pool = ShardPool(2, target=None, rate=lambda exchange_id: 0.0, on_state=None, delays=None, capacity=2)
+    pool.commands = [Commands(), Commands()]
+    pool.subscribe(instruments(1, 2, 3))
+    pool.subscribe(instruments(3, 4, 5))
+    assert sorted(len(assigned) for assigned in pool.assignment) == [2, 2]
+    assert 5 not in pool.owner
+    assert all(op == OP_SUBSCRIBE for commands in pool.commands for op, _, _ in commands)
+
+    pool.unsubscribe(instruments(1))
+    pool.subscribe(instruments(5))
+    assert 5 in pool.owner
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="POSIX resource tracker")
+def test_creator_attaching_its_own_segment_still_cleans_up(shm_name):
+    name = shm_name("segment")
+    script = (
+        "import TickStore\n"
+        f"created = TickStore._open_segment({name!r}, create=True, size=64)\n"
+        f"attached = TickStore._open_segment({name!r})\n"
+        "attached.close(); created.close()\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, capture_output=True)
+    # The creator's resource tracker unlinks the segment once it exits
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            shared_memory.SharedMemory(name=name).close()
+        except FileNotFoundError:
+            return
+        time.sleep(0.05)
+    pytest.fail("segment leaked")
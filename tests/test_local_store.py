@@ -0,0 +1,34 @@
+import json
+
+from LocalStore import JsonStore, Leader
+
+
+def test_one_leader_until_it_goes(tmp_path):
+    path = str(tmp_path / "creator.lock")
+    first = Leader(path, retry_seconds=0.0)
+    second = Leader(path, retry_seconds=0.0)
+    assert first.is_leader()
+    assert not second.is_leader()
+    assert first.is_leader()
+
+    first._file.close()         # The leading process exits: the OS drops its lock
+    assert second.is_leader()
+
+
+def test_leader_retries_at_most_every_retry_seconds(tmp_path):
+    path = str(tmp_path / "creator.lock")
+    first = Leader(path)
+    second = Leader(path, retry_seconds=60.0)
+    assert first.is_leader()
+    assert not second.is_leader()
+    first._file.close()
+    assert not second.is_leader()       # Not tried again yet
+
+
+def test_json_store_update(tmp_path):
+    store = JsonStore(str(tmp_path / "state.json"), default={"n": 0})
+    assert store.read() == {"n": 0}
+    store.update(lambda data: {"n": data["n"] + 1})
+    store.update(lambda data: {"n": data["n"] + 1})
+    with open(store.path) as f:
+        assert json.load(f) == {"n": 2}
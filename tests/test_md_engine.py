@@ -0,0 +1,75 @@
+import pytest
+
+import MDEngine
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """MDEngine's feed restore with the XTS calls replaced: records quote refreshes and feed states."""
+    calls = {"refreshes": 0, "states": []}
+
+    def refresh_quotes(instruments):
+        calls["refreshes"] += 1
+        return len(instruments)
+
+    monkeypatch.setattr(MDEngine, "Instruments", [{"exchangeSegment": 2, "exchangeInstrumentID": 1}])
+    monkeypatch.setattr(MDEngine, "warmed_up_at", None)
+    monkeypatch.setattr(MDEngine, "session_valid", lambda: True)
+    monkeypatch.setattr(MDEngine, "connect_socket", lambda: None)
+    monkeypatch.setattr(MDEngine, "refresh_quotes", refresh_quotes)
+    monkeypatch.setattr(MDEngine, "set_feed_state", calls["states"].append)
+    MDEngine.reconnect_requested.clear()
+    return calls
+
+
+def test_first_connection_reuses_warm_up(feed):
+    MDEngine.warm_up()
+    MDEngine.restore_feed()
+    assert feed["refreshes"] == 1
+    assert feed["states"] == [MDEngine.FEED_LIVE]
+
+    # A reconnect fills its gap again
+    MDEngine.restore_feed()
+    assert feed["refreshes"] == 2
+
+
+def test_late_first_connection_fills_gap(feed, monkeypatch):
+    MDEngine.warm_up()
+    monkeypatch.setattr(MDEngine, "WARM_UP_REUSE_SECONDS", -1)
+    MDEngine.restore_feed()
+    assert feed["refreshes"] == 2
+
+
+def test_failed_warm_up_is_not_reused(feed, monkeypatch):
+    def fail(instruments):
+        raise ConnectionError("rate limited")
+
+    monkeypatch.setattr(MDEngine, "refresh_quotes", fail)
+    MDEngine.warm_up()
+    assert MDEngine.warmed_up_at is None
+
+
+class NoQuota:
+    def enforce(self):
+        return []
+
+
+def test_command_queued_during_startup_applies_once(shm_name, monkeypatch):
+    # Read from the registry at startup, and queued in the ring before it was read
+    subscribed = [{"exchangeSegment": 2, "exchangeInstrumentID": 1}]
+    sent = []
+    arena = MDEngine.TickArena.create(name=shm_name("ticks"), capacity=4)
+    monkeypatch.setattr(MDEngine, "arena", arena)
+    monkeypatch.setattr(MDEngine, "Instruments", list(subscribed))
+    monkeypatch.setattr(MDEngine, "quota_manager", NoQuota())
+    monkeypatch.setattr(MDEngine, "shard_pool", None)
+    monkeypatch.setattr(MDEngine, "subscribe_in_chunks", lambda instruments, code=1502: sent.append(instruments))
+    try:
+        MDEngine.apply_command(MDEngine.OP_SUBSCRIBE, 1502, subscribed)
+        assert sent == []
+        new = [{"exchangeSegment": 2, "exchangeInstrumentID": 2}]
+        MDEngine.apply_command(MDEngine.OP_SUBSCRIBE, 1502, subscribed + new)
+        assert sent == [new]
+        assert arena.slot(2) is not None
+    finally:
+        arena.close()
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from SpreadEngine import SpreadEngine, SpreadResult, SpreadTable
+from SpreadService import SpreadSnapshotService
+from TickStore import SNAPSHOT_RECEIVED_NS, TickArena
+
+from test_tick_store import tick
+
+SPREAD, NEAR, FAR = 100, 1, 2
+
+
+@pytest.fixture
+def arena(shm_name):
+    arena = TickArena.create(name=shm_name("ticks"), capacity=8)
+    yield arena
+    arena.close()
+
+
+def write_quotes(arena):
+    arena.write(SPREAD, tick(SPREAD, 1.0))
+    arena.write(NEAR, tick(NEAR, 100.25, bid=100.0, ask=100.5))
+    arena.write(FAR, tick(FAR, 105.25, bid=105.0, ask=105.5))
+
+
+def make_engine(max_age_ms=0):
+    return SpreadEngine({str(SPREAD): [NEAR, FAR]}, {str(SPREAD): 50}, max_age_ms=max_age_ms)
+
+
+def test_evaluate(arena):
+    write_quotes(arena)
+    result = make_engine().evaluate(arena)
+    # Positive LTP: buy the near leg at its ask, sell the far leg at its bid
+    assert result.buy_leg[0] == NEAR and result.sell_leg[0] == FAR
+    assert result.spread[0] == pytest.approx(4.5)
+    assert result.profit[0] == pytest.approx(225.0)
+    assert result.entry[0] and not result.stale[0]
+
+
+def test_spread_table_publish_and_read(arena, shm_name):
+    write_quotes(arena)
+    engine = make_engine()
+    table = SpreadTable.create(engine.spread_ids, name=shm_name("spreads"))
+    reader = SpreadTable.attach(table.name)
+    try:
+        assert reader.matches(engine)
+        before = reader.version
+        table.publish(engine.evaluate(arena))
+        assert reader.version != before
+
+        copy = SpreadResult(len(engine))
+        reader.read(copy)
+        assert copy.spread[0] == pytest.approx(4.5)
+        assert copy.entry[0] and copy.buy_leg[0] == NEAR
+    finally:
+        reader.close()
+        table.close()
+
+
+def test_staleness_changes_version_without_ticks(arena):
+    write_quotes(arena)
+    engine = make_engine(max_age_ms=50)
+
+    def version():
+        # As Dashboard.spread_source_version: tick-driven token + stale rows
+        return (arena.generation, *arena.sequence_version(engine.quotes), engine.stale_count(arena))
+
+    service = SpreadSnapshotService(lambda: engine.evaluate(arena).stale.tolist(), version=version)
+    assert service.refresh() == [False]
+    etag = service.snapshot().etag
+
+    time.sleep(0.08)            # The feed goes quiet: no tick, no publish
+    assert service.refresh() == [True]
+    assert service.snapshot().etag != etag
+    assert not engine.result.entry[0]
+
+    write_quotes(arena)         # Fresh ticks clear it again
+    assert service.refresh() == [False]
+
+
+def test_check_staleness_withdraws_entries(arena):
+    write_quotes(arena)
+    engine = make_engine(max_age_ms=50)
+    result = engine.evaluate(arena)
+    assert result.entry[0]
+    time.sleep(0.08)
+    engine.check_staleness(result, arena=arena)
+    assert result.stale[0] and not result.entry[0]
+    assert engine.stale_count(arena) == 1
+
+
+def test_snapshot_quotes_count_as_stale(arena):
+    write_quotes(arena)
+    arena.write(NEAR, tick(NEAR, 100.25, bid=100.0, ask=100.5), SNAPSHOT_RECEIVED_NS)
+    engine = make_engine(max_age_ms=1000)
+    result = engine.evaluate(arena)
+    # A get_quote price may be minutes old: no entry until the leg streams
+    assert result.stale[0] and not result.entry[0]
+
+    engine.apply_tick(NEAR, tick(NEAR, 100.25, bid=100.0, ask=100.5))
+    assert not result.stale[0] and result.entry[0]
+    engine.apply_tick(FAR, tick(FAR, 105.25, bid=105.0, ask=105.5), SNAPSHOT_RECEIVED_NS)
+    assert result.stale[0] and not result.entry[0]
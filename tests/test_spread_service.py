@@ -0,0 +1,102 @@
+import threading
+import time
+
+from SpreadService import DeltaChannel, SingleFlight, SpreadSnapshotService, make_etag
+
+
+def test_single_flight_shares_call_in_flight():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return len(calls)
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do(slow)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do(slow)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == [1, 1]
+    assert len(calls) == 1
+
+
+def test_single_flight_freshness_window():
+    flight = SingleFlight(fresh_for=60.0)
+    counter = iter(range(100))
+    assert flight.do(lambda: next(counter)) == 0
+    assert flight.do(lambda: next(counter)) == 0          # Shared: still fresh
+    assert flight.do(lambda: next(counter), force=True) == 1
+
+
+def test_single_flight_does_not_share_errors():
+    flight = SingleFlight(fresh_for=60.0)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    try:
+        flight.do(fail)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("error not raised")
+    assert flight.do(lambda: 7) == 7
+
+
+def test_etag_follows_source_token():
+    token = [(1, 5)]
+    builds = []
+    service = SpreadSnapshotService(lambda: builds.append(1) or {"a": len(builds)},
+                                    version=lambda: token[0])
+    service.refresh()
+    first = service.snapshot()
+    assert first.etag == make_etag((1, 5)) == "1-5"
+
+    service.refresh()
+    assert service.snapshot() is first and len(builds) == 1   # Unchanged source: no rebuild
+
+    token[0] = (1, 6)
+    service.refresh()
+    assert service.snapshot().etag == "1-6"
+    assert service.latest() == {"a": 2}
+
+
+def test_worker_ignores_freshness_window():
+    token = [0]
+    service = SpreadSnapshotService(lambda: {"v": token[0]}, version=lambda: (token[0],),
+                                    interval=0.01, fresh_for=60.0)
+    service.refresh()                    # Starts a freshness window the worker must not wait out
+    service.start()
+    try:
+        token[0] = 1
+        deadline = time.monotonic() + 2
+        while service.latest() != {"v": 1} and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.latest() == {"v": 1}
+    finally:
+        service.stop()
+
+
+def test_delta_channel():
+    channel = DeltaChannel()
+    assert channel.snapshot() == {"version": 0, "rows": {}}
+    delta = channel.update({"a": {"x": 1, "y": 2}})
+    assert delta == {"base": 0, "version": 1, "changed": {"a": {"x": 1, "y": 2}},
+                     "replaced": ["a"], "removed": []}
+    assert channel.update({"a": {"x": 1, "y": 2}}) is None
+    delta = channel.update({"a": {"x": 1, "y": 3}, "b": {"x": 0}})
+    assert delta["base"] == 1 and delta["changed"] == {"a": {"y": 3}, "b": {"x": 0}}
+    assert delta["replaced"] == ["b"]
+    delta = channel.update({"b": {"x": 0}})
+    assert delta["removed"] == ["a"] and delta["changed"] == {}
+    assert channel.snapshot()["version"] == 3
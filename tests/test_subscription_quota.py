@@ -0,0 +1,56 @@
+from SubscriptionQuota import QuotaManager
+from SubscriptionRegistry import SubscriptionRegistry as Registry
+
+
+def ids(instruments):
+    return sorted(inst['exchangeInstrumentID'] for inst in instruments)
+
+
+class Positions:
+    """EntryManager stand-in: the instruments of open positions."""
+
+    def __init__(self, csv_file, instrument_ids=()):
+        self.csv_file = csv_file
+        self.instrument_ids = set(instrument_ids)
+
+    def position_instrument_ids(self):
+        return self.instrument_ids
+
+
+def test_quota_evicts_least_recently_used(registry_path, tmp_path):
+    registry = Registry(registry_path)
+    registry.subscribe(["100", "101", "102"])
+    quota = QuotaManager(registry, 6, Positions(str(tmp_path / "positions.csv")))
+    quota.touch(["100"], now=3.0)
+    quota.touch(["101"], now=1.0)
+    quota.touch(["102"], now=2.0)
+
+    # 7 instruments (1-4, 100-102) against a quota of 6: evicting 101 frees only 101
+    # itself, since its legs are shared, so it is evicted first
+    assert ids(quota.enforce()) == [101]
+    assert registry.subscribed_spreads() == {"100", "102"}
+    assert quota.enforce() == []
+
+
+def test_quota_spares_open_positions(registry_path, tmp_path):
+    registry = Registry(registry_path)
+    registry.subscribe(["100", "102"])
+    csv_file = tmp_path / "positions.csv"
+    csv_file.write_text("open\n")
+    quota = QuotaManager(registry, 3, Positions(str(csv_file), instrument_ids={1}))
+    quota.touch(["100"], now=1.0)
+    quota.touch(["102"], now=2.0)
+
+    # 100 is older but backs an open position: 102 goes instead
+    assert ids(quota.enforce()) == [3, 4, 102]
+    assert registry.subscribed_spreads() == {"100"}
+
+
+def test_quota_prefers_quiet_spreads_among_equals(registry_path, tmp_path):
+    registry = Registry(registry_path)
+    registry.subscribe(["100", "102"])
+    quota = QuotaManager(registry, 3, Positions(str(tmp_path / "positions.csv")))
+    quota.touch(["100", "102"], now=1.0)
+    quota.on_tick(1, now=1.0, count=50)
+
+    assert ids(quota.enforce()) == [3, 4, 102]
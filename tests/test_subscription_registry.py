@@ -0,0 +1,81 @@
+import json
+import os
+
+import SubscriptionRegistry
+from SubscriptionRegistry import SubscriptionRegistry as Registry
+
+
+def ids(instruments):
+    return sorted(inst['exchangeInstrumentID'] for inst in instruments)
+
+
+def test_shared_legs_are_reference_counted(registry_path):
+    registry = Registry(registry_path)
+    assert ids(registry.subscribe(["100"])) == [1, 2, 100]
+    assert ids(registry.subscribe(["101", "100", "999"])) == [3, 101]   # Leg 2 is already subscribed
+    assert ids(registry.unsubscribe(["100"])) == [1, 100]               # Leg 2 still backs 101
+    assert ids(registry.instruments()) == [2, 3, 101]
+
+
+def test_other_process_catches_up_from_journal(registry_path):
+    writer = Registry(registry_path)
+    reader = Registry(registry_path)
+    writer.subscribe(["100"])
+    assert reader.subscribed_spreads() == {"100"}
+    writer.subscribe(["102"])
+    writer.unsubscribe(["100"])
+    assert reader.subscribed_spreads() == {"102"}
+    # The reader now changes state too; the writer picks that up
+    reader.subscribe(["103"])
+    assert writer.counts()[1] == {3: 1, 4: 2, 5: 1, 102: 1, 103: 1}
+
+
+def test_journal_compaction(registry_path, monkeypatch):
+    monkeypatch.setattr(SubscriptionRegistry, "JOURNAL_COMPACT_LINES", 4)
+    writer = Registry(registry_path)
+    reader = Registry(registry_path)
+    writer.subscribe(["100"])
+    assert reader.subscribed_spreads() == {"100"}
+
+    for key in ("101", "102", "103"):
+        writer.subscribe([key])
+    # The fourth change rewrote the snapshot and started an empty journal
+    with open(writer.journal_path) as f:
+        assert f.read() == '{"generation": 1}\n'
+    with open(registry_path) as f:
+        snapshot = json.load(f)
+    assert snapshot['generation'] == 1
+    assert ids(snapshot['instruments']) == [1, 2, 3, 4, 5, 100, 101, 102, 103]
+
+    writer.unsubscribe(["100"])
+    # The reader notices the journal was replaced and reloads consistently
+    assert reader.subscribed_spreads() == {"101", "102", "103"}
+    assert reader.counts()[1] == writer.counts()[1]
+    assert ids(Registry(registry_path).instruments()) == [2, 3, 4, 5, 101, 102, 103]
+
+
+def test_compaction_is_detected_when_the_inode_is_reused(registry_path, monkeypatch):
+    monkeypatch.setattr(SubscriptionRegistry, "JOURNAL_COMPACT_LINES", 3)
+    writer = Registry(registry_path)
+    reader = Registry(registry_path)
+    writer.subscribe(["100"])
+    writer.subscribe(["101"])
+    assert reader.subscribed_spreads() == {"100", "101"}
+    # The new journal gets the old one's inode and grows past the reader's offset
+    monkeypatch.setattr(os, "replace", lambda src, dst: (open(dst, 'wb').write(open(src, 'rb').read()),
+                                                         os.remove(src)))
+    writer.subscribe(["102"])
+    writer.unsubscribe(["101"])
+    writer.subscribe(["103"])
+    assert reader.subscribed_spreads() == {"100", "102", "103"}
+    assert reader.counts()[1] == writer.counts()[1]
+
+
+def test_legacy_snapshot_drops_orphans(registry_path):
+    with open(registry_path, 'w') as f:
+        json.dump([{"exchangeSegment": 2, "exchangeInstrumentID": exchange_id} for exchange_id in (100, 1, 2, 7)], f)
+    registry = Registry(registry_path)
+    # 7 backs no spread: it is not subscribed and counts against no quota
+    assert registry.counts() == ({"100"}, {100: 1, 1: 1, 2: 1})
+    assert ids(registry.unsubscribe(["100"])) == [1, 2, 100]
+    assert registry.instruments() == []
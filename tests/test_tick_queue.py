@@ -0,0 +1,55 @@
+import json
+import time
+
+from TickQueue import TickQueue, conflate
+
+
+def payload(exchange_id, ltp):
+    return json.dumps({"ExchangeInstrumentID": exchange_id, "Touchline": {"LastTradedPrice": ltp}})
+
+
+def test_conflate_keeps_latest_per_instrument():
+    latest, counts, invalid = conflate([
+        payload(1, 10.0), payload(2, 20.0), payload(1, 11.0), "not json",
+        json.dumps({"Touchline": {}}), {"ExchangeInstrumentID": "3", "Touchline": {"LastTradedPrice": 30.0}},
+    ])
+    assert list(latest) == [1, 2, 3]
+    assert latest[1]["Touchline"]["LastTradedPrice"] == 11.0
+    assert counts == {1: 2, 2: 1, 3: 1}
+    assert invalid == 2
+
+
+def test_flush_writes_one_batch():
+    batches = []
+    queue = TickQueue(lambda latest, counts: batches.append((latest, counts)))
+    for ltp in (1.0, 2.0, 3.0):
+        queue.push(payload(7, ltp))
+    queue.push(payload(8, 9.0))
+
+    assert queue.flush() == 2
+    assert len(batches) == 1
+    latest, counts = batches[0]
+    assert latest[7]["Touchline"]["LastTradedPrice"] == 3.0
+    assert counts == {7: 3, 8: 1}
+    assert queue.flush() == 0 and len(batches) == 1
+    assert queue.received == 4 and queue.written == 2
+
+
+def test_full_queue_drops_oldest():
+    batches = []
+    queue = TickQueue(lambda latest, counts: batches.append(latest), maxlen=3)
+    for exchange_id in range(5):
+        queue.push(payload(exchange_id, 1.0))
+    assert queue.dropped == 2
+    queue.flush()
+    assert list(batches[0]) == [2, 3, 4]
+
+
+def test_writer_thread_drains_queue():
+    written = []
+    queue = TickQueue(lambda latest, counts: written.extend(latest)).start()
+    queue.push(payload(1, 1.0))
+    deadline = time.monotonic() + 2
+    while not written and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert written == [1]
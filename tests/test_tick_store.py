@@ -0,0 +1,167 @@
+import time
+
+import numpy as np
+import pytest
+
+import TickStore
+from TickStore import (FREE_SLOT, RECORD_SIZE, QuoteBatch, TickArena, pack_tick, unpack_tick)
+
+
+def tick(exchange_id, ltp, ts=1000, bid=None, ask=None):
+    return {
+        "ExchangeSegment": 2,
+        "ExchangeInstrumentID": exchange_id,
+        "ExchangeTimeStamp": ts,
+        "Touchline": {"LastTradedPrice": ltp, "LastTradedQunatity": 3},
+        "Bids": [{"Price": ltp - 0.5 if bid is None else bid, "Size": 10, "TotalOrders": 1}],
+        "Asks": [{"Price": ltp + 0.5 if ask is None else ask, "Size": 20, "TotalOrders": 2}],
+    }
+
+
+@pytest.fixture
+def arena(shm_name):
+    arena = TickArena.create(name=shm_name("ticks"), capacity=4)
+    yield arena
+    arena.close()
+
+
+def test_pack_unpack_round_trip():
+    buf = bytearray(RECORD_SIZE)
+    pack_tick(buf, tick(42, 101.5, ts=7))
+    data = unpack_tick(buf)
+    assert data["ExchangeInstrumentID"] == 42
+    assert data["ExchangeTimeStamp"] == 7
+    assert data["Touchline"]["LastTradedPrice"] == 101.5
+    assert data["Bids"][0] == {"Price": 101.0, "Size": 10, "TotalOrders": 1}
+    assert data["Asks"][0]["Price"] == 102.0
+    assert len(data["Bids"]) == TickStore.DEPTH_LEVELS
+    # One write moves the seqlock from even to the next even value
+    assert data["Sequence"] == 2
+
+
+def test_unpack_empty_or_locked_record(monkeypatch):
+    buf = bytearray(RECORD_SIZE)
+    assert unpack_tick(buf) is None
+    pack_tick(buf, tick(1, 1.0))
+    TickStore.SEQ_STRUCT.pack_into(buf, 0, 3)     # Writer died mid-write
+    monkeypatch.setattr(TickStore, "READ_RETRIES", 4)
+    assert unpack_tick(buf) is None
+
+
+def test_reader_sees_writes(arena):
+    arena.add(10)
+    arena.write(10, tick(10, 5.0))
+    reader = TickArena.attach(arena.name)
+    try:
+        assert reader.read(10)["Touchline"]["LastTradedPrice"] == 5.0
+        assert reader.read(11) is None
+        batch = reader.read_many([10, 11])
+        assert batch.valid.tolist() == [True, False]
+        assert batch.ltp[0] == 5.0 and batch.bid[0] == 4.5 and batch.ask[0] == 5.5
+    finally:
+        reader.close()
+
+
+def test_removed_slot_is_cleared_and_reused(arena, monkeypatch):
+    for exchange_id in (1, 2, 3):
+        arena.add(exchange_id)
+        arena.write(exchange_id, tick(exchange_id, float(exchange_id)))
+    reader = TickArena.attach(arena.name)
+    batch = QuoteBatch([2, 3])
+    try:
+        reader.read_many(None, out=batch)
+        assert batch.valid.tolist() == [True, True]
+
+        arena.remove(2)
+        assert arena.slot(2) is None
+        assert reader.read(2) is None
+        reader.read_many(None, out=batch)
+        assert batch.valid.tolist() == [False, True]
+
+        # Recently freed slots are left alone while the arena has room...
+        assert arena.add(4) == 3
+        # ...and reused once they have been free long enough
+        monkeypatch.setattr(TickStore, "SLOT_REUSE_SECONDS", 0.0)
+        assert arena.add(5) == 1
+        assert reader.read(5) is None       # Not written yet: nothing left of instrument 2
+        arena.write(5, tick(5, 50.0))
+        assert reader.read(5)["Touchline"]["LastTradedPrice"] == 50.0
+        assert reader.slot(2) is None
+        assert sorted(reader.ids()) == [1, 3, 4, 5]
+    finally:
+        reader.close()
+
+
+def test_full_arena_reuses_free_slots_then_reports(arena):
+    for exchange_id in range(4):
+        arena.add(exchange_id)
+    arena.remove(0)
+    # Full: the freed slot is taken at once rather than failing
+    assert arena.add(99) == 0
+    with pytest.raises(MemoryError, match="is full"):
+        arena.add(100)
+
+
+def test_reopened_arena_keeps_free_list(arena):
+    arena.add(1)
+    arena.add(2)
+    arena.remove(1)
+    reopened = TickArena.create(name=arena.name, capacity=4)
+    try:
+        assert reopened.slot(2) == 1
+        assert list(reopened._free) == [(0.0, 0)]
+        assert np.frombuffer(reopened.buf, dtype='<i8', count=1, offset=TickStore.INDEX_OFFSET)[0] == FREE_SLOT
+    finally:
+        reopened.close()
+
+
+def test_columns_mirror_records(arena):
+    arena.add(7)
+    arena.write(7, tick(7, 12.0, ts=99, bid=11.0, ask=13.0))
+    slot = arena.slot(7)
+    record = arena.records[slot]
+    columns = arena._columns
+    assert columns['seq'][slot] == record['seq'] == 2
+    assert columns['ltp'][slot] == 12.0 and columns['exchange_ts'][slot] == 99
+    assert columns['bid'][slot] == record['bid_price'][0] == 11.0
+    assert columns['ask'][slot] == record['ask_price'][0] == 13.0
+    assert columns['receive_ns'][slot] == record['receive_ns'] > 0
+
+    arena.remove(7)
+    assert columns['seq'][slot] == record['seq'] == 0
+    assert columns['ltp'][slot] == 0.0
+
+
+
+def test_sequence_version_never_repeats_after_a_clear(arena):
+    batch = QuoteBatch([1, 2])
+    arena.write(1, tick(1, 10.0))
+    arena.write(2, tick(2, 20.0))
+    seen = {arena.sequence_version(batch)}
+    arena.write(2, tick(2, 21.0))
+    seen.add(arena.sequence_version(batch))
+    arena.remove(2)
+    # Leg 1 ticks back to the sum the batch had before: the clear still tells them apart
+    arena.write(1, tick(1, 11.0))
+    assert arena.sequence_version(batch) not in seen
+
+    arena._bump_clears()            # As if the writer died mid-clear
+    reopened = TickArena.create(name=arena.name, capacity=4)
+    try:
+        assert reopened._clears() % 2 == 0
+    finally:
+        reopened.close()
+
+def test_feed_reads_down_once_writer_stops_beating(arena):
+    assert arena.feed_state()[0] == TickStore.FEED_DOWN
+    arena.set_feed_state(TickStore.FEED_LIVE)
+    reader = TickArena.attach(arena.name)
+    try:
+        assert reader.feed_state()[0] == TickStore.FEED_LIVE
+        # The writer was killed: no beat and nobody marked the feed down
+        later = time.monotonic_ns() + int(TickStore.HEARTBEAT_TIMEOUT_SECONDS * 2e9)
+        assert reader.feed_state(now=later)[0] == TickStore.FEED_DOWN
+        arena.heartbeat()
+        assert reader.feed_state()[0] == TickStore.FEED_LIVE
+    finally:
+        reader.close()
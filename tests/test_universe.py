@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+import Universe
+
+NAMES = {"1": "NIFTY25FEBFUT", "2": "NIFTY25MARFUT", "100": "NIFTY25FEB25MARFUT"}
+LOT_SIZES = {"1": 75, "2": 75, "100": 75, "7": None}
+MAPPING = {"100": [1, 2]}
+INSTRUMENTS = [{"exchangeSegment": 2, "exchangeInstrumentID": 100},
+               {"exchangeSegment": 2, "exchangeInstrumentID": 1}]
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    files = {}
+    for attr, data in (("CONTRACT_NAMES_FILE", NAMES), ("LOT_SIZE_FILE", LOT_SIZES),
+                       ("FUTURES_MAPPING_FILE", MAPPING), ("EXCHANGE_INSTRUMENTS_FILE", INSTRUMENTS)):
+        path = tmp_path / f"{attr.lower()}.json"
+        path.write_text(json.dumps(data))
+        monkeypatch.setattr(Universe, attr, str(path))
+        files[attr] = str(path)
+    monkeypatch.setattr(Universe, "SOURCE_FILES", tuple(files.values()))
+    return files
+
+
+def test_bundle_matches_json(sources, tmp_path):
+    bundle = Universe.open_bundle(Universe.build(str(tmp_path / "universe.bin")))
+    assert dict(bundle.names) == NAMES
+    assert dict(bundle.lot_sizes) == {"1": 75, "2": 75, "100": 75, "7": 0}
+    assert dict(bundle.futures_mapping) == MAPPING
+    assert bundle.exchange_instruments() == INSTRUMENTS
+    # Looked up like the JSON dicts: string keys, missing ones raise
+    assert bundle.names["100"] == "NIFTY25FEB25MARFUT"
+    assert "7" not in bundle.names and bundle.names.get("x") is None
+
+
+def test_stale_or_foreign_bundle_is_ignored(sources, tmp_path):
+    path = Universe.build(str(tmp_path / "universe.bin"))
+    with open(sources["LOT_SIZE_FILE"], "a") as f:
+        f.write(" ")
+    assert Universe.open_bundle(path) is None
+
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"nope" * 16)
+    assert Universe.open_bundle(str(other)) is None
+    assert Universe.open_bundle(str(tmp_path / "missing.bin")) is None
+
+
+def test_build_is_atomic(sources, tmp_path):
+    path = str(tmp_path / "universe.bin")
+    Universe.build(path)
+    first = Universe.Universe(path)       # Still mapped while the bundle is rebuilt
+    Universe.build(path)
+    assert dict(first.futures_mapping) == MAPPING
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []